@@ -1,5 +1,16 @@
-from datetime import datetime
+import hashlib
+import json
+from datetime import datetime, timedelta
+from collections import Counter
+from types import SimpleNamespace
 from flask import session
+from config import Config
+from sqlite_storage import to_iso
+
+ALERT_LABELS = {'health': 'Health', 'safety': 'Safety', 'custom': 'Custom'}
+ALERT_RECORD_TYPES = {'health': 'health_outbreak', 'safety': 'safety_alert', 'custom': 'custom_alert'}
+# Request fields passed on to an alert
+ALERT_FIELDS = ('condition', 'conditions', 'cases', 'crime_type', 'message')
 
 class AlertService:
     def __init__(self, db_manager, sms_service, auth_service):
@@ -7,95 +18,220 @@ class AlertService:
         self.sms = sms_service
         self.auth = auth_service
     
-    def broadcast_health_alert(self, area, condition, cases=None):
+    def broadcast_health_alert(self, area, condition, cases=None, job_id=None):
         """Broadcast health alert to users in specific area"""
-        try:
-            # Get verified users in the area
-            users = self.db.get_users_by_area(area, verified_only=True)
-            
-            if not users:
-                return False, f"No verified users found in {area}", 0
-            
-            # Generate message
-            message = self.sms.get_health_alert_message(area, condition, cases)
-            
-            # Send SMS to all users
-            sent_count, failed_count = self.sms.send_bulk_sms(users, message)
-            
-            # Log the alert
-            alert_data = self._create_alert_record(
-                alert_type="health_outbreak",
-                area=area,
-                message=message,
-                recipients_count=sent_count,
-                condition=condition,
-                cases=cases
-            )
-            
-            self.db.save_alert(alert_data)
-            
-            return True, f"Health alert sent to {sent_count} users", sent_count
-            
-        except Exception as e:
-            return False, f"Error broadcasting health alert: {str(e)}", 0
+        return self.broadcast_to_areas('health', [area], job_id=job_id, condition=condition, cases=cases)
     
-    def broadcast_safety_alert(self, area, crime_type):
+    def broadcast_safety_alert(self, area, crime_type, job_id=None):
         """Broadcast safety alert to users in specific area"""
+        return self.broadcast_to_areas('safety', [area], job_id=job_id, crime_type=crime_type)
+    
+    def broadcast_custom_alert(self, area, message, job_id=None):
+        """Broadcast custom message to users in specific area"""
+        return self.broadcast_to_areas('custom', [area], job_id=job_id, message=message)
+    
+    def broadcast_to_areas(self, alert_type, areas, job_id=None, **fields):
+        """Broadcast one alert to several areas through a single SMS job
+        
+        alert_type is 'health' (condition or conditions, cases), 'safety'
+        (crime_type) or 'custom' (message). Recipients of every area are
+        fetched in one query and de-duplicated by phone. Returns once the SMS
+        job is queued (recipients_count = recipients queued); one alert record
+        per area is written when the job completes.
+        """
+        label = ALERT_LABELS[alert_type]
         try:
-            # Get verified users in the area
-            users = self.db.get_users_by_area(area, verified_only=True)
+            # Get verified users in the areas, one SMS per phone
+            users = self.db.get_users_by_areas(areas, verified_only=True)
+            area_of = self._areas_by_phone(users, areas)
             
-            if not users:
-                return False, f"No verified users found in {area}", 0
+            if not area_of:
+                return False, f"No verified users found in {', '.join(areas)}", 0
             
             # Generate message
-            message = self.sms.get_safety_alert_message(area, crime_type)
+            place = ', '.join(areas)
+            weight, bypass_cap = 1, False
+            if alert_type == 'health':
+                conditions = fields.get('conditions') or [fields.get('condition')]
+                if len(conditions) == 1:
+                    text = self.sms.get_health_alert_message(place, conditions[0], fields.get('cases'))
+                else:
+                    text = self.sms.get_combined_health_alert_message(place, conditions, fields.get('cases'))
+            elif alert_type == 'safety':
+                text = self.sms.get_safety_alert_message(place, fields.get('crime_type'))
+                # Immediate danger: double share of the broadcast lane, not frequency-capped
+                weight, bypass_cap = 2, True
+            else:
+                text = fields.get('message')
+            encoded = self.sms.compile_message(text)
+            variants = self.sms.message_variants(text)
             
-            # Send SMS to all users
-            sent_count, failed_count = self.sms.send_bulk_sms(users, message)
-            
-            # Log the alert
-            alert_data = self._create_alert_record(
-                alert_type="safety_alert",
-                area=area,
-                message=message,
-                recipients_count=sent_count,
-                crime_type=crime_type
+            # Queue the SMS job; the alert records are written once it completes
+            job_id = job_id or self.auth.generate_id()
+            current_user = self.auth.get_current_user()
+            job = self.sms.send_bulk_sms(
+                list(area_of), encoded.text, weight=weight, job_id=job_id, bypass_cap=bypass_cap,
+                on_complete=lambda job: self._record_broadcast(
+                    job, alert_type, areas, area_of, encoded, variants, fields, current_user
+                ),
+                context={'kind': 'broadcast', 'alert_type': alert_type, 'areas': areas, 'fields': fields,
+                         'variants': variants, 'current_user': current_user}
             )
             
-            self.db.save_alert(alert_data)
-            
-            return True, f"Safety alert sent to {sent_count} users", sent_count
+            spread = f" across {len(areas)} areas" if len(areas) > 1 else ""
+            return True, f"{label} alert queued for {job.total} users{spread} ({encoded.segments} SMS segment(s) each){self._capped_note(job.capped)}; track delivery at /broadcast/jobs/{job_id}", job.total
             
         except Exception as e:
-            return False, f"Error broadcasting safety alert: {str(e)}", 0
+            return False, f"Error broadcasting {label.lower()} alert: {str(e)}", 0
     
-    def broadcast_custom_alert(self, area, message):
-        """Broadcast custom message to users in specific area"""
+    @staticmethod
+    def _areas_by_phone(users, areas):
+        """Area of each recipient phone; a phone listed in several areas goes to the first"""
+        area_of = {}
+        for user in sorted(users, key=lambda u: areas.index(u.get('area'))):
+            area_of.setdefault(user.get('phone'), user.get('area'))
+        return area_of
+    
+    def _record_broadcast(self, job, alert_type, areas, area_of, encoded, variants, fields, current_user):
+        """Completion callback of a broadcast job: write one alert record per area"""
         try:
-            # Get verified users in the area
-            users = self.db.get_users_by_area(area, verified_only=True)
+            recipients_by_area = Counter(area_of.values())
+            capped_by_area = Counter(area_of.get(phone) for phone in job.capped)
+            failed_by_area = Counter()
+            if job.failed:
+                failed_by_area.update(area_of.get(d.get('phone')) for d in self.db.get_dead_letters(job.id))
+            conditions = fields.get('conditions') or [fields.get('condition')]
             
-            if not users:
-                return False, f"No verified users found in {area}", 0
-            
-            # Send SMS to all users
-            sent_count, failed_count = self.sms.send_bulk_sms(users, message)
-            
-            # Log the alert
-            alert_data = self._create_alert_record(
-                alert_type="custom_alert",
-                area=area,
-                message=message,
-                recipients_count=sent_count
-            )
-            
-            self.db.save_alert(alert_data)
-            
-            return True, f"Custom alert sent to {sent_count} users", sent_count
+            alerts = []
+            for area in areas:
+                if not recipients_by_area[area]:
+                    continue
+                alert_data = self._create_alert_record(
+                    alert_type=ALERT_RECORD_TYPES[alert_type],
+                    area=area,
+                    message=encoded.text,
+                    recipients_count=recipients_by_area[area] - failed_by_area[area] - capped_by_area[area],
+                    current_user=current_user,
+                    encoded=encoded,
+                    variants=variants,
+                    sms_job_id=job.id,
+                    failed_count=failed_by_area[area],
+                    capped_count=capped_by_area[area],
+                    **{k: v for k, v in fields.items() if k in ('cases', 'crime_type')}
+                )
+                if alert_type == 'health':
+                    if len(conditions) == 1:
+                        alert_data['condition'] = conditions[0]
+                    else:
+                        alert_data['conditions'] = conditions
+                if len(areas) > 1:
+                    alert_data['target_areas'] = areas
+                alerts.append(alert_data)
             
+            self.db.save_alerts(alerts)
         except Exception as e:
-            return False, f"Error broadcasting custom alert: {str(e)}", 0
+            print(f"⚠️ Could not record alerts of SMS job {job.id}: {e}")
+    
+    def broadcast_once(self, alert_type, areas, idempotency_key=None, **fields):
+        """Run a /broadcast submission at most once per idempotency key
+        
+        The key is the client's Idempotency-Key, or else derived from the
+        areas, alert type, content and a BROADCAST_DEDUPE_WINDOW_SECONDS time
+        bucket, so a double-click or a retried request is recognised. Returns
+        (status, result) where status is 'sent', 'duplicate' or 'in_progress'
+        and result is the original submission's outcome.
+        """
+        now = datetime.utcnow()
+        if idempotency_key:
+            key, earlier_keys = f"client:{idempotency_key}", []
+        else:
+            key, *earlier_keys = self._derived_broadcast_keys(alert_type, areas, fields, now)
+        
+        # Same content submitted just before the bucket boundary
+        for earlier_key in earlier_keys:
+            existing = self.db.find_broadcast_key(earlier_key)
+            if existing and not self._stale_claim(existing):
+                return self._duplicate_broadcast(existing)
+        
+        job_id = self.auth.generate_id()
+        record = {
+            "alert_type": alert_type,
+            "areas": areas,
+            "job_id": job_id,
+            "status": "in_progress",
+            "created_at": now
+        }
+        expires_at = now + timedelta(hours=Config.BROADCAST_IDEMPOTENCY_TTL_HOURS)
+        existing = self.db.claim_broadcast_key(key, record, expires_at=expires_at)
+        if existing and self._stale_claim(existing):
+            # The worker holding the claim died before queueing its job: take the key over.
+            # Releasing by job_id means only one of several concurrent requests wins it.
+            print(f"⚠️ Taking over stale broadcast claim (job {existing.get('job_id')})")
+            self.db.release_broadcast_key(key, job_id=existing.get('job_id'))
+            existing = self.db.claim_broadcast_key(key, record, expires_at=expires_at)
+        if existing:
+            return self._duplicate_broadcast(existing)
+        
+        try:
+            success, message, sent_count = self.broadcast_to_areas(alert_type, areas, job_id=job_id, **fields)
+        except Exception:
+            self.db.release_broadcast_key(key, job_id=job_id)
+            raise
+        
+        result = {"success": success, "message": message, "recipients_count": sent_count, "job_id": job_id}
+        if success or sent_count:
+            self.db.complete_broadcast_key(key, dict(result, status="completed"))
+        else:
+            # Nothing went out: let the staff member try again
+            self.db.release_broadcast_key(key)
+        return 'sent', result
+    
+    def _derived_broadcast_keys(self, alert_type, areas, fields, now):
+        """Content keys for the current and the previous time bucket"""
+        content = json.dumps({
+            "alert_type": alert_type,
+            "areas": sorted(areas),
+            "conditions": sorted(fields.get('conditions') or [fields.get('condition')]),
+            "cases": fields.get('cases'),
+            "crime_type": fields.get('crime_type'),
+            "message": (fields.get('message') or '').strip()
+        }, sort_keys=True)
+        digest = hashlib.sha256(content.encode('utf-8')).hexdigest()
+        bucket = int(now.timestamp()) // Config.BROADCAST_DEDUPE_WINDOW_SECONDS
+        return [f"auto:{digest}:{bucket}", f"auto:{digest}:{bucket - 1}"]
+    
+    def _stale_claim(self, existing):
+        """Whether an in-progress claim was abandoned by a worker that died
+        
+        The claim is old and no SMS job was ever persisted for it. Once the
+        job exists the broadcast went out, so the key is never taken over.
+        """
+        if existing.get('status') == 'completed':
+            return False
+        claimed_at = to_iso(existing.get('created_at'))
+        try:
+            age = datetime.utcnow() - datetime.fromisoformat(claimed_at)
+        except (TypeError, ValueError):
+            age = None
+        if age is not None and age.total_seconds() < Config.BROADCAST_CLAIM_STALE_SECONDS:
+            return False
+        return self.db.find_sms_job(existing.get('job_id')) is None
+    
+    def _duplicate_broadcast(self, existing):
+        """Result of the submission that already holds the key"""
+        if existing.get('status') != 'completed':
+            return 'in_progress', {
+                "success": True,
+                "message": f"An identical broadcast is already being sent (job {existing.get('job_id')})",
+                "recipients_count": 0,
+                "job_id": existing.get('job_id')
+            }
+        return 'duplicate', {
+            "success": existing.get('success', True),
+            "message": existing.get('message'),
+            "recipients_count": existing.get('recipients_count', 0),
+            "job_id": existing.get('job_id')
+        }
     
     def send_ml_triggered_alert(self, area, condition, predicted_cases, probability):
         """Send alert triggered by ML prediction"""
@@ -108,29 +244,80 @@ class AlertService:
             
             # Generate message with ML context
             base_message = self.sms.get_health_alert_message(area, condition, predicted_cases)
-            ml_message = f"🤖 PREDIKSYON: {base_message} (Probability: {probability:.1%})"
+            text = f"🤖 PREDIKSYON: {base_message} (Probability: {probability:.1%})"
+            encoded = self.sms.compile_message(text)
+            
+            # Queue the SMS job; the alert is logged once it completes
+            current_user = self.auth.get_current_user()
+            job = self.sms.send_bulk_sms(
+                users, encoded.text, job_id=self.auth.generate_id(),
+                on_complete=lambda job: self._record_ml_alert(
+                    job, area, condition, predicted_cases, probability, encoded, text, current_user
+                ),
+                context={'kind': 'ml', 'area': area, 'condition': condition, 'predicted_cases': predicted_cases,
+                         'probability': probability, 'text': text, 'current_user': current_user}
+            )
             
-            # Send SMS to all users
-            sent_count, failed_count = self.sms.send_bulk_sms(users, ml_message)
+            return True, f"ML-triggered alert queued for {job.total} users{self._capped_note(job.capped)}; track delivery at /broadcast/jobs/{job.id}", job.total
             
-            # Log the alert with ML flag
-            alert_data = self._create_alert_record(
+        except Exception as e:
+            return False, f"Error sending ML alert: {str(e)}", 0
+    
+    def _record_ml_alert(self, job, area, condition, predicted_cases, probability, encoded, text, current_user):
+        """Completion callback of an ML-triggered job: log the alert with the ML flag"""
+        try:
+            self.db.save_alert(self._create_alert_record(
                 alert_type="health_outbreak",
                 area=area,
-                message=ml_message,
-                recipients_count=sent_count,
+                message=encoded.text,
+                recipients_count=job.sent,
+                current_user=current_user,
+                encoded=encoded,
+                variants=self.sms.message_variants(text),
+                sms_job_id=job.id,
+                failed_count=job.failed,
+                capped_count=len(job.capped),
                 condition=condition,
                 cases=predicted_cases,
                 is_ml_triggered=True,
                 ml_probability=probability
-            )
-            
-            self.db.save_alert(alert_data)
-            
-            return True, f"ML-triggered alert sent to {sent_count} users", sent_count
-            
+            ))
         except Exception as e:
-            return False, f"Error sending ML alert: {str(e)}", 0
+            print(f"⚠️ Could not record ML alert of SMS job {job.id}: {e}")
+    
+    def recover_interrupted_broadcasts(self):
+        """Write the alert records of SMS jobs a stopped process left unfinished
+        
+        Their completion callbacks were lost with that process. Recipients the
+        job never reached are dead-lettered and count as failed. Returns the
+        number of jobs closed out.
+        """
+        interrupted = self.sms.recover()
+        for record in interrupted:
+            context = record.get('context')
+            if not context:
+                continue
+            job = SimpleNamespace(
+                id=record['id'],
+                sent=record.get('sent', 0),
+                failed=record.get('failed', 0) + len(record['unsent']),
+                capped=record.get('capped_phones') or []
+            )
+            encoded = self.sms.compile_message(record['message'])
+            if context['kind'] == 'ml':
+                self._record_ml_alert(job, context['area'], context['condition'], context['predicted_cases'],
+                                      context['probability'], encoded, context['text'], context['current_user'])
+                continue
+            areas = context['areas']
+            phones = set(record.get('recipients') or []) | set(job.capped)
+            area_of = {
+                phone: area
+                for phone, area in self._areas_by_phone(self.db.get_users_by_areas(areas, verified_only=False), areas).items()
+                if phone in phones
+            }
+            self._record_broadcast(job, context['alert_type'], areas, area_of, encoded, context['variants'],
+                                   context['fields'], context['current_user'])
+        return len(interrupted)
     
     def get_alert_history(self, area, limit=50, alert_type=None):
         """Get alert history for an area"""
@@ -156,9 +343,15 @@ class AlertService:
         except Exception as e:
             return False, f"Error getting alert stats: {str(e)}"
     
-    def _create_alert_record(self, alert_type, area, message, recipients_count, **kwargs):
-        """Create alert record for database"""
-        current_user = self.auth.get_current_user()
+    def _capped_note(self, capped):
+        """Recipients skipped because they already got enough alerts this window"""
+        if not capped:
+            return ""
+        return f"; {len(capped)} skipped (already received {Config.SMS_FREQUENCY_CAP} alerts in the last {Config.SMS_FREQUENCY_WINDOW_SECONDS // 60} min)"
+    
+    def _create_alert_record(self, alert_type, area, message, recipients_count, current_user=None, **kwargs):
+        """Create alert record for database (current_user: the staff session captured at submission)"""
+        current_user = current_user if current_user is not None else self.auth.get_current_user()
         
         alert_data = {
             "id": self.auth.generate_id(),
@@ -166,12 +359,31 @@ class AlertService:
             "area": area,
             "message": message,
             "recipients_count": recipients_count,
-            "timestamp": datetime.utcnow().isoformat() if not self.db.use_mongodb else datetime.utcnow(),
+            "timestamp": datetime.utcnow(),
             "triggered_by": current_user.get('username', 'system'),
             "staff_user_id": current_user.get('user_id'),
             "is_ml_triggered": kwargs.get('is_ml_triggered', False)
         }
         
+        # SMS encoding and billed segments
+        encoded = kwargs.get('encoded')
+        if encoded is not None:
+            alert_data['encoding'] = encoded.encoding
+            alert_data['segments_per_message'] = encoded.segments
+            alert_data['total_segments'] = encoded.segments * recipients_count
+        if 'variants' in kwargs:
+            # What each encoding would bill per recipient, to show what transliteration saves
+            alert_data['variants'] = {
+                name: {'encoding': variant['encoding'], 'segments': variant['segments']}
+                for name, variant in kwargs['variants'].items()
+            }
+        
+        # Bulk SMS job, for delivery failures and re-drive
+        if 'sms_job_id' in kwargs:
+            alert_data['sms_job_id'] = kwargs['sms_job_id']
+            alert_data['failed_count'] = kwargs.get('failed_count', 0)
+            alert_data['capped_count'] = kwargs.get('capped_count', 0)
+        
         # Add optional fields
         if 'condition' in kwargs:
             alert_data['condition'] = kwargs['condition']
@@ -188,24 +400,29 @@ class AlertService:
         """Validate alert data before sending"""
         errors = []
         
-        # Validate area
-        from config import Config
-        if area not in Config.HAITI_AREAS:
-            errors.append(f"Invalid area: {area}")
+        # Validate areas (one area or a list)
+        for target in (area if isinstance(area, list) else [area]):
+            if target not in Config.HAITI_AREAS:
+                errors.append(f"Invalid area: {target}")
         
         # Validate alert type specific data
-        if alert_type == "health_outbreak":
-            condition = kwargs.get('condition')
-            if not condition or condition not in Config.HEALTH_CONDITIONS:
-                errors.append(f"Invalid health condition: {condition}")
+        if alert_type == "health":
+            conditions = kwargs.get('conditions') or [kwargs.get('condition')]
+            if not isinstance(conditions, list):
+                errors.append("conditions must be a list")
+                conditions = []
+            for condition in conditions:
+                if not isinstance(condition, str) or condition not in Config.HEALTH_CONDITIONS:
+                    errors.append(f"Invalid health condition: {condition}")
         
-        elif alert_type == "safety_alert":
+        elif alert_type == "safety":
             crime_type = kwargs.get('crime_type')
-            if not crime_type or crime_type not in Config.CRIME_TYPES:
+            if not isinstance(crime_type, str) or crime_type not in Config.CRIME_TYPES:
                 errors.append(f"Invalid crime type: {crime_type}")
         
-        elif alert_type == "custom_alert":
-            message = kwargs.get('message', '').strip()
+        elif alert_type == "custom":
+            message = kwargs.get('message') or ''
+            message = message.strip() if isinstance(message, str) else ''
             if not message:
                 errors.append("Custom message cannot be empty")
             elif len(message) > 160:
@@ -1,5 +1,6 @@
-from flask import Flask, request, jsonify, render_template_string, redirect, url_for
+from flask import Flask, Response, request, jsonify, render_template_string, redirect, url_for, g, send_from_directory
 import os
+import time
 from datetime import datetime
 
 # Import our modular components
@@ -7,8 +8,12 @@ from config import Config
 from database import DatabaseManager
 from sms_service import SMSService
 from auth import AuthService
-from alert_service import AlertService
+from alert_service import AlertService, ALERT_FIELDS
 from ml_service import MLService
+import metrics
+from profiling import RequestProfiler
+from rate_limit import RateLimiter, build_counter_store
+from retention import RetentionEngine
 
 # Initialize Flask app
 app = Flask(__name__)
@@ -19,15 +24,45 @@ app.config['SECRET_KEY'] = Config.SECRET_KEY
 def after_request(response):
     response.headers.add('Access-Control-Allow-Origin', '*')
     response.headers.add('Access-Control-Allow-Headers', 'Content-Type,Authorization')
+    response.headers.add('Access-Control-Expose-Headers', 'Retry-After')
     response.headers.add('Access-Control-Allow-Methods', 'GET,PUT,POST,DELETE,OPTIONS')
     return response
 
+# Request latency metrics and opt-in profiling
+request_profiler = RequestProfiler()
+
+@app.before_request
+def start_request_timer():
+    g.request_start = time.perf_counter()
+    request_profiler.start()
+
+@app.teardown_request
+def finish_request_profile(exc):
+    request_profiler.finish(exc)
+
+@app.after_request
+def record_request_metrics(response):
+    start = g.pop('request_start', None)
+    if start is not None:
+        metrics.HTTP_REQUEST_DURATION.observe(
+            time.perf_counter() - start,
+            method=request.method,
+            endpoint=request.url_rule.rule if request.url_rule else 'unmatched',
+            status=response.status_code
+        )
+    return response
+
 # Initialize services
 db_manager = DatabaseManager()
-sms_service = SMSService()
+sms_service = SMSService(db_manager)
 auth_service = AuthService(db_manager)
 alert_service = AlertService(db_manager, sms_service, auth_service)
+alert_service.recover_interrupted_broadcasts()
 ml_service = MLService(db_manager, alert_service)
+rate_limiter = RateLimiter(build_counter_store(db_manager))
+retention_engine = RetentionEngine(db_manager)
+if Config.RETENTION_ENABLED:
+    retention_engine.start()
 
 # Ensure required directories exist
 def ensure_directories():
@@ -45,7 +80,7 @@ def home():
     return jsonify({
         'app': 'Alatem Health Alert System',
         'version': '6.0 - Modular Architecture',
-        'database': 'MongoDB Atlas' if db_manager.use_mongodb else 'JSON Files (Development)',
+        'database': db_manager.storage_label,
         'status': {
             'database': 'connected',
             'mongodb': db_manager.use_mongodb,
@@ -61,6 +96,7 @@ def home():
             'alerts_history': '/alerts/history?area=AREA_NAME',
             'predictions': '/predictions/latest',
             'system_health': '/system/health',
+            'metrics': '/metrics',
             'staff_login': '/login'
         }
     })
@@ -86,6 +122,7 @@ def test_connection():
 # ======================
 
 @app.route('/register', methods=['POST'])
+@rate_limiter.limit('register')
 def register_user():
     """Register new user with OTP verification"""
     try:
@@ -142,13 +179,13 @@ def register_user():
         otp = auth_service.generate_otp()
         auth_service.store_otp(formatted_phone, otp)
         
-        # Send OTP via SMS
+        # Send OTP via SMS in the background; the outcome lands on the user as sms_status.otp
         otp_message = sms_service.generate_otp_message(otp)
-        sms_sent = sms_service.send_sms(formatted_phone, otp_message)
+        sms_queued = sms_service.send_sms_async(formatted_phone, otp_message, record_as='otp')
         
         response_data = {
             'success': True,
-            'message': 'OTP sent successfully' if sms_sent else 'User registered, OTP generated'
+            'message': 'OTP sent successfully' if sms_queued else 'User registered, OTP generated'
         }
         
         # Include debug OTP only in development mode
@@ -161,6 +198,7 @@ def register_user():
         return jsonify({'success': False, 'error': str(e)}), 500
 
 @app.route('/verify', methods=['POST'])
+@rate_limiter.limit('verify')
 def verify_otp():
     """Verify OTP and activate user"""
     try:
@@ -205,7 +243,7 @@ def verify_otp():
                 user['name'], 
                 user['area']
             )
-            sms_service.send_sms(formatted_phone, welcome_message)
+            sms_service.send_sms_async(formatted_phone, welcome_message, record_as='welcome')
         
         return jsonify({
             'verified': True,
@@ -258,7 +296,7 @@ def login():
 <body>
     <div class="login-container">
         <div class="status">
-            ☁️ <strong>Database:</strong> {{ "MongoDB Atlas (Production Ready)" if use_mongodb else "JSON Files (Development)" }}
+            ☁️ <strong>Database:</strong> {{ storage_label }}
         </div>
         <div class="ml-status">
             🤖 <strong>ML Models:</strong> {{ "✅ Loaded & Active" if ml_active else "⚠️ Not Available" }}
@@ -292,7 +330,7 @@ def login():
 </html>
         ''', 
         error=request.args.get('error'), 
-        use_mongodb=db_manager.use_mongodb,
+        storage_label=db_manager.storage_label,
         ml_active=ml_service.is_available()
         )
     
@@ -336,50 +374,122 @@ def broadcast_alert():
     try:
         data = request.json
         alert_type = data.get('alert_type')
-        area = data.get('area')
+        if alert_type not in ('health', 'safety', 'custom'):
+            return jsonify({
+                'success': False,
+                'error': 'Invalid alert type'
+            }), 400
         
-        # Validate alert data
-        valid, errors = alert_service.validate_alert_data(alert_type, area, **data)
-        if not valid:
+        # One area, or several sent as a single job ("areas": [...])
+        areas = data.get('areas') or [data.get('area')]
+        if not isinstance(areas, list) or not all(isinstance(area, str) for area in areas):
             return jsonify({
                 'success': False,
-                'error': '; '.join(errors)
+                'error': 'areas must be a list of area names'
             }), 400
+        areas = list(dict.fromkeys(areas))
         
-        # Broadcast based on alert type
-        if alert_type == 'health':
-            success, message, sent_count = alert_service.broadcast_health_alert(
-                area, data.get('condition'), data.get('cases')
-            )
-        elif alert_type == 'safety':
-            success, message, sent_count = alert_service.broadcast_safety_alert(
-                area, data.get('crime_type')
-            )
-        elif alert_type == 'custom':
-            success, message, sent_count = alert_service.broadcast_custom_alert(
-                area, data.get('message')
-            )
-        else:
+        # Validate alert data
+        fields = {k: v for k, v in data.items() if k in ALERT_FIELDS}
+        valid, errors = alert_service.validate_alert_data(alert_type, areas, **fields)
+        if not valid:
             return jsonify({
                 'success': False,
-                'error': 'Invalid alert type'
+                'error': '; '.join(errors)
             }), 400
         
-        if success:
+        # A double-click or a retried request returns the original result instead of re-sending
+        idempotency_key = request.headers.get('Idempotency-Key') or data.get('idempotency_key')
+        status, result = alert_service.broadcast_once(alert_type, areas, idempotency_key, **fields)
+        
+        if status == 'in_progress':
+            return jsonify(dict(result, in_progress=True)), 202
+        
+        if result['success']:
+            # Accepted: the job is sent at provider pace, follow it at job_url
             return jsonify({
                 'success': True,
-                'message': message,
-                'recipients_count': sent_count
-            })
+                'message': result['message'],
+                'recipients_count': result['recipients_count'],
+                'job_id': result['job_id'],
+                'job_url': url_for('get_broadcast_job', job_id=result['job_id']),
+                'duplicate': status == 'duplicate'
+            }), 200 if status == 'duplicate' else 202
         else:
             return jsonify({
                 'success': False,
-                'error': message
+                'error': result['message'],
+                'job_id': result['job_id'],
+                'duplicate': status == 'duplicate'
             }), 500
             
     except Exception as e:
         return jsonify({'success': False, 'error': str(e)}), 500
 
+@app.route('/broadcast/jobs/<job_id>')
+@auth_service.login_required
+def get_broadcast_job(job_id):
+    """Delivery status of a bulk SMS job"""
+    try:
+        job = db_manager.find_sms_job(job_id)
+        if not job:
+            return jsonify({'success': False, 'error': 'Job not found'}), 404
+        return jsonify({'success': True, 'job': job})
+    except Exception as e:
+        return jsonify({'success': False, 'error': str(e)}), 500
+
+@app.route('/broadcast/jobs/<job_id>/failures')
+@auth_service.login_required
+def get_broadcast_failures(job_id):
+    """Recipients that exhausted their retries for a bulk SMS job"""
+    try:
+        job = db_manager.find_sms_job(job_id)
+        if not job:
+            return jsonify({'success': False, 'error': 'Job not found'}), 404
+        
+        failures = db_manager.get_dead_letters(job_id, status=request.args.get('status'))
+        return jsonify({
+            'success': True,
+            'job': job,
+            'failures': failures,
+            'count': len(failures)
+        })
+    except Exception as e:
+        return jsonify({'success': False, 'error': str(e)}), 500
+
+@app.route('/broadcast/jobs/<job_id>/redrive', methods=['POST'])
+@auth_service.login_required
+def redrive_broadcast_failures(job_id):
+    """Re-send every dead-lettered recipient of a job as a new job"""
+    try:
+        if not db_manager.find_sms_job(job_id):
+            return jsonify({'success': False, 'error': 'Job not found'}), 404
+        
+        job = sms_service.redrive_failures(job_id)
+        if job is None:
+            return jsonify({'success': False, 'error': 'No failed recipients to re-drive'}), 400
+        
+        return jsonify({
+            'success': True,
+            'message': f"Re-driving {job.total} failed recipients",
+            'job_id': job.id,
+            'parent_job_id': job_id
+        }), 202
+    except Exception as e:
+        return jsonify({'success': False, 'error': str(e)}), 500
+
+@app.route('/sms/status', methods=['POST'])
+def sms_status_callback():
+    """Delivery status callback from the SMS provider (Twilio format)"""
+    params = request.form.to_dict()
+    # Twilio signs the exact URL it was given, which behind a proxy is not request.url
+    url = Config.SMS_STATUS_CALLBACK_URL or request.url
+    ok, error = sms_service.record_status_callback(url, params, request.headers.get('X-Twilio-Signature'))
+    if not ok:
+        status = 403 if error == "Invalid signature" else 400
+        return jsonify({'success': False, 'error': error}), status
+    return '', 204
+
 @app.route('/alerts/history')
 def get_alerts_history():
     """Get alert history for a specific area"""
@@ -510,13 +620,15 @@ def system_health():
         health_status = {
             'database': {
                 'status': 'connected',
-                'type': 'MongoDB Atlas' if db_manager.use_mongodb else 'JSON Files',
+                'type': db_manager.storage_label,
                 'last_check': datetime.utcnow().isoformat()
             },
             'ml_models': ml_service.get_system_health(),
             'sms_service': {
                 'status': 'connected' if sms_service.is_available() else 'disabled',
-                'provider': 'Twilio' if Config.USE_REAL_SMS else 'Mock SMS'
+                'provider': 'Twilio' if Config.USE_REAL_SMS else 'Mock SMS',
+                'providers': sms_service.get_provider_status(),
+                'queues': sms_service.dispatcher.get_stats()
             },
             'users': {
                 'total': stats['users']['total'],
@@ -524,6 +636,7 @@ def system_health():
                 'active': stats['users']['active']
             },
             'recent_activity': stats.get('recent_activity', {}),
+            'retention': retention_engine.get_stats(),
             'features': {
                 'real_users_only': True,
                 'demo_data_disabled': True,
@@ -540,12 +653,43 @@ def system_health():
     except Exception as e:
         return jsonify({'success': False, 'error': str(e)}), 500
 
+@app.route('/system/profiles')
+@auth_service.login_required
+def list_profiles():
+    """Index of captured request profiles"""
+    try:
+        profiles = request_profiler.list_profiles()
+        return jsonify({
+            'success': True,
+            'profiles': profiles,
+            'count': len(profiles),
+            'settings': {
+                'sample_rate': request_profiler.sample_rate,
+                'slow_ms': request_profiler.slow_ms,
+                'endpoints': sorted(request_profiler.endpoints),
+                'header': 'X-Alatem-Profile'
+            }
+        })
+    except Exception as e:
+        return jsonify({'success': False, 'error': str(e)}), 500
+
+@app.route('/system/profiles/<path:filename>')
+@auth_service.login_required
+def download_profile(filename):
+    """Download a captured profile file"""
+    return send_from_directory(os.path.abspath(request_profiler.output_dir), filename, as_attachment=True)
+
+@app.route('/metrics')
+def prometheus_metrics():
+    """Prometheus metrics (request latency, DB/SMS/ML timings, cache ratios)"""
+    return Response(metrics.registry.render(), mimetype='text/plain; version=0.0.4')
+
 @app.route('/stats')
 def get_stats():
     """Get system statistics"""
     try:
         stats = db_manager.get_stats()
-        stats['database'] = 'MongoDB Atlas' if db_manager.use_mongodb else 'JSON Files'
+        stats['database'] = db_manager.storage_label
         stats['ml_active'] = ml_service.is_available()
         stats['sms_active'] = sms_service.is_available()
         return jsonify(stats)
@@ -904,7 +1048,7 @@ def health_worker_interface():
                 const result = await response.json();
                 
                 if (result.success) {
-                    showMessage(`✅ Health alert sent successfully! ${result.message}`);
+                    showMessage(`✅ Health alert queued! ${result.message}`);
                 } else {
                     showMessage('❌ Error: ' + result.error, 'error');
                 }
@@ -935,7 +1079,7 @@ def health_worker_interface():
                 const result = await response.json();
                 
                 if (result.success) {
-                    showMessage(`✅ Safety alert sent successfully! ${result.message}`);
+                    showMessage(`✅ Safety alert queued! ${result.message}`);
                 } else {
                     showMessage('❌ Error: ' + result.error, 'error');
                 }
@@ -973,7 +1117,7 @@ def health_worker_interface():
                 const result = await response.json();
                 
                 if (result.success) {
-                    showMessage(`✅ Custom alert sent successfully! ${result.message}`);
+                    showMessage(`✅ Custom alert queued! ${result.message}`);
                     document.getElementById('custom-message').value = '';
                 } else {
                     showMessage('❌ Error: ' + result.error, 'error');
@@ -1003,7 +1147,7 @@ def health_worker_interface():
 def initialize_app():
     """Initialize application on startup"""
     print(f"🚀 Starting Alatem Health Alert System v6.0...")
-    print(f"📊 Database: {'MongoDB Atlas' if db_manager.use_mongodb else 'JSON Files'}")
+    print(f"📊 Database: {db_manager.storage_label}")
     
     # Validate configuration
     config_errors = Config.validate_config()
@@ -1032,7 +1176,7 @@ def initialize_app():
     print("🏥 System Health: http://localhost:5000/system/health")
     print("📱 SMS History API: http://localhost:5000/alerts/history?area=DELMAS")
     print("="*70)
-    print(f"💾 Database: {'MongoDB Atlas (Production)' if db_manager.use_mongodb else 'JSON Files (Development)'}")
+    print(f"💾 Database: {db_manager.storage_label}")
     print(f"📱 SMS Service: {'Twilio (Live)' if Config.USE_REAL_SMS else 'Mock SMS (Development)'}")
     print(f"🤖 ML Models: {'✅ Active' if ml_service.is_available() else '⚠️ Not Available'}")
     print("🚫 Demo Data: DISABLED - Real users only")
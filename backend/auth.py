@@ -1,14 +1,26 @@
+import atexit
 import hashlib
+import threading
+import time
 import uuid
 import random
-from datetime import datetime, timedelta
+from datetime import datetime
 from functools import wraps
 from flask import session, jsonify
+from config import Config
+from metrics import record_cache_lookup
+from otp_store import build_otp_store
 
 class AuthService:
     def __init__(self, db_manager):
         self.db = db_manager
-        self.otp_store = {}  # In production, use Redis or database
+        self.otp_store = build_otp_store(db_manager)  # shared by all worker processes
+        # Staff identity cache: username -> (user, cached_at), refreshed after STAFF_CACHE_TTL_SECONDS
+        self._staff_cache = {}
+        self._staff_lock = threading.Lock()
+        # last_login updates waiting to be written: user id -> login time
+        self._pending_logins = {}
+        self._login_writer = None
     
     def generate_id(self):
         """Generate unique ID"""
@@ -28,11 +40,7 @@ class AuthService:
     
     def store_otp(self, phone, otp, expires_minutes=5):
         """Store OTP with expiration"""
-        self.otp_store[phone] = {
-            'otp': otp,
-            'expires': datetime.now() + timedelta(minutes=expires_minutes),
-            'attempts': 0
-        }
+        self.otp_store.put(phone, otp, expires_minutes * 60)
     
     def verify_otp(self, phone, otp):
         """Verify OTP"""
@@ -41,20 +49,20 @@ class AuthService:
         if not stored_otp:
             return False, "No OTP found for this phone number"
         
-        if datetime.now() > stored_otp['expires']:
-            del self.otp_store[phone]
+        if stored_otp['expired']:
+            self.otp_store.delete(phone)
             return False, "OTP has expired"
         
         if stored_otp['attempts'] >= 3:
-            del self.otp_store[phone]
+            self.otp_store.delete(phone)
             return False, "Too many failed attempts"
         
         if str(stored_otp['otp']) != str(otp):
-            stored_otp['attempts'] += 1
+            self.otp_store.add_attempt(phone)
             return False, "Invalid OTP"
         
         # OTP verified successfully
-        del self.otp_store[phone]
+        self.otp_store.delete(phone)
         return True, "OTP verified successfully"
     
     def create_user(self, name, phone, area, latitude=None, longitude=None):
@@ -87,9 +95,30 @@ class AuthService:
             print(f"Error verifying user: {e}")
             return False
     
+    def find_staff_user(self, username):
+        """Active staff user by username, from the identity cache when fresh
+        
+        Changes made directly in the database (a deactivated account, a new
+        password) reach each process within STAFF_CACHE_TTL_SECONDS.
+        """
+        with self._staff_lock:
+            cached = self._staff_cache.get(username)
+        if cached and time.monotonic() - cached[1] < Config.STAFF_CACHE_TTL_SECONDS:
+            record_cache_lookup('staff_users', True)
+            return cached[0]
+        
+        record_cache_lookup('staff_users', False)
+        user = self.db.find_staff_user(username)
+        with self._staff_lock:
+            if user:
+                self._staff_cache[username] = (user, time.monotonic())
+            else:
+                self._staff_cache.pop(username, None)
+        return user
+    
     def create_staff_user(self, username, password, full_name, role="health_worker", organization="Alatem"):
         """Create staff user"""
-        if self.db.find_staff_user(username):
+        if self.find_staff_user(username):
             return False, "Username already exists"
         
         staff_data = {
@@ -106,13 +135,16 @@ class AuthService:
         
         try:
             self.db.save_staff_user(staff_data)
+            # Write-through: the next login finds the new user without a reload
+            with self._staff_lock:
+                self._staff_cache[username] = (staff_data, time.monotonic())
             return True, staff_data
         except Exception as e:
             return False, str(e)
     
     def authenticate_staff(self, username, password):
         """Authenticate staff user"""
-        user = self.db.find_staff_user(username)
+        user = self.find_staff_user(username)
         
         if not user:
             return False, None, "User not found"
@@ -124,17 +156,47 @@ class AuthService:
     
     def create_session(self, user):
         """Create user session"""
-        if self.db.use_mongodb:
-            session['staff_user_id'] = str(user['_id'])
-            self.db.update_staff_login(user['_id'], datetime.utcnow())
-        else:
-            session['staff_user_id'] = user['id']
-            self.db.update_staff_login(user['id'], datetime.utcnow())
+        session['staff_user_id'] = user['id']
+        self._record_login(user, user['id'])
         
         session['staff_username'] = user['username']
         session['staff_role'] = user['role']
         session['staff_full_name'] = user['full_name']
     
+    def _record_login(self, user, user_id):
+        """Queue a last_login update; written in batches by a background thread"""
+        login_time = datetime.utcnow()
+        user['last_login'] = login_time
+        with self._staff_lock:
+            self._pending_logins[user_id] = login_time
+            if self._login_writer is None:
+                self._login_writer = threading.Thread(target=self._write_logins_loop, name='staff-login-writer', daemon=True)
+                self._login_writer.start()
+                atexit.register(self.flush_logins)
+    
+    def _write_logins_loop(self):
+        while True:
+            time.sleep(Config.STAFF_LOGIN_FLUSH_INTERVAL)
+            try:
+                self.flush_logins()
+            except Exception as e:
+                print(f"⚠️ Could not write staff last_login updates: {e}")
+    
+    def flush_logins(self):
+        """Write queued last_login updates in one batch"""
+        with self._staff_lock:
+            pending, self._pending_logins = self._pending_logins, {}
+        if not pending:
+            return 0
+        try:
+            self.db.update_staff_logins(pending)
+        except Exception:
+            with self._staff_lock:
+                for user_id, login_time in pending.items():
+                    self._pending_logins.setdefault(user_id, login_time)
+            raise
+        return len(pending)
+    
     def clear_session(self):
         """Clear user session"""
         session.clear()
@@ -163,7 +225,7 @@ class AuthService:
     
     def create_default_admin(self):
         """Create default admin user if none exists"""
-        admin = self.db.find_staff_user('admin')
+        admin = self.find_staff_user('admin')
         if not admin:
             success, result = self.create_staff_user(
                 username='admin',
@@ -195,15 +257,8 @@ class AuthService:
         return False, "Invalid phone number format"
     
     def cleanup_expired_otps(self):
-        """Clean up expired OTPs (call periodically)"""
-        current_time = datetime.now()
-        expired_phones = [
-            phone for phone, data in self.otp_store.items() 
-            if current_time > data['expires']
-        ]
-        
-        for phone in expired_phones:
-            del self.otp_store[phone]
-        
-        if expired_phones:
-            print(f"🧹 Cleaned up {len(expired_phones)} expired OTPs")
\ No newline at end of file
+        """Clean up expired OTPs (the stores also expire them on their own)"""
+        purged = self.otp_store.purge_expired()
+        if purged:
+            print(f"🧹 Cleaned up {purged} expired OTPs")
+        return purged
@@ -0,0 +1,245 @@
+#!/usr/bin/env python3
+"""
+DatabaseManager benchmark suite
+
+Measures the hot DatabaseManager operations against the JSON and SQLite
+backends, an in-memory mongomock backend and (optionally) a local MongoDB, at several
+dataset sizes. Results are written as JSON and can be compared against a
+saved baseline; the script exits non-zero when an operation regresses
+beyond the allowed threshold.
+
+Usage:
+    python benchmark_database.py --backends json sqlite mongomock --sizes 1000 100000
+    python benchmark_database.py --sizes 1000 --save-baseline bench_baseline.json
+    python benchmark_database.py --sizes 1000 --baseline bench_baseline.json --threshold 0.25
+"""
+
+import argparse
+import json
+import os
+import platform
+import random
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+import uuid
+from datetime import datetime
+
+import database
+import data_generator
+import mongo_backend
+from config import Config
+
+DEFAULT_SIZES = [1000, 100000, 1000000]
+DEFAULT_BACKENDS = ['json', 'sqlite', 'mongomock']
+PREDICTIONS_PER_DAY = 48  # 8 areas x (5 conditions + crime risk)
+
+def _timestamp(db_manager):
+    """Timestamp in the format the active backend stores"""
+    return datetime.utcnow() if db_manager.use_mongodb else datetime.utcnow().isoformat()
+
+def _new_user(db_manager):
+    return {
+        'id': str(uuid.uuid4()),
+        'name': 'Benchmark User',
+        'phone': f"+509{random.randint(10000000, 29999999)}",
+        'area': random.choice(Config.HAITI_AREAS),
+        'latitude': None,
+        'longitude': None,
+        'verified': True,
+        'active': True,
+        'created_at': datetime.utcnow().isoformat(),
+        'verified_at': None
+    }
+
+def _new_alert(db_manager):
+    return {
+        'id': str(uuid.uuid4()),
+        'alert_type': 'custom_alert',
+        'area': random.choice(Config.HAITI_AREAS),
+        'message': 'Benchmark alert',
+        'recipients_count': 0,
+        'timestamp': _timestamp(db_manager),
+        'triggered_by': 'benchmark',
+        'staff_user_id': None,
+        'is_ml_triggered': False
+    }
+
+def _new_prediction(db_manager):
+    return {
+        'id': str(uuid.uuid4()),
+        'area': random.choice(Config.HAITI_AREAS),
+        'date': datetime.utcnow().strftime('%Y-%m-%d'),
+        'type': 'health_outbreak',
+        'condition': random.choice(Config.HEALTH_CONDITIONS),
+        'predictions': [],
+        'timestamp': _timestamp(db_manager)
+    }
+
+def build_operations(db_manager, size):
+    """Map operation name -> zero-argument callable"""
+    return {
+        'save_user': lambda: db_manager.save_user(_new_user(db_manager)),
+        'find_user_by_phone': lambda: db_manager.find_user_by_phone(
+            data_generator.population_phone(random.randrange(size))
+        ),
+        'get_users_by_area': lambda: db_manager.get_users_by_area(random.choice(Config.HAITI_AREAS)),
+        'save_alert': lambda: db_manager.save_alert(_new_alert(db_manager)),
+        'get_alerts_history': lambda: db_manager.get_alerts_history(random.choice(Config.HAITI_AREAS), limit=50),
+        'get_recent_alerts': lambda: db_manager.get_recent_alerts(hours=24),
+        'save_prediction': lambda: db_manager.save_prediction(_new_prediction(db_manager)),
+        'get_stats': lambda: db_manager.get_stats()
+    }
+
+def setup_backend(backend, size, workdir, mongodb_uri=None):
+    """Populate a fresh store of the given size and return a DatabaseManager on it"""
+    prediction_days = max(1, size // PREDICTIONS_PER_DAY)
+    Config.DB_CACHE_TTL_SECONDS = 0  # time the backend, not the read cache
+
+    if backend in ('json', 'sqlite'):
+        # SQLite imports the generated JSON files on first start
+        Config.MONGODB_URI = None
+        Config.DATABASE_BACKEND = backend
+        Config.SQLITE_PATH = None
+        Config.DATA_DIR = os.path.join(workdir, f'{backend}_{size}')
+        data_generator.generate_population(
+            users=size, alerts=size, prediction_days=prediction_days,
+            target='json', data_dir=Config.DATA_DIR, seed=size
+        )
+        return database.DatabaseManager()
+
+    Config.DATABASE_BACKEND = 'mongodb'
+    if backend == 'mongomock':
+        import mongomock
+        mongo_backend.MongoClient = mongomock.MongoClient
+        database.MONGODB_AVAILABLE = True
+        Config.MONGODB_URI = 'mongodb://benchmark'
+    else:
+        Config.MONGODB_URI = mongodb_uri
+
+    Config.MONGODB_DB = f'alatem_benchmark_{size}'
+    db_manager = database.DatabaseManager()
+    if not db_manager.use_mongodb:
+        raise RuntimeError(f"{backend} backend could not be initialized")
+
+    random.seed(size)
+    data_generator.write_population_mongo(
+        db_manager.db,
+        data_generator.generate_users(size, as_datetime=True),
+        data_generator.generate_alert_history(size, as_datetime=True),
+        data_generator.generate_prediction_history(prediction_days, as_datetime=True),
+        reset=True
+    )
+    return db_manager
+
+def run_operation(func, runs, warmup=1):
+    """Time func over several runs and return summary statistics in ms"""
+    for _ in range(warmup):
+        func()
+
+    samples = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        func()
+        samples.append((time.perf_counter() - start) * 1000)
+
+    return {
+        'runs': runs,
+        'min_ms': round(min(samples), 3),
+        'median_ms': round(statistics.median(samples), 3),
+        'mean_ms': round(statistics.mean(samples), 3),
+        'max_ms': round(max(samples), 3)
+    }
+
+def run_suite(backends, sizes, runs, operations=None, mongodb_uri=None):
+    """Run every operation for each backend/size and return result rows"""
+    results = []
+    workdir = tempfile.mkdtemp(prefix='alatem_bench_')
+
+    try:
+        for backend in backends:
+            for size in sizes:
+                print(f"\n⏱️  {backend} @ {size:,} records")
+                db_manager = setup_backend(backend, size, workdir, mongodb_uri)
+                ops = build_operations(db_manager, size)
+
+                for name, func in ops.items():
+                    if operations and name not in operations:
+                        continue
+                    # Whole-file JSON operations get slow at large sizes; keep wall time sane
+                    op_runs = max(1, runs // 5) if backend == 'json' and size >= 1000000 else runs
+                    stats = run_operation(func, op_runs)
+                    results.append({'backend': backend, 'size': size, 'operation': name, **stats})
+                    print(f"   {name:<20} median {stats['median_ms']:>10.3f} ms  (min {stats['min_ms']:.3f}, runs {op_runs})")
+
+                if db_manager.use_mongodb:
+                    db_manager.client.drop_database(Config.MONGODB_DB)
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    return results
+
+def compare_to_baseline(results, baseline_results, threshold):
+    """Return result rows whose median regressed beyond threshold"""
+    baseline = {
+        (row['backend'], row['size'], row['operation']): row
+        for row in baseline_results
+    }
+    regressions = []
+    for row in results:
+        previous = baseline.get((row['backend'], row['size'], row['operation']))
+        if not previous or previous['median_ms'] <= 0:
+            continue
+        ratio = row['median_ms'] / previous['median_ms']
+        if ratio > 1 + threshold:
+            regressions.append({**row, 'baseline_median_ms': previous['median_ms'], 'ratio': round(ratio, 3)})
+    return regressions
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark DatabaseManager operations")
+    parser.add_argument('--backends', nargs='+', choices=['json', 'sqlite', 'mongomock', 'mongo'], default=DEFAULT_BACKENDS)
+    parser.add_argument('--sizes', nargs='+', type=int, default=DEFAULT_SIZES)
+    parser.add_argument('--runs', type=int, default=10, help="Timed runs per operation")
+    parser.add_argument('--operations', nargs='+', help="Only run these operations")
+    parser.add_argument('--mongodb-uri', default='mongodb://localhost:27017', help="URI for the 'mongo' backend")
+    parser.add_argument('--output', default='bench_results.json', help="Where to write results")
+    parser.add_argument('--baseline', help="Baseline results file to compare against")
+    parser.add_argument('--threshold', type=float, default=0.25, help="Allowed median slowdown (0.25 = 25%%)")
+    parser.add_argument('--save-baseline', help="Also write these results as a new baseline file")
+    args = parser.parse_args()
+
+    results = run_suite(args.backends, args.sizes, args.runs, args.operations, args.mongodb_uri)
+    report = {
+        'generated_at': datetime.utcnow().isoformat(),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'results': results
+    }
+
+    with open(args.output, 'w', encoding='utf-8') as f:
+        json.dump(report, f, indent=2)
+    print(f"\n📄 Results written to {args.output}")
+
+    if args.save_baseline:
+        with open(args.save_baseline, 'w', encoding='utf-8') as f:
+            json.dump(report, f, indent=2)
+        print(f"📄 Baseline written to {args.save_baseline}")
+
+    if args.baseline:
+        with open(args.baseline, 'r', encoding='utf-8') as f:
+            baseline_results = json.load(f).get('results', [])
+        regressions = compare_to_baseline(results, baseline_results, args.threshold)
+        if regressions:
+            print(f"\n❌ {len(regressions)} regression(s) beyond {args.threshold:.0%}:")
+            for row in regressions:
+                print(f"   {row['backend']} @ {row['size']:,} {row['operation']}: "
+                      f"{row['baseline_median_ms']:.3f} -> {row['median_ms']:.3f} ms (x{row['ratio']})")
+            return 1
+        print(f"\n✅ No regressions beyond {args.threshold:.0%}")
+
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
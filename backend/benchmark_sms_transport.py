@@ -0,0 +1,180 @@
+#!/usr/bin/env python3
+"""
+SMS transport benchmark
+
+Sends messages from concurrent threads through an SMS provider pointed at
+a local mock endpoint (HTTPS with a throwaway self-signed certificate when
+openssl is available) and compares three transports:
+
+- no-pool: a new connection for every message (TCP + TLS handshake each time)
+- default: one requests Session with the default pool (10 connections per host)
+- pooled:  the shared sms_transport Session, pool sized to the thread count
+
+The mock counts the connections it accepted, i.e. the handshakes paid.
+
+Usage:
+    python benchmark_sms_transport.py --messages 2000 --concurrency 16
+    python benchmark_sms_transport.py --provider twilio --latency-ms 50 --output transport_results.json
+"""
+
+import argparse
+import json
+import os
+import platform
+import shutil
+import subprocess
+import tempfile
+import threading
+import time
+from datetime import datetime
+
+import requests
+
+import sms_transport
+from load_test import percentile
+from mock_sms_provider import MockSMSProvider
+from sms_providers import HTTPProvider, TwilioProvider
+
+MODES = ['no-pool', 'default', 'pooled']
+
+class NoPoolSession(requests.Session):
+    """A Session that never reuses a connection"""
+
+    def send(self, request, **kwargs):
+        request.headers['Connection'] = 'close'
+        with requests.Session() as session:
+            return session.send(request, **kwargs)
+
+def make_certificate(directory):
+    """Self-signed certificate for 127.0.0.1, or (None, None) without openssl"""
+    if not shutil.which('openssl'):
+        return None, None
+    certfile = os.path.join(directory, 'mock.crt')
+    keyfile = os.path.join(directory, 'mock.key')
+    result = subprocess.run(
+        ['openssl', 'req', '-x509', '-newkey', 'rsa:2048', '-nodes', '-days', '1',
+         '-subj', '/CN=127.0.0.1', '-addext', 'subjectAltName=IP:127.0.0.1',
+         '-keyout', keyfile, '-out', certfile],
+        capture_output=True
+    )
+    if result.returncode != 0:
+        return None, None
+    return certfile, keyfile
+
+def make_session(mode, concurrency, certfile):
+    if mode == 'no-pool':
+        session = NoPoolSession()
+    elif mode == 'default':
+        session = requests.Session()
+    else:
+        session = sms_transport.build_session(pool_maxsize=concurrency)
+    session.verify = certfile or True
+    # Talk to the local mock directly: no proxy or CA bundle from the environment
+    session.trust_env = False
+    return session
+
+def make_provider(kind, base_url, session):
+    if kind == 'twilio':
+        return TwilioProvider('bench', 'AC' + '0' * 32, 'bench', '+15005550006', base_url=base_url, rate=0, session=session)
+    return HTTPProvider('bench', base_url, rate=0, session=session)
+
+def run_mode(mode, args, mock, certfile):
+    session = make_session(mode, args.concurrency, certfile)
+    provider = make_provider(args.provider, mock.base_url, session)
+    connections_before = mock.get_stats()['connections']
+
+    latencies = []
+    errors = [0]
+    lock = threading.Lock()
+    remaining = [args.messages]
+
+    def worker():
+        while True:
+            with lock:
+                if remaining[0] <= 0:
+                    return
+                remaining[0] -= 1
+                index = remaining[0]
+            start = time.perf_counter()
+            try:
+                provider.send(f"+5093{index:07d}", "Benchmark message")
+                ok = True
+            except Exception:
+                ok = False
+            elapsed = (time.perf_counter() - start) * 1000
+            with lock:
+                latencies.append(elapsed)
+                if not ok:
+                    errors[0] += 1
+
+    started = time.perf_counter()
+    threads = [threading.Thread(target=worker) for _ in range(args.concurrency)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    duration = time.perf_counter() - started
+    session.close()
+
+    latencies.sort()
+    return {
+        'mode': mode,
+        'messages': len(latencies),
+        'errors': errors[0],
+        'duration_s': round(duration, 3),
+        'throughput_mps': round(len(latencies) / duration, 1) if duration else 0,
+        'p50_ms': round(percentile(latencies, 50), 2),
+        'p95_ms': round(percentile(latencies, 95), 2),
+        'p99_ms': round(percentile(latencies, 99), 2),
+        'connections_opened': mock.get_stats()['connections'] - connections_before
+    }
+
+def print_report(rows, tls):
+    print("\n" + "=" * 84)
+    print(f"📊 SMS TRANSPORT BENCHMARK ({'HTTPS' if tls else 'HTTP'})")
+    print("=" * 84)
+    print(f"{'mode':<10}{'messages':>10}{'errors':>8}{'msg/s':>10}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'handshakes':>12}")
+    for row in rows:
+        print(f"{row['mode']:<10}{row['messages']:>10}{row['errors']:>8}{row['throughput_mps']:>10}"
+              f"{row['p50_ms']:>10}{row['p95_ms']:>10}{row['p99_ms']:>10}{row['connections_opened']:>12}")
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark pooled vs unpooled SMS provider transports")
+    parser.add_argument('--provider', choices=['http', 'twilio'], default='http', help="Provider implementation to drive")
+    parser.add_argument('--messages', type=int, default=1000, help="Messages per mode")
+    parser.add_argument('--concurrency', type=int, default=16, help="Sender threads")
+    parser.add_argument('--latency-ms', type=float, default=0, help="Mock provider latency")
+    parser.add_argument('--modes', nargs='+', choices=MODES, default=MODES)
+    parser.add_argument('--no-tls', action='store_true', help="Use plain HTTP even if openssl is available")
+    parser.add_argument('--output', help="Write JSON results here")
+    args = parser.parse_args()
+
+    cert_dir = tempfile.mkdtemp(prefix='alatem_tls_')
+    certfile, keyfile = (None, None) if args.no_tls else make_certificate(cert_dir)
+    if not args.no_tls and not certfile:
+        print("⚠️ openssl not available, benchmarking over plain HTTP")
+
+    mock = MockSMSProvider(port=0, latency_ms=args.latency_ms, certfile=certfile, keyfile=keyfile).start()
+    try:
+        rows = [run_mode(mode, args, mock, certfile) for mode in args.modes]
+    finally:
+        mock.stop()
+        shutil.rmtree(cert_dir, ignore_errors=True)
+
+    print_report(rows, bool(certfile))
+
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump({
+                'generated_at': datetime.utcnow().isoformat(),
+                'python': platform.python_version(),
+                'provider': args.provider,
+                'tls': bool(certfile),
+                'concurrency': args.concurrency,
+                'latency_ms': args.latency_ms,
+                'results': rows
+            }, f, indent=2)
+        print(f"📄 Results written to {args.output}")
+
+if __name__ == "__main__":
+    main()
@@ -10,12 +10,31 @@ class Config:
     
     # Database Configuration
     MONGODB_URI = os.getenv('MONGODB_URI')
-    DATA_DIR = 'data'
+    MONGODB_DB = os.getenv('MONGODB_DB', 'alatem')
+    DATA_DIR = os.getenv('DATA_DIR', 'data')
+    # 'auto': MongoDB when MONGODB_URI is set, otherwise SQLite; or 'mongodb', 'sqlite', 'json' (legacy files)
+    DATABASE_BACKEND = os.getenv('DATABASE_BACKEND', 'auto').lower()
+    SQLITE_PATH = os.getenv('SQLITE_PATH')  # default: DATA_DIR/alatem.sqlite3
+    # JSON backend: sent_alerts/health_reports/crime_reports are split into 'day' or 'month' segment files;
+    # older segments are gzipped, and archived out of the queried set when ARCHIVE_AFTER_DAYS > 0
+    SEGMENT_GRANULARITY = os.getenv('SEGMENT_GRANULARITY', 'day')
+    SEGMENT_COMPRESS_AFTER_DAYS = int(os.getenv('SEGMENT_COMPRESS_AFTER_DAYS', '30'))
+    SEGMENT_ARCHIVE_AFTER_DAYS = int(os.getenv('SEGMENT_ARCHIVE_AFTER_DAYS', '0'))
+    # Retention of predictions and sent_alerts (see retention.py); RETENTION_POLICIES is JSON, e.g.
+    # {"predictions": {"raw_days": 30, "rollup": true, "archive": true}}
+    RETENTION_ENABLED = os.getenv('RETENTION_ENABLED', 'True').lower() == 'true'
+    RETENTION_POLICIES = os.getenv('RETENTION_POLICIES')
+    RETENTION_INTERVAL_HOURS = float(os.getenv('RETENTION_INTERVAL_HOURS', '6'))
+    RETENTION_START_DELAY_SECONDS = int(os.getenv('RETENTION_START_DELAY_SECONDS', '300'))
+    RETENTION_ARCHIVE_DIR = os.getenv('RETENTION_ARCHIVE_DIR')  # default: DATA_DIR/archive
+    # Aggregate reads (get_stats, get_area_stats) are cached per process this long; 0 disables
+    DB_CACHE_TTL_SECONDS = float(os.getenv('DB_CACHE_TTL_SECONDS', '5'))
     
     # Twilio Configuration
     TWILIO_SID = os.getenv('TWILIO_SID')
     TWILIO_TOKEN = os.getenv('TWILIO_TOKEN')
     TWILIO_PHONE = os.getenv('TWILIO_PHONE')
+    TWILIO_API_BASE_URL = os.getenv('TWILIO_API_BASE_URL')  # e.g. a local mock provider
     
     # ML Configuration
     ML_MODELS_DIR = 'ml_models'
@@ -28,8 +47,84 @@ class Config:
     
     # Feature Flags
     USE_REAL_SMS = os.getenv('USE_REAL_SMS', 'False').lower() == 'true'
+    SMS_ENCODING = os.getenv('SMS_ENCODING', 'gsm7')  # 'gsm7' transliterates to 160-char segments, 'unicode' sends as-is
     CREATE_DEMO_DATA = os.getenv('CREATE_DEMO_DATA', 'False').lower() == 'true'
     
+    # SMS Dispatch
+    SMS_DISPATCH_WORKERS = int(os.getenv('SMS_DISPATCH_WORKERS', 4))
+    SMS_RESERVED_WORKERS = int(os.getenv('SMS_RESERVED_WORKERS', 1))  # serve only OTP/transactional messages
+    # Broadcast pacing for the whole deployment, split evenly between the WEB_CONCURRENCY worker
+    # processes (gunicorn's own setting); unset = the providers' combined rate, 0 = unpaced
+    WEB_CONCURRENCY = int(os.getenv('WEB_CONCURRENCY', 1))
+    SMS_BROADCAST_RATE_PER_SECOND = float(os.getenv('SMS_BROADCAST_RATE_PER_SECOND')) if os.getenv('SMS_BROADCAST_RATE_PER_SECOND') else None
+    SMS_TRANSACTIONAL_TIMEOUT = float(os.getenv('SMS_TRANSACTIONAL_TIMEOUT', 30))
+    SMS_TRANSACTIONAL_QUEUE_SIZE = int(os.getenv('SMS_TRANSACTIONAL_QUEUE_SIZE', 500))  # 0 = unbounded
+    SMS_MAX_ATTEMPTS = int(os.getenv('SMS_MAX_ATTEMPTS', 5))  # then dead-lettered
+    SMS_RETRY_BASE_SECONDS = float(os.getenv('SMS_RETRY_BASE_SECONDS', 2))
+    SMS_RETRY_MAX_SECONDS = float(os.getenv('SMS_RETRY_MAX_SECONDS', 300))
+    # Broadcast jobs are leased to their sending process; after this long without renewal another one closes them out
+    SMS_LEASE_SECONDS = float(os.getenv('SMS_LEASE_SECONDS', 120))
+    
+    # SMS Providers: JSON list of {"name", "type": twilio|http|console, "weight", "rate", ...}
+    SMS_PROVIDERS = os.getenv('SMS_PROVIDERS')
+    SMS_PROVIDER_FAILURE_THRESHOLD = int(os.getenv('SMS_PROVIDER_FAILURE_THRESHOLD', 5))
+    SMS_PROVIDER_COOLDOWN_SECONDS = float(os.getenv('SMS_PROVIDER_COOLDOWN_SECONDS', 30))
+    
+    # Delivery receipts (provider status callbacks)
+    SMS_STATUS_CALLBACK_URL = os.getenv('SMS_STATUS_CALLBACK_URL')  # public URL of /sms/status; unset = no callbacks
+    SMS_STATUS_VALIDATE_SIGNATURE = os.getenv('SMS_STATUS_VALIDATE_SIGNATURE', 'True').lower() == 'true'
+    SMS_STATUS_FLUSH_INTERVAL = float(os.getenv('SMS_STATUS_FLUSH_INTERVAL', 1.0))
+    SMS_STATUS_BATCH_SIZE = int(os.getenv('SMS_STATUS_BATCH_SIZE', 1000))
+    
+    # Per-phone broadcast frequency cap (transactional SMS are never capped); 0 = no cap
+    SMS_FREQUENCY_CAP = int(os.getenv('SMS_FREQUENCY_CAP', 3))
+    SMS_FREQUENCY_WINDOW_SECONDS = int(os.getenv('SMS_FREQUENCY_WINDOW_SECONDS', 3600))
+    
+    # OTP storage: 'auto' = Mongo TTL collection when connected, else a SQLite file shared by workers
+    OTP_STORE = os.getenv('OTP_STORE', 'auto')  # 'auto', 'mongo', 'sqlite' or 'memory' (single process)
+    OTP_SQLITE_PATH = os.getenv('OTP_SQLITE_PATH')  # default: DATA_DIR/otp.sqlite3
+    
+    # Staff identity cache (per process) and batched last_login writes.
+    # Staff records edited in the database take effect within STAFF_CACHE_TTL_SECONDS.
+    STAFF_CACHE_TTL_SECONDS = float(os.getenv('STAFF_CACHE_TTL_SECONDS', 60))
+    STAFF_LOGIN_FLUSH_INTERVAL = float(os.getenv('STAFF_LOGIN_FLUSH_INTERVAL', 5))
+    
+    # Rate limits for /register and /verify, as "requests/seconds" sliding windows ('' = off)
+    RATE_LIMIT_ENABLED = os.getenv('RATE_LIMIT_ENABLED', 'True').lower() == 'true'
+    RATE_LIMIT_PER_PHONE = os.getenv('RATE_LIMIT_PER_PHONE', '5/3600')
+    RATE_LIMIT_PER_IP = os.getenv('RATE_LIMIT_PER_IP', '30/60')
+    RATE_LIMIT_GLOBAL = os.getenv('RATE_LIMIT_GLOBAL', '20/1')
+    RATE_LIMIT_STORAGE = os.getenv('RATE_LIMIT_STORAGE', 'memory')  # 'memory' (per process), 'sqlite' or 'mongo' (shared)
+    RATE_LIMIT_SQLITE_PATH = os.getenv('RATE_LIMIT_SQLITE_PATH')  # default: DATA_DIR/rate_limits.sqlite3
+    
+    # Broadcast idempotency: a repeated /broadcast submission returns the original result
+    BROADCAST_IDEMPOTENCY_TTL_HOURS = float(os.getenv('BROADCAST_IDEMPOTENCY_TTL_HOURS', 24))
+    # Identical broadcasts (area, type, content) without a client key are duplicates within this window
+    BROADCAST_DEDUPE_WINDOW_SECONDS = int(os.getenv('BROADCAST_DEDUPE_WINDOW_SECONDS', 300))
+    # An in-progress claim this old with no SMS job behind it belongs to a worker that died; a new request may take it over
+    BROADCAST_CLAIM_STALE_SECONDS = int(os.getenv('BROADCAST_CLAIM_STALE_SECONDS', 120))
+    
+    # Shared HTTP pool for SMS providers
+    SMS_HTTP_POOL_CONNECTIONS = int(os.getenv('SMS_HTTP_POOL_CONNECTIONS', 10))  # hosts kept pooled
+    SMS_HTTP_POOL_MAXSIZE = int(os.getenv('SMS_HTTP_POOL_MAXSIZE', 0))  # connections per host; 0 = SMS_DISPATCH_WORKERS
+    SMS_HTTP_CONNECT_TIMEOUT = float(os.getenv('SMS_HTTP_CONNECT_TIMEOUT', 3.05))
+    SMS_HTTP_READ_TIMEOUT = float(os.getenv('SMS_HTTP_READ_TIMEOUT', 10))
+    
+    # Logging
+    LOG_LEVEL = os.getenv('LOG_LEVEL', 'INFO').upper()
+    LOG_FORMAT = os.getenv('LOG_FORMAT', 'json')  # 'json' or 'text'
+    LOG_FILE = os.getenv('LOG_FILE')
+    LOG_QUEUE_SIZE = int(os.getenv('LOG_QUEUE_SIZE', 10000))
+    # Sampling for per-recipient SMS events; unlisted levels are always kept
+    LOG_RECIPIENT_SAMPLE_RATES = os.getenv('LOG_RECIPIENT_SAMPLE_RATES', 'DEBUG=0,INFO=0.01,WARNING=0.1')
+    
+    # Request Profiling (opt-in)
+    PROFILE_SAMPLE_RATE = float(os.getenv('PROFILE_SAMPLE_RATE', 0))  # fraction of requests cProfiled
+    PROFILE_SLOW_MS = float(os.getenv('PROFILE_SLOW_MS', 0))  # keep stack samples of slower requests; 0 = off
+    PROFILE_SAMPLE_INTERVAL_MS = float(os.getenv('PROFILE_SAMPLE_INTERVAL_MS', 5))
+    PROFILE_ENDPOINTS = [e.strip() for e in os.getenv('PROFILE_ENDPOINTS', '').split(',') if e.strip()]
+    PROFILE_MAX_FILES = int(os.getenv('PROFILE_MAX_FILES', 200))
+    
     # Haiti Areas Configuration
     HAITI_AREAS = [
         'CITE_SOLEIL',
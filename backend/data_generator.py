@@ -2,9 +2,14 @@
 import pandas as pd
 import numpy as np
 import json
+import os
+import uuid
+import argparse
 from datetime import datetime, timedelta
 import random
 
+from config import Config
+
 # Haiti geographic areas with real population estimates
 HAITI_AREAS = {
     'CITE_SOLEIL': {'population': 300000, 'risk_factor': 0.9, 'coordinates': [18.5944, -72.3074]},
@@ -147,7 +152,209 @@ def generate_crime_data(days=365):
     
     return pd.DataFrame(data)
 
-if __name__ == "__main__":
+# Synthetic population settings (used for load-testing fixtures)
+FIRST_NAMES = [
+    'Jean', 'Marie', 'Pierre', 'Rose', 'Jacques', 'Nadège', 'Wilson', 'Guerline',
+    'Frantz', 'Mirlande', 'Ricardo', 'Fabienne', 'Josué', 'Esther', 'Junior', 'Widline',
+    'Kervens', 'Sandra', 'Evens', 'Rosemène', 'Stanley', 'Daphney', 'Ronald', 'Manoucheka'
+]
+
+LAST_NAMES = [
+    'Baptiste', 'Joseph', 'Pierre', 'Jean-Louis', 'Charles', 'Louis', 'Saint-Fleur',
+    'Dorvil', 'Desir', 'Augustin', 'Exantus', 'Toussaint', 'Celestin', 'Noël',
+    'Francois', 'Alexis', 'Michel', 'Paul', 'Etienne', 'Jeune'
+]
+
+ALERT_TYPES = ['health_outbreak', 'safety_alert', 'custom_alert']
+
+def _population_areas():
+    """Return configured areas with population-proportional weights"""
+    areas = [area for area in Config.HAITI_AREAS if area in HAITI_AREAS]
+    weights = [HAITI_AREAS[area]['population'] for area in areas]
+    return areas, weights
+
+def population_phone(index):
+    """Phone number of the index-th synthetic user"""
+    return f"+509{30000000 + index:08d}"
+
+def generate_users(count, verified_ratio=0.85, inactive_ratio=0.03, days=365, as_datetime=False):
+    """Yield synthetic app users spread across Config.HAITI_AREAS
+
+    Phones are sequential Haitian numbers, so repeated runs with the same
+    count produce the same phone set (useful for lookup benchmarks).
+    """
+    areas, weights = _population_areas()
+    now = datetime.utcnow()
+    batch = 10000
+    
+    for start in range(0, count, batch):
+        size = min(batch, count - start)
+        batch_areas = random.choices(areas, weights=weights, k=size)
+        
+        for offset, area in enumerate(batch_areas):
+            index = start + offset
+            latitude, longitude = HAITI_AREAS[area]['coordinates']
+            created_at = now - timedelta(seconds=random.randint(0, days * 86400))
+            verified = random.random() < verified_ratio
+            verified_at = created_at + timedelta(minutes=random.randint(1, 10)) if verified else None
+            
+            yield {
+                'id': str(uuid.uuid4()),
+                'name': f"{random.choice(FIRST_NAMES)} {random.choice(LAST_NAMES)}",
+                'phone': population_phone(index),
+                'area': area,
+                'latitude': round(latitude + random.uniform(-0.02, 0.02), 6),
+                'longitude': round(longitude + random.uniform(-0.02, 0.02), 6),
+                'verified': verified,
+                'active': random.random() >= inactive_ratio,
+                'created_at': created_at if as_datetime else created_at.isoformat(),
+                'verified_at': (verified_at if as_datetime else verified_at.isoformat()) if verified_at else None
+            }
+
+def generate_alert_history(count, days=365, as_datetime=False):
+    """Yield synthetic sent_alerts records, mirroring AlertService records"""
+    areas, weights = _population_areas()
+    now = datetime.utcnow()
+    conditions = list(HEALTH_CONDITIONS.keys())
+    crime_types = list(CRIME_TYPES.keys())
+    
+    for _ in range(count):
+        area = random.choices(areas, weights=weights)[0]
+        alert_type = random.choices(ALERT_TYPES, weights=[0.6, 0.3, 0.1])[0]
+        timestamp = now - timedelta(seconds=random.randint(0, days * 86400))
+        is_ml_triggered = alert_type == 'health_outbreak' and random.random() < 0.2
+        
+        alert = {
+            'id': str(uuid.uuid4()),
+            'alert_type': alert_type,
+            'area': area,
+            'recipients_count': random.randint(0, int(HAITI_AREAS[area]['population'] * 0.05)),
+            'timestamp': timestamp if as_datetime else timestamp.isoformat(),
+            'triggered_by': 'system' if is_ml_triggered else 'admin',
+            'staff_user_id': None,
+            'is_ml_triggered': is_ml_triggered
+        }
+        
+        if alert_type == 'health_outbreak':
+            alert['condition'] = random.choice(conditions)
+            alert['cases'] = random.randint(1, 60)
+            alert['message'] = f"🚨 ALÈT SANTE: {alert['cases']} {alert['condition']} nan {area}."
+            if is_ml_triggered:
+                alert['ml_probability'] = round(random.uniform(0.7, 0.99), 3)
+        elif alert_type == 'safety_alert':
+            alert['crime_type'] = random.choice(crime_types)
+            alert['message'] = f"⚠️ SEKIRITE: {alert['crime_type']} nan {area}. Fè atansyon."
+        else:
+            alert['message'] = f"Enfòmasyon pou moun nan {area}."
+        
+        yield alert
+
+def generate_prediction_history(days=90, days_ahead=7, as_datetime=False):
+    """Yield one stored prediction per area/condition/day, plus daily crime risk"""
+    areas, _ = _population_areas()
+    today = datetime.utcnow().replace(hour=6, minute=0, second=0, microsecond=0)
+    
+    for day in range(days):
+        generated_at = today - timedelta(days=day)
+        date = generated_at.strftime('%Y-%m-%d')
+        
+        for area in areas:
+            risk_factor = HAITI_AREAS[area]['risk_factor']
+            targets = [('health_outbreak', condition) for condition in HEALTH_CONDITIONS] + [('crime_risk', None)]
+            
+            for prediction_type, condition in targets:
+                daily = []
+                for ahead in range(1, days_ahead + 1):
+                    probability = min(0.99, random.betavariate(2, 5) * (0.5 + risk_factor))
+                    daily.append({
+                        'date': (generated_at + timedelta(days=ahead)).strftime('%Y-%m-%d'),
+                        'outbreak_probability': round(probability, 4),
+                        'predicted_cases': int(probability * 40),
+                        'risk_level': 'HIGH' if probability > 0.7 else 'MEDIUM' if probability > 0.4 else 'LOW'
+                    })
+                
+                yield {
+                    'id': str(uuid.uuid4()),
+                    'area': area,
+                    'date': date,
+                    'type': prediction_type,
+                    'condition': condition,
+                    'predictions': daily,
+                    'timestamp': generated_at if as_datetime else generated_at.isoformat()
+                }
+
+def write_json_array(filename, records):
+    """Stream records to a JSON array file without holding them in memory"""
+    count = 0
+    with open(filename, 'w', encoding='utf-8') as f:
+        f.write('[\n')
+        for record in records:
+            if count:
+                f.write(',\n')
+            f.write(json.dumps(record, default=str))
+            count += 1
+        f.write('\n]')
+    return count
+
+def write_population_json(data_dir, users, alerts, predictions):
+    """Write population fixtures in DatabaseManager JSON-mode layout"""
+    os.makedirs(data_dir, exist_ok=True)
+    counts = {}
+    for name, records in [('users', users), ('sent_alerts', alerts), ('predictions', predictions)]:
+        counts[name] = write_json_array(os.path.join(data_dir, f'{name}.json'), records)
+        print(f"💾 Wrote {counts[name]} {name} to {data_dir}")
+    return counts
+
+def write_population_mongo(db, users, alerts, predictions, reset=False, batch_size=10000):
+    """Bulk-insert population fixtures into a MongoDB database handle"""
+    counts = {}
+    for name, records in [('users', users), ('sent_alerts', alerts), ('predictions', predictions)]:
+        collection = db[name]
+        if reset:
+            collection.delete_many({})
+        
+        counts[name] = 0
+        batch = []
+        for record in records:
+            batch.append(record)
+            if len(batch) >= batch_size:
+                collection.insert_many(batch, ordered=False)
+                counts[name] += len(batch)
+                batch = []
+        if batch:
+            collection.insert_many(batch, ordered=False)
+            counts[name] += len(batch)
+        print(f"💾 Inserted {counts[name]} {name} into {db.name}")
+    
+    db.users.create_index("phone", unique=True, background=True)
+    return counts
+
+def generate_population(users=100000, alerts=10000, prediction_days=90, target='json',
+                        data_dir=None, mongodb_uri=None, db_name=None, reset=False, seed=None):
+    """Generate a synthetic user/alert/prediction population for load testing"""
+    if seed is not None:
+        random.seed(seed)
+    
+    as_datetime = target == 'mongo'
+    user_records = generate_users(users, as_datetime=as_datetime)
+    alert_records = generate_alert_history(alerts, as_datetime=as_datetime)
+    prediction_records = generate_prediction_history(prediction_days, as_datetime=as_datetime)
+    
+    if target == 'mongo':
+        from pymongo import MongoClient
+        
+        client = MongoClient(mongodb_uri or Config.MONGODB_URI or 'mongodb://localhost:27017')
+        return write_population_mongo(
+            client[db_name or Config.MONGODB_DB],
+            user_records, alert_records, prediction_records, reset=reset
+        )
+    return write_population_json(
+        data_dir or os.path.join(Config.DATA_DIR, 'population'),
+        user_records, alert_records, prediction_records
+    )
+
+def generate_datasets():
+    """Generate the ML training datasets"""
     print("Generating synthetic dataset for Haiti...")
     
     # Generate datasets
@@ -171,4 +378,39 @@ if __name__ == "__main__":
     with open('dataset/haiti_areas.json', 'w') as f:
         json.dump(HAITI_AREAS, f, indent=2)
     
-    print("\nDataset generation complete!")
\ No newline at end of file
+    print("\nDataset generation complete!")
+
+def main():
+    parser = argparse.ArgumentParser(description="Alatem synthetic data generator")
+    parser.add_argument('mode', nargs='?', choices=['datasets', 'population'], default='datasets',
+                        help="'datasets' for ML training CSVs, 'population' for load-testing fixtures")
+    parser.add_argument('--users', type=int, default=100000, help="Number of users to generate")
+    parser.add_argument('--alerts', type=int, default=10000, help="Number of sent alerts to generate")
+    parser.add_argument('--prediction-days', type=int, default=90, help="Days of prediction history")
+    parser.add_argument('--target', choices=['json', 'mongo'], default='json', help="Storage to write to")
+    parser.add_argument('--data-dir', help="Output directory for JSON mode (default: data/population)")
+    parser.add_argument('--mongodb-uri', help="MongoDB URI (default: MONGODB_URI or localhost)")
+    parser.add_argument('--db-name', help="MongoDB database name (default: MONGODB_DB)")
+    parser.add_argument('--reset', action='store_true', help="Clear Mongo collections before inserting")
+    parser.add_argument('--seed', type=int, help="Random seed for reproducible fixtures")
+    args = parser.parse_args()
+    
+    if args.mode == 'population':
+        print(f"Generating synthetic population ({args.users} users) -> {args.target}...")
+        generate_population(
+            users=args.users,
+            alerts=args.alerts,
+            prediction_days=args.prediction_days,
+            target=args.target,
+            data_dir=args.data_dir,
+            mongodb_uri=args.mongodb_uri,
+            db_name=args.db_name,
+            reset=args.reset,
+            seed=args.seed
+        )
+        print("\nPopulation generation complete!")
+    else:
+        generate_datasets()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,153 @@
+"""
+SMS delivery receipts
+
+Providers report each message's fate to /sms/status (Twilio status-callback
+format: MessageSid, MessageStatus, ErrorCode). Receipts, and the send
+records that tie a MessageSid to its broadcast job, are buffered in memory
+and written in batches every SMS_STATUS_FLUSH_INTERVAL seconds or
+SMS_STATUS_BATCH_SIZE receipts: one bulk upsert into sms_deliveries plus
+one counter update per broadcast job (alerts link to their job through
+sms_job_id), instead of a write per callback.
+
+Each message is counted once, when it first reaches a final status
+(delivered, undelivered or failed), however often or out of order the
+provider calls back.
+"""
+import atexit
+import threading
+from collections import Counter, defaultdict
+from datetime import datetime
+
+from config import Config
+from metrics import SMS_DELIVERY_STATUS, SMS_STATUS_BUFFERED
+
+FINAL_STATUSES = ('delivered', 'undelivered', 'failed')
+# Later statuses win when several receipts for a message arrive in one batch
+STATUS_RANK = {
+    'accepted': 0, 'scheduled': 0, 'queued': 1, 'sending': 2, 'sent': 3,
+    'receiving': 3, 'received': 3, 'read': 5, 'canceled': 4,
+    'delivered': 4, 'undelivered': 4, 'failed': 4
+}
+
+class DeliveryTracker:
+    def __init__(self, db, flush_interval=None, batch_size=None):
+        self.db = db
+        self.flush_interval = Config.SMS_STATUS_FLUSH_INTERVAL if flush_interval is None else flush_interval
+        self.batch_size = batch_size or Config.SMS_STATUS_BATCH_SIZE
+        self._sent = {}
+        self._statuses = {}
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._thread = None
+
+    def _ensure_started(self):
+        # Caller holds the lock
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name='delivery-flush', daemon=True)
+            self._thread.start()
+            atexit.register(self.flush)
+
+    def record_sent(self, sid, phone, provider, lane, job_id=None):
+        """Remember which job a provider message id belongs to"""
+        with self._lock:
+            self._ensure_started()
+            self._sent[sid] = {
+                'sid': sid,
+                'phone': phone,
+                'provider': provider,
+                'lane': lane,
+                'job_id': job_id,
+                'sent_at': datetime.utcnow().isoformat()
+            }
+            self._buffered_changed()
+
+    def record_status(self, sid, status, error_code=None):
+        """Buffer one status callback"""
+        SMS_DELIVERY_STATUS.inc(status=status)
+        with self._lock:
+            self._ensure_started()
+            current = self._statuses.get(sid)
+            if current is None or STATUS_RANK.get(status, 0) >= STATUS_RANK.get(current['status'], 0):
+                self._statuses[sid] = {
+                    'status': status,
+                    'error_code': error_code,
+                    'status_updated_at': datetime.utcnow().isoformat()
+                }
+            self._buffered_changed()
+
+    def _buffered_changed(self):
+        # Caller holds the lock
+        buffered = len(self._sent) + len(self._statuses)
+        SMS_STATUS_BUFFERED.set(buffered)
+        if buffered >= self.batch_size:
+            self._wakeup.set()
+
+    def _run(self):
+        while True:
+            self._wakeup.wait(self.flush_interval)
+            self._wakeup.clear()
+            try:
+                self.flush()
+            except Exception as e:
+                print(f"⚠️ Delivery receipt flush failed: {e}")
+
+    def flush(self):
+        """Write buffered send records and receipts; returns the number of messages written"""
+        with self._flush_lock:
+            with self._lock:
+                sent, statuses = self._sent, self._statuses
+                self._sent, self._statuses = {}, {}
+                SMS_STATUS_BUFFERED.set(0)
+            if not sent and not statuses:
+                return 0
+
+            try:
+                written = self._write(sent, statuses)
+            except Exception:
+                # Put the batch back so the next flush retries it
+                with self._lock:
+                    for sid, record in sent.items():
+                        self._sent.setdefault(sid, record)
+                    for sid, receipt in statuses.items():
+                        self._statuses.setdefault(sid, receipt)
+                raise
+            return written
+
+    def _write(self, sent, statuses):
+        # One read for the batch: earlier status and job of every message involved
+        existing = self.db.get_sms_deliveries(list(set(sent) | set(statuses)))
+
+        updates = []
+        counts = defaultdict(Counter)
+        for sid in set(sent) | set(statuses):
+            previous = existing.get(sid, {})
+            record = sent.get(sid)
+            receipt = statuses.get(sid)
+            job_id = (record or previous).get('job_id')
+            old_status = previous.get('status')
+
+            set_fields = dict(record) if record else {}
+            insert_fields = {}
+            if receipt and old_status not in FINAL_STATUSES:
+                set_fields.update(receipt)
+                if receipt['status'] in FINAL_STATUSES and job_id:
+                    counts[job_id][receipt['status']] += 1
+            elif record:
+                insert_fields['status'] = 'sent'
+                if old_status in FINAL_STATUSES and not previous.get('job_id') and job_id:
+                    # The receipt was written (by another worker) before this send record
+                    counts[job_id][old_status] += 1
+            set_fields.pop('sid', None)
+            if not set_fields and not insert_fields:
+                continue
+            updates.append((sid, set_fields, insert_fields))
+
+        self.db.save_sms_deliveries(updates)
+        for job_id, increments in counts.items():
+            self.db.increment_sms_job_delivery(job_id, dict(increments))
+        return len(updates)
+
+    def get_stats(self):
+        with self._lock:
+            return {'buffered_sent': len(self._sent), 'buffered_receipts': len(self._statuses)}
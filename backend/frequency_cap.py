@@ -0,0 +1,103 @@
+"""
+Per-recipient alert frequency cap
+
+Recent broadcast send times per phone, kept in the sms_send_windows
+collection so every worker process counts against the same windows. The
+dispatcher checks a whole job's recipients in one storage call before
+queueing it: recipients who already received SMS_FREQUENCY_CAP broadcasts in
+the last SMS_FREQUENCY_WINDOW_SECONDS are skipped, so stacked ML-triggered and
+manual alerts for one area don't use up provider throughput re-sending to
+the same people.
+
+The check counts a send for each recipient it lets through, atomically with
+the check itself; sends that end up dead-lettered are uncounted. A phone's
+window expires SMS_FREQUENCY_WINDOW_SECONDS after its last send (TTL-indexed
+on Mongo). Without a database the windows are kept in this process's memory.
+"""
+import threading
+
+from config import Config
+from metrics import SMS_FREQUENCY_CAPPED
+
+def count_sends(windows, phones, limit, window, now, bypass=False):
+    """Sliding-window check and count over {phone: send epochs}, shared by the stores
+
+    Phones with fewer than limit sends after now - window (every phone with
+    bypass) get a send at now; windows is updated in place, keeping the last
+    limit sends. Returns (capped phones, counted phones).
+    """
+    cutoff = now - window
+    capped, counted = [], []
+    for phone in dict.fromkeys(phones):
+        sends = sorted(t for t in windows.get(phone) or () if t > cutoff)
+        if not bypass and len(sends) >= limit:
+            capped.append(phone)
+            continue
+        windows[phone] = (sends + [now])[-limit:]
+        counted.append(phone)
+    return capped, counted
+
+class FrequencyCap:
+    def __init__(self, db=None, limit=None, window=None):
+        self.db = db
+        self.limit = Config.SMS_FREQUENCY_CAP if limit is None else limit
+        self.window = window or Config.SMS_FREQUENCY_WINDOW_SECONDS
+        self._windows = {}  # without a database: phone -> send epochs
+        self._lock = threading.Lock()
+
+    @property
+    def enabled(self):
+        return self.limit > 0
+
+    def admit(self, phones, now):
+        """Split recipients into (allowed, capped) and count a send at now for each allowed one"""
+        phones = list(phones)
+        if not self.enabled:
+            return phones, []
+        capped = set(self._count(phones, now))
+        if capped:
+            SMS_FREQUENCY_CAPPED.inc(len(capped))
+        return [p for p in phones if p not in capped], [p for p in phones if p in capped]
+
+    def record(self, phones, now):
+        """Count sends that bypass the cap (priority alerts) toward later checks"""
+        if self.enabled:
+            self._count(list(phones), now, bypass=True)
+
+    def release(self, phones, sent_at):
+        """Uncount the sends counted at sent_at for phones that were never delivered"""
+        if not self.enabled or not phones:
+            return
+        if self.db is not None:
+            try:
+                self.db.release_sms_sends(list(phones), sent_at)
+            except Exception as e:
+                print(f"⚠️ Could not uncount undelivered SMS: {e}")
+            return
+        with self._lock:
+            for phone in phones:
+                sends = self._windows.get(phone)
+                if sends and sent_at in sends:
+                    sends.remove(sent_at)
+
+    def _count(self, phones, now, bypass=False):
+        """Count sends and return the capped phones"""
+        if self.db is not None:
+            try:
+                return self.db.admit_sms_sends(phones, self.limit, self.window, now, bypass)
+            except Exception as e:
+                # Never hold an alert back because the cap's storage is down
+                print(f"⚠️ SMS frequency cap unavailable: {e}")
+                return []
+        with self._lock:
+            capped, _ = count_sends(self._windows, phones, self.limit, self.window, now, bypass)
+            for phone in [p for p, sends in self._windows.items() if not sends or sends[-1] <= now - self.window]:
+                del self._windows[phone]
+        return capped
+
+    def get_stats(self):
+        return {
+            'limit': self.limit,
+            'window_seconds': self.window,
+            'shared': self.db is not None
+        }
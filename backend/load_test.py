@@ -0,0 +1,308 @@
+#!/usr/bin/env python3
+"""
+End-to-end HTTP load test for the Alatem API
+
+Boots app.py under gunicorn against a scratch SQLite or JSON store (or a
+local MongoDB database), points the Twilio client at a local mock provider with
+injected latency/errors, then drives a weighted mix of /register, /verify,
+/broadcast and /alerts/history from concurrent virtual users. Reports
+throughput and p50/p95/p99 latency per route.
+
+Usage:
+    python load_test.py --duration 60 --concurrency 20
+    python load_test.py --target mongo --mongodb-uri mongodb://localhost:27017 --workers 4
+    python load_test.py --mock-latency-ms 200 --mock-error-rate 0.05 --output load_results.json
+"""
+
+import argparse
+import json
+import os
+import random
+import re
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from datetime import datetime
+
+import requests
+
+import data_generator
+from config import Config
+from mock_sms_provider import MockSMSProvider
+
+ROUTES = ['register', 'verify', 'broadcast', 'alerts_history']
+DEFAULT_MIX = {'register': 40, 'verify': 30, 'broadcast': 5, 'alerts_history': 25}
+OTP_PATTERN = re.compile(r'\b(\d{6})\b')
+# How long verify waits for /register's OTP (sent off the request path) to reach the mock provider
+OTP_WAIT_SECONDS = 5
+
+def percentile(sorted_samples, pct):
+    """Nearest-rank percentile of an already sorted list"""
+    if not sorted_samples:
+        return 0.0
+    rank = max(0, min(len(sorted_samples) - 1, int(round(pct / 100 * len(sorted_samples))) - 1))
+    return sorted_samples[rank]
+
+class RouteStats:
+    def __init__(self):
+        self.samples = {route: [] for route in ROUTES}
+        self.errors = {route: 0 for route in ROUTES}
+        self._lock = threading.Lock()
+
+    def record(self, route, elapsed_ms, ok):
+        with self._lock:
+            self.samples[route].append(elapsed_ms)
+            if not ok:
+                self.errors[route] += 1
+
+    def summary(self, duration):
+        rows = {}
+        for route in ROUTES:
+            samples = sorted(self.samples[route])
+            rows[route] = {
+                'requests': len(samples),
+                'errors': self.errors[route],
+                'throughput_rps': round(len(samples) / duration, 2) if duration else 0,
+                'p50_ms': round(percentile(samples, 50), 2),
+                'p95_ms': round(percentile(samples, 95), 2),
+                'p99_ms': round(percentile(samples, 99), 2),
+                'max_ms': round(samples[-1], 2) if samples else 0
+            }
+        return rows
+
+class VirtualUser(threading.Thread):
+    def __init__(self, index, base_url, provider, stats, mix, deadline, staff_credentials):
+        super().__init__(daemon=True)
+        self.index = index
+        self.base_url = base_url
+        self.provider = provider
+        self.stats = stats
+        self.mix = mix
+        self.deadline = deadline
+        self.staff_credentials = staff_credentials
+        self.session = requests.Session()
+        self.logged_in = False
+        self.pending_phones = []
+        self.counter = 0
+
+    def _timed(self, route, method, path, **kwargs):
+        start = time.perf_counter()
+        try:
+            response = self.session.request(method, self.base_url + path, timeout=120, **kwargs)
+            ok = response.status_code < 400
+        except requests.RequestException:
+            response, ok = None, False
+        self.stats.record(route, (time.perf_counter() - start) * 1000, ok)
+        return response
+
+    def _next_phone(self):
+        self.counter += 1
+        return f"+5095{(self.index * 100000 + self.counter) % 10 ** 7:07d}"
+
+    def do_register(self):
+        phone = self._next_phone()
+        response = self._timed('register', 'POST', '/register', json={
+            'name': 'Chaj Tès',
+            'phone': phone,
+            'area': random.choice(Config.HAITI_AREAS)
+        })
+        if response is not None and response.ok:
+            self.pending_phones.append(phone)
+
+    def do_verify(self):
+        if not self.pending_phones:
+            return self.do_register()
+        phone = self.pending_phones.pop(0)
+        # /register returns before the OTP goes out: wait for it to reach the mock provider
+        deadline = time.monotonic() + OTP_WAIT_SECONDS
+        match = OTP_PATTERN.search(self.provider.last_messages.get(phone, ''))
+        while match is None and time.monotonic() < deadline:
+            time.sleep(0.05)
+            match = OTP_PATTERN.search(self.provider.last_messages.get(phone, ''))
+        self._timed('verify', 'POST', '/verify', json={
+            'phone': phone,
+            'otp': match.group(1) if match else '000000'
+        })
+
+    def do_broadcast(self):
+        if not self.logged_in:
+            self.session.post(self.base_url + '/login', data=self.staff_credentials, timeout=30)
+            self.logged_in = True
+        self._timed('broadcast', 'POST', '/broadcast', json={
+            'alert_type': 'health',
+            'area': random.choice(Config.HAITI_AREAS),
+            'condition': random.choice(Config.HEALTH_CONDITIONS)
+        })
+
+    def do_alerts_history(self):
+        self._timed('alerts_history', 'GET', '/alerts/history', params={
+            'area': random.choice(Config.HAITI_AREAS),
+            'limit': 50
+        })
+
+    def run(self):
+        routes = list(self.mix.keys())
+        weights = list(self.mix.values())
+        while time.time() < self.deadline:
+            route = random.choices(routes, weights=weights)[0]
+            getattr(self, f'do_{route}')()
+
+DATABASE_BACKENDS = {'sqlite': 'sqlite', 'json': 'json', 'mongo': 'mongodb'}
+
+def seed_store(target, data_dir, mongodb_uri, db_name, population):
+    """Create the staff admin and a small verified population to broadcast to"""
+    from database import DatabaseManager
+    from auth import AuthService
+
+    Config.DATA_DIR = data_dir
+    Config.MONGODB_URI = mongodb_uri if target == 'mongo' else None
+    Config.MONGODB_DB = db_name
+    Config.DATABASE_BACKEND = DATABASE_BACKENDS[target]
+
+    if population:
+        # The SQLite store imports the generated JSON files when DatabaseManager creates it
+        data_generator.generate_population(
+            users=population, alerts=population, prediction_days=1,
+            target='mongo' if target == 'mongo' else 'json', data_dir=data_dir, mongodb_uri=mongodb_uri,
+            db_name=db_name, reset=True, seed=42
+        )
+    AuthService(DatabaseManager()).create_default_admin()
+
+def wait_for_server(base_url, process, timeout=60):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError("gunicorn exited during startup")
+        try:
+            requests.get(base_url + '/test', timeout=2)
+            return
+        except requests.RequestException:
+            time.sleep(0.5)
+    raise RuntimeError("Server did not become ready in time")
+
+def print_report(summary, provider_stats, duration):
+    print("\n" + "=" * 78)
+    print(f"📊 LOAD TEST RESULTS ({duration:.0f}s)")
+    print("=" * 78)
+    print(f"{'route':<16}{'requests':>10}{'errors':>8}{'req/s':>9}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}")
+    for route, row in summary.items():
+        print(f"{route:<16}{row['requests']:>10}{row['errors']:>8}{row['throughput_rps']:>9}"
+              f"{row['p50_ms']:>10}{row['p95_ms']:>10}{row['p99_ms']:>10}")
+    print("-" * 78)
+    print(f"📡 Mock provider: {provider_stats}")
+
+def main():
+    parser = argparse.ArgumentParser(description="HTTP load test for the Alatem API")
+    parser.add_argument('--target', choices=list(DATABASE_BACKENDS), default='sqlite', help="Storage backend to boot against")
+    parser.add_argument('--mongodb-uri', default='mongodb://localhost:27017')
+    parser.add_argument('--db-name', default='alatem_loadtest')
+    parser.add_argument('--workers', type=int, default=1,
+                        help="gunicorn workers (keep 1 for JSON storage: the files are not multi-process safe)")
+    parser.add_argument('--port', type=int, default=5055)
+    parser.add_argument('--concurrency', type=int, default=10, help="Concurrent virtual users")
+    parser.add_argument('--duration', type=float, default=30, help="Test duration in seconds")
+    parser.add_argument('--population', type=int, default=80, help="Verified users seeded for broadcasts")
+    parser.add_argument('--mix', default=None, help='Route weights as JSON, e.g. \'{"register": 50, "verify": 50}\'')
+    parser.add_argument('--mock-latency-ms', type=float, default=100)
+    parser.add_argument('--mock-jitter-ms', type=float, default=50)
+    parser.add_argument('--mock-error-rate', type=float, default=0.01)
+    parser.add_argument('--mock-throttle-rate', type=float, default=0.0)
+    parser.add_argument('--mock-max-rps', type=int, default=0, help="Mock provider throughput cap (0 = none)")
+    parser.add_argument('--output', help="Write JSON results here")
+    args = parser.parse_args()
+
+    mix = json.loads(args.mix) if args.mix else DEFAULT_MIX
+    unknown = set(mix) - set(ROUTES)
+    if unknown:
+        parser.error(f"Unknown routes in --mix: {', '.join(sorted(unknown))}")
+
+    data_dir = tempfile.mkdtemp(prefix='alatem_load_')
+    provider = MockSMSProvider(
+        port=0,
+        latency_ms=args.mock_latency_ms,
+        jitter_ms=args.mock_jitter_ms,
+        error_rate=args.mock_error_rate,
+        throttle_rate=args.mock_throttle_rate,
+        max_rps=args.mock_max_rps
+    ).start()
+    seed_store(args.target, data_dir, args.mongodb_uri, args.db_name, args.population)
+
+    env = dict(os.environ)
+    env.update({
+        'DATA_DIR': data_dir,
+        'MONGODB_URI': args.mongodb_uri if args.target == 'mongo' else '',
+        'MONGODB_DB': args.db_name,
+        'DATABASE_BACKEND': DATABASE_BACKENDS[args.target],
+        'WEB_CONCURRENCY': str(args.workers),  # the broadcast rate is split between the workers
+        'USE_REAL_SMS': 'True',
+        'TWILIO_SID': 'AC' + '0' * 32,
+        'TWILIO_TOKEN': 'loadtest',
+        'TWILIO_PHONE': '+15005550006',
+        'TWILIO_API_BASE_URL': provider.base_url,
+        'SMS_FREQUENCY_CAP': '0',  # every broadcast reaches the whole seeded population
+        'RATE_LIMIT_ENABLED': 'False',  # the load generator is one IP registering at full speed
+        'RETENTION_ENABLED': 'False',
+        'DEBUG': 'False'
+    })
+    base_url = f"http://127.0.0.1:{args.port}"
+    server = subprocess.Popen(
+        [sys.executable, '-m', 'gunicorn', '-w', str(args.workers), '--threads', '4',
+         '-b', f'127.0.0.1:{args.port}', '--timeout', '300', 'app:app'],
+        env=env,
+        cwd=os.path.dirname(os.path.abspath(__file__))
+    )
+
+    try:
+        wait_for_server(base_url, server)
+        print(f"🚀 Driving {args.concurrency} virtual users for {args.duration:.0f}s against {base_url}")
+
+        stats = RouteStats()
+        started = time.time()
+        deadline = started + args.duration
+        users = [
+            VirtualUser(i, base_url, provider, stats, mix, deadline,
+                        {'username': 'admin', 'password': 'admin123'})
+            for i in range(args.concurrency)
+        ]
+        for user in users:
+            user.start()
+        for user in users:
+            user.join()
+        duration = time.time() - started
+
+        summary = stats.summary(duration)
+        print_report(summary, provider.get_stats(), duration)
+
+        if args.output:
+            with open(args.output, 'w', encoding='utf-8') as f:
+                json.dump({
+                    'generated_at': datetime.utcnow().isoformat(),
+                    'target': args.target,
+                    'workers': args.workers,
+                    'concurrency': args.concurrency,
+                    'duration_s': round(duration, 2),
+                    'mock_provider': {
+                        'latency_ms': args.mock_latency_ms,
+                        'jitter_ms': args.mock_jitter_ms,
+                        'error_rate': args.mock_error_rate,
+                        'throttle_rate': args.mock_throttle_rate,
+                        'max_rps': args.mock_max_rps,
+                        **provider.get_stats()
+                    },
+                    'routes': summary
+                }, f, indent=2)
+            print(f"📄 Results written to {args.output}")
+    finally:
+        server.terminate()
+        try:
+            server.wait(timeout=30)
+        except subprocess.TimeoutExpired:
+            server.kill()
+        provider.stop()
+        shutil.rmtree(data_dir, ignore_errors=True)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,336 @@
+"""
+Lightweight metrics registry for the Alatem backend
+
+Counters, gauges and histograms rendered in the Prometheus text exposition
+format (served at /metrics). Metrics are kept per process; when running
+under gunicorn with several workers, scrape each worker or aggregate in
+Prometheus.
+"""
+import threading
+import time
+from contextlib import contextmanager
+from functools import wraps
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+def _format_labels(labelnames, labelvalues, extra=None):
+    pairs = list(zip(labelnames, labelvalues))
+    if extra:
+        pairs.extend(extra)
+    if not pairs:
+        return ''
+    return '{' + ','.join(f'{name}="{_escape(value)}"' for name, value in pairs) + '}'
+
+def _format_value(value):
+    if value == float('inf'):
+        return '+Inf'
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    return repr(value) if isinstance(value, float) else str(value)
+
+class _Metric:
+    metric_type = 'untyped'
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def _key(self, labels):
+        if set(labels) != set(self.labelnames):
+            raise ValueError(f"{self.name} expects labels {self.labelnames}, got {tuple(labels)}")
+        return tuple(str(labels[name]) for name in self.labelnames)
+
+    def render(self):
+        lines = [
+            f"# HELP {self.name} {self.documentation}",
+            f"# TYPE {self.name} {self.metric_type}"
+        ]
+        with self._lock:
+            items = sorted(self._values.items())
+        for key, value in items:
+            lines.append(f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}")
+        return lines
+
+    def value(self, **labels):
+        """Current value for a label set (0 if never recorded)"""
+        with self._lock:
+            return self._values.get(self._key(labels), 0)
+
+class Counter(_Metric):
+    metric_type = 'counter'
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+class Gauge(_Metric):
+    metric_type = 'gauge'
+
+    def set(self, value, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = value
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def dec(self, amount=1, **labels):
+        self.inc(-amount, **labels)
+
+class Histogram(_Metric):
+    metric_type = 'histogram'
+
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets)) + (float('inf'),)
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        with self._lock:
+            state = self._values.get(key)
+            if state is None:
+                state = self._values[key] = {'buckets': [0] * len(self.buckets), 'sum': 0.0, 'count': 0}
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    state['buckets'][i] += 1
+            state['sum'] += value
+            state['count'] += 1
+
+    @contextmanager
+    def time(self, **labels):
+        """Observe the duration of the with-block in seconds"""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    def value(self, **labels):
+        """Return (count, sum) for a label set"""
+        with self._lock:
+            state = self._values.get(self._key(labels))
+            return (state['count'], state['sum']) if state else (0, 0.0)
+
+    def render(self):
+        lines = [
+            f"# HELP {self.name} {self.documentation}",
+            f"# TYPE {self.name} {self.metric_type}"
+        ]
+        with self._lock:
+            items = sorted((key, dict(state, buckets=list(state['buckets']))) for key, state in self._values.items())
+        for key, state in items:
+            for bound, count in zip(self.buckets, state['buckets']):
+                labels = _format_labels(self.labelnames, key, [('le', _format_value(float(bound)))])
+                lines.append(f"{self.name}_bucket{labels} {count}")
+            labels = _format_labels(self.labelnames, key)
+            lines.append(f"{self.name}_sum{labels} {_format_value(state['sum'])}")
+            lines.append(f"{self.name}_count{labels} {state['count']}")
+        return lines
+
+class MetricsRegistry:
+    def __init__(self):
+        self._metrics = {}
+        self._collectors = []
+        self._lock = threading.Lock()
+
+    def register(self, metric):
+        with self._lock:
+            if metric.name in self._metrics:
+                return self._metrics[metric.name]
+            self._metrics[metric.name] = metric
+            return metric
+
+    def add_collector(self, collector):
+        """Register a callable returning extra exposition lines at render time"""
+        with self._lock:
+            self._collectors.append(collector)
+
+    def render(self):
+        """Render all metrics in Prometheus text format"""
+        with self._lock:
+            metrics = list(self._metrics.values())
+            collectors = list(self._collectors)
+        lines = []
+        for metric in metrics:
+            lines.extend(metric.render())
+        for collector in collectors:
+            lines.extend(collector())
+        return '\n'.join(lines) + '\n'
+
+registry = MetricsRegistry()
+
+def counter(name, documentation, labelnames=()):
+    return registry.register(Counter(name, documentation, labelnames))
+
+def gauge(name, documentation, labelnames=()):
+    return registry.register(Gauge(name, documentation, labelnames))
+
+def histogram(name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+    return registry.register(Histogram(name, documentation, labelnames, buckets))
+
+# ======================
+# APPLICATION METRICS
+# ======================
+
+HTTP_REQUEST_DURATION = histogram(
+    'alatem_http_request_duration_seconds',
+    'HTTP request latency by Flask endpoint',
+    ['method', 'endpoint', 'status']
+)
+
+DB_OPERATION_DURATION = histogram(
+    'alatem_db_operation_duration_seconds',
+    'DatabaseManager operation latency by backend and method',
+    ['backend', 'operation']
+)
+
+DB_OPERATION_ERRORS = counter(
+    'alatem_db_operation_errors_total',
+    'DatabaseManager operations that raised',
+    ['backend', 'operation']
+)
+
+SMS_SEND_DURATION = histogram(
+    'alatem_sms_send_duration_seconds',
+    'Single SMS send latency by provider',
+    ['provider']
+)
+
+SMS_MESSAGES = counter(
+    'alatem_sms_messages_total',
+    'SMS send attempts by provider and result',
+    ['provider', 'result']
+)
+
+SMS_PROVIDER_HEALTHY = gauge(
+    'alatem_sms_provider_healthy',
+    'Whether an SMS provider is in rotation (1) or tripped by failures (0)',
+    ['provider']
+)
+
+SMS_DELIVERY_STATUS = counter(
+    'alatem_sms_delivery_status_total',
+    'Delivery status callbacks received, by status',
+    ['status']
+)
+
+SMS_STATUS_BUFFERED = gauge(
+    'alatem_sms_status_buffered',
+    'Send records and delivery receipts waiting to be flushed'
+)
+
+SMS_SEGMENTS = counter(
+    'alatem_sms_segments_total',
+    'Billed SMS segments sent, by encoding',
+    ['encoding']
+)
+
+SMS_QUEUE_DEPTH = gauge(
+    'alatem_sms_queue_depth',
+    'SMS messages waiting in the dispatcher, by lane',
+    ['lane']
+)
+
+SMS_QUEUE_WAIT = histogram(
+    'alatem_sms_queue_wait_seconds',
+    'Time from enqueue to send start, by dispatcher lane',
+    ['lane'],
+    buckets=(0.01, 0.05, 0.1, 0.5, 1.0, 5.0, 15.0, 30.0, 60.0, 300.0, 900.0, 1800.0)
+)
+
+SMS_RETRIES = counter(
+    'alatem_sms_retries_total',
+    'SMS sends scheduled for retry after a transient failure, by lane',
+    ['lane']
+)
+
+SMS_DEAD_LETTERS = counter(
+    'alatem_sms_dead_letters_total',
+    'Broadcast SMS that exhausted their retries'
+)
+
+SMS_FREQUENCY_CAPPED = counter(
+    'alatem_sms_frequency_capped_total',
+    'Broadcast recipients skipped because they reached the per-phone frequency cap'
+)
+
+RATE_LIMIT_REQUESTS = counter(
+    'alatem_rate_limit_requests_total',
+    'Rate-limited endpoint calls by endpoint and result (allowed/rejected)',
+    ['endpoint', 'result']
+)
+
+RATE_LIMIT_REJECTED = counter(
+    'alatem_rate_limit_rejected_total',
+    'Calls rejected with 429, by endpoint and the window that was full (global/ip/phone)',
+    ['endpoint', 'scope']
+)
+
+RETENTION_RECORDS = counter(
+    'alatem_retention_records_total',
+    'Expired records handled by the retention engine, by collection and action (archived/rolled_up/deleted)',
+    ['collection', 'action']
+)
+
+ML_INFERENCE_DURATION = histogram(
+    'alatem_ml_inference_duration_seconds',
+    'ML prediction latency by model',
+    ['model']
+)
+
+ML_TRAINING_DURATION = histogram(
+    'alatem_ml_training_duration_seconds',
+    'ML model training latency',
+    ['model'],
+    buckets=(1.0, 5.0, 15.0, 30.0, 60.0, 120.0, 300.0, 600.0)
+)
+
+CACHE_REQUESTS = counter(
+    'alatem_cache_requests_total',
+    'Cache lookups by cache name and result (hit/miss)',
+    ['cache', 'result']
+)
+
+def record_cache_lookup(cache, hit):
+    """Count a cache lookup for hit-ratio reporting"""
+    CACHE_REQUESTS.inc(cache=cache, result='hit' if hit else 'miss')
+
+def _cache_hit_ratio_lines():
+    with CACHE_REQUESTS._lock:
+        values = dict(CACHE_REQUESTS._values)
+    caches = sorted({cache for cache, _ in values})
+    lines = [
+        "# HELP alatem_cache_hit_ratio Cache hit ratio since process start",
+        "# TYPE alatem_cache_hit_ratio gauge"
+    ]
+    for cache in caches:
+        hits = values.get((cache, 'hit'), 0)
+        total = hits + values.get((cache, 'miss'), 0)
+        if total:
+            lines.append(f'alatem_cache_hit_ratio{{cache="{_escape(cache)}"}} {_format_value(hits / total)}')
+    return lines
+
+registry.add_collector(_cache_hit_ratio_lines)
+
+def instrument_db(backend, operation):
+    """Wrap a storage operation, timing it per backend"""
+    @wraps(operation)
+    def wrapper(*args, **kwargs):
+        start = time.perf_counter()
+        try:
+            return operation(*args, **kwargs)
+        except Exception:
+            DB_OPERATION_ERRORS.inc(backend=backend, operation=operation.__name__)
+            raise
+        finally:
+            DB_OPERATION_DURATION.observe(time.perf_counter() - start, backend=backend, operation=operation.__name__)
+    return wrapper
@@ -0,0 +1,44 @@
+#!/usr/bin/env python3
+"""
+Import DatabaseManager JSON files into the SQLite store
+
+DatabaseManager imports data/*.json (and the data/segments/ files) by itself
+the first time it creates the SQLite file; use this to import into an
+existing database, from another directory, or to rebuild the tables from the
+JSON files (--replace).
+
+Usage:
+    python migrate_json_to_sqlite.py
+    python migrate_json_to_sqlite.py --data-dir backup/data --sqlite-path data/alatem.sqlite3 --replace
+"""
+
+import argparse
+import os
+
+from config import Config
+from sqlite_storage import SCHEMA, SQLiteStorage
+
+def main():
+    parser = argparse.ArgumentParser(description="Import Alatem JSON data files into SQLite")
+    parser.add_argument('--data-dir', default=Config.DATA_DIR, help="Directory holding the *.json files")
+    parser.add_argument('--sqlite-path', default=Config.SQLITE_PATH,
+                        help="SQLite database file (default: SQLITE_PATH or DATA_DIR/alatem.sqlite3)")
+    parser.add_argument('--replace', action='store_true', help="Empty each table before importing its file")
+    args = parser.parse_args()
+
+    path = args.sqlite_path or os.path.join(Config.DATA_DIR, 'alatem.sqlite3')
+    storage = SQLiteStorage(path)
+    if not storage.is_empty() and not args.replace:
+        print("⚠️ Database already has records; rows with the same unique key are replaced, others appended")
+
+    print(f"📦 Importing {args.data_dir}/*.json -> {path}")
+    counts = storage.import_json_dir(args.data_dir, replace=args.replace)
+    for table in SCHEMA:
+        if table in counts:
+            print(f"   {table:<18} {counts[table]:>10,} imported, {storage.count(table):>10,} in table")
+    if not counts:
+        print("   No JSON data files found")
+    print("✅ Migration complete")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,201 @@
+#!/usr/bin/env python3
+"""
+Convert plain MongoDB report collections into time-series collections
+
+MongoBackend creates health_reports and crime_reports as time-series
+collections when they don't exist yet, but never converts existing plain
+ones. This does it, once, from a shell:
+
+1. the plain collection is renamed to <name>_legacy and an empty
+   time-series collection is created in its place (new reports land there),
+2. the legacy documents are copied over in batches, in _id order, with the
+   last copied _id checkpointed in the `migrations` collection,
+3. the legacy collection is dropped once every document was copied.
+
+Running it again resumes from the checkpoint, so an interrupted run loses
+nothing and copies nothing twice. A lease in the same `migrations` document
+keeps a second copy of the script off a collection being converted. Reports
+without a timestamp can't be measurements; they are left in <name>_legacy.
+
+Usage:
+    python migrate_reports_to_timeseries.py
+    python migrate_reports_to_timeseries.py --collections health_reports --batch-size 500
+"""
+
+import argparse
+import os
+import socket
+from datetime import datetime, timedelta
+
+from pymongo import MongoClient, ReplaceOne, ReturnDocument
+from pymongo.errors import CollectionInvalid, DuplicateKeyError
+
+from config import Config
+from mongo_backend import TIME_SERIES, TIME_SERIES_OPTIONS, to_measurement
+
+LEASE_SECONDS = 300  # a run that stops renewing its lease for this long is presumed dead
+
+class LeaseLost(Exception):
+    pass
+
+class Conversion:
+    def __init__(self, db, name, batch_size):
+        self.db = db
+        self.name = name
+        self.legacy = f'{name}_legacy'
+        self.batch_size = batch_size
+        self.owner = f'{socket.gethostname()}:{os.getpid()}'
+        self.migrations = db.migrations
+        self.key = f'timeseries:{name}'
+
+    # ======================
+    # LEASE
+    # ======================
+
+    def acquire(self):
+        """Take the lease (a free or expired one); returns the progress document or None"""
+        now = datetime.utcnow()
+        try:
+            return self.migrations.find_one_and_update(
+                {"_id": self.key, "$or": [{"locked_until": None}, {"locked_until": {"$lt": now}}]},
+                {"$set": {"owner": self.owner, "locked_until": now + timedelta(seconds=LEASE_SECONDS)}},
+                upsert=True,
+                return_document=ReturnDocument.AFTER
+            )
+        except DuplicateKeyError:
+            return None  # held by a live run
+
+    def renew(self, **progress):
+        """Extend the lease and checkpoint progress; raises LeaseLost when another run took over"""
+        now = datetime.utcnow()
+        result = self.migrations.update_one(
+            {"_id": self.key, "owner": self.owner},
+            {"$set": dict(progress, locked_until=now + timedelta(seconds=LEASE_SECONDS))}
+        )
+        if result.matched_count == 0:
+            raise LeaseLost(self.name)
+
+    def release(self, **fields):
+        self.migrations.update_one(
+            {"_id": self.key, "owner": self.owner},
+            {"$set": dict(fields, locked_until=None)}
+        )
+
+    # ======================
+    # CONVERSION
+    # ======================
+
+    def _is_time_series(self):
+        return 'timeseries' in self.db[self.name].options()
+
+    def _swap_in_time_series(self):
+        """Rename the plain collection away and create the time-series one in its place"""
+        names = self.db.list_collection_names()
+        if self.name in names and not self._is_time_series():
+            if self.legacy in names:
+                # Reports written as a plain collection after an interrupted swap
+                self._fold_into_legacy()
+            else:
+                self.db[self.name].rename(self.legacy)
+        try:
+            self.db.create_collection(self.name, timeseries=TIME_SERIES_OPTIONS)
+        except CollectionInvalid:
+            pass  # already time-series
+
+    def _fold_into_legacy(self):
+        source = self.db[self.name]
+        while True:
+            batch = list(source.find().sort("_id", 1).limit(self.batch_size))
+            if not batch:
+                break
+            # Upserts, so documents moved by an earlier, interrupted fold aren't duplicated
+            self.db[self.legacy].bulk_write([ReplaceOne({"_id": doc['_id']}, doc, upsert=True) for doc in batch])
+            source.delete_many({"_id": {"$in": [doc['_id'] for doc in batch]}})
+        source.drop()
+
+    def run(self):
+        progress = self.acquire()
+        if progress is None:
+            print(f"⏳ {self.name}: another run holds the lease, skipping")
+            return False
+        try:
+            names = self.db.list_collection_names()
+            if self.legacy not in names and (self.name not in names or self._is_time_series()):
+                print(f"✅ {self.name}: already a time-series collection")
+                self.release(done=True)
+                return True
+            if self.legacy not in names and self.db[self.name].estimated_document_count() == 0:
+                self.db[self.name].drop()
+            self._swap_in_time_series()
+            self._copy(progress)
+            return True
+        finally:
+            self.release()
+
+    def _copy(self, progress):
+        target = self.db[self.name]
+        last_id = progress.get('last_id')
+        copied = progress.get('copied', 0)
+        skipped = progress.get('skipped', 0)
+        if last_id is not None:
+            print(f"↪️ {self.name}: resuming after {copied:,} copied")
+        first = True
+        while True:
+            query = {"_id": {"$gt": last_id}} if last_id is not None else {}
+            batch = list(self.db[self.legacy].find(query).sort("_id", 1).limit(self.batch_size))
+            if not batch:
+                break
+            docs = []
+            for report in batch:
+                doc = to_measurement(self.name, report)
+                if doc['timestamp'] is None:
+                    skipped += 1
+                else:
+                    docs.append(doc)
+            copied += len(docs)
+            if first and docs:
+                # The batch a crashed run may have inserted before its checkpoint
+                present = {doc['_id'] for doc in target.find({"_id": {"$in": [d['_id'] for d in docs]}}, {"_id": 1})}
+                docs = [doc for doc in docs if doc['_id'] not in present]
+            first = False
+            if docs:
+                target.insert_many(docs, ordered=False)
+            last_id = batch[-1]['_id']
+            self.renew(last_id=last_id, copied=copied, skipped=skipped)
+            print(f"   {self.name:<16} {copied:>10,} copied")
+
+        if skipped:
+            print(f"⚠️ {self.name}: {skipped} reports without a timestamp left in {self.legacy}")
+        else:
+            self.db[self.legacy].drop()
+        self.renew(done=True)
+        print(f"📈 {self.name}: {copied:,} reports now in a time-series collection")
+
+def main():
+    parser = argparse.ArgumentParser(description="Convert Alatem report collections to MongoDB time-series")
+    parser.add_argument('--uri', default=Config.MONGODB_URI, help="MongoDB connection string")
+    parser.add_argument('--db', default=Config.MONGODB_DB, help="Database name")
+    parser.add_argument('--collections', nargs='+', choices=sorted(TIME_SERIES), default=sorted(TIME_SERIES))
+    parser.add_argument('--batch-size', type=int, default=1000)
+    args = parser.parse_args()
+
+    client = MongoClient(args.uri)
+    if client.server_info()['versionArray'] < [5, 0]:
+        print("❌ Time-series collections need MongoDB 5.0+")
+        return 1
+    db = client[args.db]
+    results = []
+    for name in args.collections:
+        try:
+            results.append(Conversion(db, name, args.batch_size).run())
+        except LeaseLost:
+            print(f"❌ {name}: lease taken over by another run, stopping")
+            results.append(False)
+    if all(results):
+        print("✅ Conversion complete (restart the app to rebuild the report indexes)")
+        return 0
+    print("⚠️ Some collections were not converted; run again to resume")
+    return 1
+
+if __name__ == "__main__":
+    raise SystemExit(main())
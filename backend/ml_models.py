@@ -312,6 +312,15 @@ class CrimePredictor:
         
         return predictions
 
+MODEL_FILES = [
+    'outbreak_classifier.pkl', 'cases_regressor.pkl', 'label_encoders.pkl', 'scaler.pkl',
+    'feature_cols.pkl', 'crime_classifier.pkl', 'crime_model_components.pkl'
+]
+
+def check_model_files(models_dir='ml_models'):
+    """Whether every file train_all_models saves is present"""
+    return all(os.path.exists(os.path.join(models_dir, name)) for name in MODEL_FILES)
+
 def train_all_models():
     """Train all ML models"""
     try:
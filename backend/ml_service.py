@@ -5,6 +5,8 @@ import joblib
 from datetime import datetime, timedelta
 import random
 
+from metrics import ML_INFERENCE_DURATION, ML_TRAINING_DURATION
+
 # Assuming ml_models.py exists and contains these classes/functions
 from ml_models import HealthOutbreakPredictor, CrimePredictor, train_all_models, check_model_files
 
@@ -75,12 +77,14 @@ class MLService:
             }
 
             # Use your actual predictor methods
-            health_preds = self.health_predictor.predict_outbreak_risk(
-                area, 'cholera', sample_historical_health, days_ahead=1 # Predict one day at a time
-            )
-            crime_preds = self.crime_predictor.predict_crime_risk(
-                area, days_ahead=1 # Predict one day at a time
-            )
+            with ML_INFERENCE_DURATION.time(model='health_outbreak'):
+                health_preds = self.health_predictor.predict_outbreak_risk(
+                    area, 'cholera', sample_historical_health, days_ahead=1 # Predict one day at a time
+                )
+            with ML_INFERENCE_DURATION.time(model='crime_risk'):
+                crime_preds = self.crime_predictor.predict_crime_risk(
+                    area, days_ahead=1 # Predict one day at a time
+                )
 
             # Assuming the predictor returns a list of daily predictions, take the first
             health_risk = health_preds[0]['risk_level'] if health_preds else 'low'
@@ -145,7 +149,8 @@ class MLService:
         """Triggers the retraining process for all ML models."""
         print("MLService: Initiating model retraining...")
         try:
-            train_all_models() # Call the function from ml_models.py to retrain
+            with ML_TRAINING_DURATION.time(model='all'):
+                train_all_models() # Call the function from ml_models.py to retrain
             self._load_models() # Reload models after retraining
             print("MLService: Models successfully retrained and reloaded.")
             return True, "Models retrained and reloaded successfully."
@@ -0,0 +1,297 @@
+#!/usr/bin/env python3
+"""
+Local mock SMS provider
+
+A small HTTP server that speaks enough of Twilio's Messages API for the
+backend to use it in place of api.twilio.com (set TWILIO_API_BASE_URL).
+Latency, error injection and a throughput cap (like a real account's rate
+limit) make it useful for load and failover tests; every accepted message
+is recorded so harnesses can read back OTP codes. Several instances on
+different ports can stand in for several providers (SMS_PROVIDERS).
+
+When a send includes StatusCallback, the mock posts signed 'sent' and then
+'delivered' (or, at --undelivered-rate, 'undelivered') callbacks to it,
+like Twilio does.
+
+Usage:
+    python mock_sms_provider.py --port 8081 --latency-ms 150 --error-rate 0.02
+    python mock_sms_provider.py --port 8082 --max-rps 10
+"""
+
+import argparse
+import base64
+import json
+import queue
+import random
+import re
+import ssl
+import threading
+import time
+import uuid
+from datetime import datetime
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+import requests
+
+from sms_providers import twilio_signature
+
+MESSAGES_PATH = re.compile(r'^/2010-04-01/Accounts/(?P<sid>[^/]+)/Messages\.json$')
+
+class MockSMSProvider:
+    def __init__(self, host='127.0.0.1', port=8081, latency_ms=0, jitter_ms=0,
+                 error_rate=0.0, throttle_rate=0.0, retry_after=1, max_rps=0,
+                 certfile=None, keyfile=None, undelivered_rate=0.0, callback_delay_ms=100):
+        self.host = host
+        self.port = port
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+        self.error_rate = error_rate
+        self.throttle_rate = throttle_rate
+        self.retry_after = retry_after
+        self.max_rps = max_rps
+        self.certfile = certfile
+        self.keyfile = keyfile
+        self.undelivered_rate = undelivered_rate
+        self.callback_delay_ms = callback_delay_ms
+        self._callbacks = queue.Queue()
+        self._callback_threads = []
+        self._window = (0, 0)  # (second, messages accepted in it)
+        self.last_messages = {}
+        # connections = TCP (+TLS) handshakes served, to measure keep-alive reuse
+        self.stats = {'accepted': 0, 'errors': 0, 'throttled': 0, 'connections': 0,
+                      'callbacks_sent': 0, 'callback_errors': 0}
+        self._lock = threading.Lock()
+        self._server = None
+        self._thread = None
+
+    @property
+    def base_url(self):
+        scheme = 'https' if self.certfile else 'http'
+        return f"{scheme}://{self.host}:{self.port}"
+
+    def _create_server(self):
+        server = ThreadingHTTPServer((self.host, self.port), self._handler_class())
+        server.daemon_threads = True
+        if self.certfile:
+            context = ssl.SSLContext(ssl.PROTOCOL_TLS_SERVER)
+            context.load_cert_chain(self.certfile, self.keyfile)
+            # Handshake in the per-connection thread, not the accept loop
+            server.socket = context.wrap_socket(server.socket, server_side=True, do_handshake_on_connect=False)
+        return server
+
+    def _start_callback_workers(self, count=4):
+        for _ in range(count):
+            thread = threading.Thread(target=self._callback_worker, daemon=True)
+            thread.start()
+            self._callback_threads.append(thread)
+
+    def _callback_worker(self):
+        session = requests.Session()
+        session.trust_env = False
+        while True:
+            due, url, auth_token, params = self._callbacks.get()
+            delay = due - time.monotonic()
+            if delay > 0:
+                time.sleep(delay)
+            headers = {'X-Twilio-Signature': twilio_signature(auth_token, url, params)} if auth_token else {}
+            try:
+                session.post(url, data=params, headers=headers, timeout=10).raise_for_status()
+                key = 'callbacks_sent'
+            except requests.RequestException:
+                key = 'callback_errors'
+            with self._lock:
+                self.stats[key] += 1
+
+    def _queue_status_callbacks(self, url, auth_token, account_sid, message_sid, to):
+        final = 'undelivered' if random.random() < self.undelivered_rate else 'delivered'
+        now = time.monotonic()
+        for offset, status in ((0, 'sent'), (self.callback_delay_ms / 1000, final)):
+            params = {'AccountSid': account_sid, 'MessageSid': message_sid, 'SmsSid': message_sid,
+                      'MessageStatus': status, 'SmsStatus': status, 'To': to}
+            if status == 'undelivered':
+                params['ErrorCode'] = '30003'  # Unreachable destination handset
+            self._callbacks.put((now + offset, url, auth_token, params))
+
+    def start(self):
+        """Start serving in a background thread"""
+        self._start_callback_workers()
+        self._server = self._create_server()
+        self.port = self._server.server_address[1]
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+        self._thread.start()
+        print(f"📡 Mock SMS provider listening on {self.base_url}")
+        return self
+
+    def stop(self):
+        """Stop the server"""
+        if self._server:
+            self._server.shutdown()
+            self._server.server_close()
+            self._server = None
+
+    def serve_forever(self):
+        """Serve in the foreground (CLI mode)"""
+        self._start_callback_workers()
+        self._server = self._create_server()
+        print(f"📡 Mock SMS provider listening on {self.base_url}")
+        self._server.serve_forever()
+
+    def get_stats(self):
+        with self._lock:
+            return dict(self.stats, recipients=len(self.last_messages))
+
+    def _simulate_latency(self):
+        delay = self.latency_ms + (random.uniform(0, self.jitter_ms) if self.jitter_ms else 0)
+        if delay > 0:
+            time.sleep(delay / 1000)
+
+    def _over_rate_limit(self):
+        """Count this request against the per-second cap; True if it exceeds it"""
+        if not self.max_rps:
+            return False
+        second = int(time.time())
+        with self._lock:
+            window, count = self._window
+            count = count + 1 if window == second else 1
+            self._window = (second, count)
+        return count > self.max_rps
+
+    def _handle_message(self, account_sid, form, auth_token=None):
+        """Return (status, headers, payload) for a Messages.json POST"""
+        self._simulate_latency()
+
+        if self._over_rate_limit():
+            with self._lock:
+                self.stats['throttled'] += 1
+            return 429, {'Retry-After': '1'}, {
+                'code': 20429, 'message': 'Too Many Requests (rate cap)', 'status': 429
+            }
+
+        roll = random.random()
+        if roll < self.throttle_rate:
+            with self._lock:
+                self.stats['throttled'] += 1
+            return 429, {'Retry-After': str(self.retry_after)}, {
+                'code': 20429, 'message': 'Too Many Requests', 'status': 429
+            }
+        if roll < self.throttle_rate + self.error_rate:
+            with self._lock:
+                self.stats['errors'] += 1
+            return 500, {}, {'code': 20500, 'message': 'Internal Server Error', 'status': 500}
+
+        to = form.get('To', [''])[0]
+        body = form.get('Body', [''])[0]
+        message_sid = 'SM' + uuid.uuid4().hex
+        with self._lock:
+            self.stats['accepted'] += 1
+            self.last_messages[to] = body
+
+        status_callback = form.get('StatusCallback', [''])[0]
+        if status_callback:
+            self._queue_status_callbacks(status_callback, auth_token, account_sid, message_sid, to)
+
+        return 201, {}, {
+            'sid': message_sid,
+            'account_sid': account_sid,
+            'to': to,
+            'from': form.get('From', [''])[0],
+            'body': body,
+            'status': 'queued',
+            'num_segments': '1',
+            'date_created': datetime.utcnow().strftime('%a, %d %b %Y %H:%M:%S +0000'),
+            'uri': f"/2010-04-01/Accounts/{account_sid}/Messages/{message_sid}.json"
+        }
+
+    def _handler_class(self):
+        provider = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+
+            def setup(self):
+                if isinstance(self.request, ssl.SSLSocket):
+                    self.request.do_handshake()
+                with provider._lock:
+                    provider.stats['connections'] += 1
+                super().setup()
+
+            def log_message(self, format, *args):
+                pass
+
+            def _send_json(self, status, payload, headers=None):
+                body = json.dumps(payload).encode('utf-8')
+                self.send_response(status)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(body)))
+                for name, value in (headers or {}).items():
+                    self.send_header(name, value)
+                self.end_headers()
+                self.wfile.write(body)
+
+            def do_POST(self):
+                length = int(self.headers.get('Content-Length', 0))
+                form = parse_qs(self.rfile.read(length).decode('utf-8'))
+                match = MESSAGES_PATH.match(urlparse(self.path).path)
+                if not match:
+                    self._send_json(404, {'code': 20404, 'message': 'Not Found', 'status': 404})
+                    return
+                auth_token = None
+                authorization = self.headers.get('Authorization', '')
+                if authorization.startswith('Basic '):
+                    credentials = base64.b64decode(authorization[6:]).decode('utf-8')
+                    auth_token = credentials.partition(':')[2]
+                status, headers, payload = provider._handle_message(match.group('sid'), form, auth_token)
+                self._send_json(status, payload, headers)
+
+            def do_GET(self):
+                url = urlparse(self.path)
+                if url.path == '/messages/last':
+                    to = parse_qs(url.query).get('to', [''])[0]
+                    with provider._lock:
+                        body = provider.last_messages.get(to)
+                    if body is None:
+                        self._send_json(404, {'error': 'No message for recipient'})
+                    else:
+                        self._send_json(200, {'to': to, 'body': body})
+                elif url.path == '/stats':
+                    self._send_json(200, provider.get_stats())
+                else:
+                    self._send_json(404, {'error': 'Not Found'})
+
+        return Handler
+
+def main():
+    parser = argparse.ArgumentParser(description="Local mock SMS provider (Twilio-compatible)")
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8081)
+    parser.add_argument('--latency-ms', type=float, default=0, help="Fixed latency added to each send")
+    parser.add_argument('--jitter-ms', type=float, default=0, help="Random extra latency (0..jitter)")
+    parser.add_argument('--error-rate', type=float, default=0.0, help="Fraction of sends answered with 500")
+    parser.add_argument('--throttle-rate', type=float, default=0.0, help="Fraction of sends answered with 429")
+    parser.add_argument('--retry-after', type=int, default=1, help="Retry-After seconds on 429 responses")
+    parser.add_argument('--max-rps', type=int, default=0, help="Throughput cap; sends above it get 429 (0 = no cap)")
+    parser.add_argument('--undelivered-rate', type=float, default=0.0,
+                        help="Fraction of accepted messages reported 'undelivered' to StatusCallback")
+    parser.add_argument('--callback-delay-ms', type=float, default=100, help="Delay before the final status callback")
+    parser.add_argument('--certfile', help="Serve HTTPS with this certificate (PEM)")
+    parser.add_argument('--keyfile', help="Private key for --certfile")
+    args = parser.parse_args()
+
+    MockSMSProvider(
+        host=args.host,
+        port=args.port,
+        latency_ms=args.latency_ms,
+        jitter_ms=args.jitter_ms,
+        error_rate=args.error_rate,
+        throttle_rate=args.throttle_rate,
+        retry_after=args.retry_after,
+        max_rps=args.max_rps,
+        certfile=args.certfile,
+        keyfile=args.keyfile,
+        undelivered_rate=args.undelivered_rate,
+        callback_delay_ms=args.callback_delay_ms
+    ).serve_forever()
+
+if __name__ == "__main__":
+    main()
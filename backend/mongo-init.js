@@ -7,8 +7,13 @@ db = db.getSiblingDB('alatem');
 // Create collections with proper indexes
 db.createCollection('users');
 db.createCollection('staff_users');
-db.createCollection('health_reports');
-db.createCollection('crime_reports');
+// Reports are time-series measurements: { timestamp, meta: { area, condition }, ... }
+db.createCollection('health_reports', {
+    timeseries: { timeField: 'timestamp', metaField: 'meta', granularity: 'hours' }
+});
+db.createCollection('crime_reports', {
+    timeseries: { timeField: 'timestamp', metaField: 'meta', granularity: 'hours' }
+});
 db.createCollection('sent_alerts');
 db.createCollection('predictions');
 
@@ -27,14 +32,13 @@ db.staff_users.createIndex({ "username": 1 }, { unique: true });
 db.staff_users.createIndex({ "is_active": 1 });
 
 // Health reports collection indexes
-db.health_reports.createIndex({ "area": 1, "condition": 1 });
+db.health_reports.createIndex({ "meta.area": 1, "meta.condition": 1, "timestamp": 1 });
 db.health_reports.createIndex({ "timestamp": 1 });
-db.health_reports.createIndex({ "area": 1, "timestamp": -1 });
 
 // Crime reports collection indexes
-db.crime_reports.createIndex({ "area": 1, "crime_type": 1 });
+db.crime_reports.createIndex({ "meta.area": 1, "crime_type": 1 });
+db.crime_reports.createIndex({ "meta.area": 1, "timestamp": 1 });
 db.crime_reports.createIndex({ "timestamp": 1 });
-db.crime_reports.createIndex({ "area": 1, "timestamp": -1 });
 
 // Sent alerts collection indexes
 db.sent_alerts.createIndex({ "area": 1, "timestamp": -1 });
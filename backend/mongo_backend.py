@@ -0,0 +1,640 @@
+"""
+MongoDB storage backend (production)
+"""
+from datetime import datetime, timedelta
+
+from config import Config
+from retention import load_policies, ttl_only
+from sqlite_storage import to_iso
+from storage_backend import StorageBackend
+
+# Conditional MongoDB import
+try:
+    from pymongo import MongoClient
+    from pymongo.errors import CollectionInvalid, ConnectionFailure, OperationFailure
+    MONGODB_AVAILABLE = True
+except ImportError:
+    MONGODB_AVAILABLE = False
+
+# Collections get_stats reports a total and a last-24h count for
+REPORT_COLLECTIONS = ('health_reports', 'crime_reports', 'sent_alerts', 'predictions')
+
+# Report collections stored as time-series (MongoDB 5.0+): name -> fields kept under the metaField
+TIME_SERIES = {
+    'health_reports': ('area', 'condition'),
+    'crime_reports': ('area',)
+}
+TIME_SERIES_OPTIONS = {"timeField": "timestamp", "metaField": "meta", "granularity": "hours"}
+
+def to_measurement(collection, report):
+    """Report -> time-series document: the series fields move under 'meta', timestamp becomes a date"""
+    if 'meta' in report and not any(field in report for field in TIME_SERIES[collection]):
+        return report  # already a measurement
+    doc = {key: value for key, value in report.items() if key not in TIME_SERIES[collection]}
+    doc['meta'] = {field: report.get(field) for field in TIME_SERIES[collection]}
+    timestamp = report.get('timestamp')
+    if isinstance(timestamp, str):
+        try:
+            timestamp = datetime.fromisoformat(to_iso(timestamp))
+        except ValueError:
+            timestamp = None
+    doc['timestamp'] = timestamp
+    return doc
+
+def from_measurement(doc):
+    """Time-series document -> report with the series fields back at the top level"""
+    report = {key: value for key, value in doc.items() if key != 'meta'}
+    report.update(doc.get('meta') or {})
+    return report
+
+class MongoBackend(StorageBackend):
+    kind = 'mongodb'
+    label = 'MongoDB Atlas'
+    use_mongodb = True
+
+    def __init__(self, uri=None, db_name=None):
+        """Connect and ping; raises when MongoDB is unreachable"""
+        self.client = MongoClient(uri or Config.MONGODB_URI)
+        self.db = self.client[db_name or Config.MONGODB_DB]
+        
+        # Test connection
+        self.client.admin.command('ping')
+        print("✅ MongoDB Atlas connected successfully!")
+        
+        # Collections
+        self.users = self.db.users
+        self.staff_users = self.db.staff_users
+        self.health_reports = self.db.health_reports
+        self.crime_reports = self.db.crime_reports
+        self.sent_alerts = self.db.sent_alerts
+        self.predictions = self.db.predictions
+        self.sms_jobs = self.db.sms_jobs
+        self.sms_retries = self.db.sms_retries
+        self.sms_dead_letters = self.db.sms_dead_letters
+        self.sms_deliveries = self.db.sms_deliveries
+        self.broadcast_keys = self.db.broadcast_keys
+        self.sms_send_windows = self.db.sms_send_windows
+        self.otps = self.db.otps
+        self.rate_limits = self.db.rate_limits
+        self.prediction_rollups = self.db.prediction_rollups
+        self.alert_rollups = self.db.alert_rollups
+        self.retention_leases = self.db.retention_leases
+        
+        # get_stats counts everything in one $unionWith aggregation until the server rejects it
+        self._union_stats = True
+        
+        # Report collections created before time-series support, not converted yet
+        self._plain_reports = set()
+        # Before the indexes, which would create the report collections as plain ones
+        for name in TIME_SERIES:
+            self._ensure_time_series(name)
+        
+        # Create indexes
+        self._create_indexes()
+    
+    def _create_indexes(self):
+        """Create database indexes for better performance"""
+        try:
+            self.users.create_index("phone", unique=True, background=True)
+            self.staff_users.create_index("username", unique=True, background=True)
+            self.predictions.create_index([("area", 1), ("date", -1)], background=True)
+            self.sent_alerts.create_index([("area", 1), ("timestamp", -1)], background=True)
+            self.health_reports.create_index("timestamp", background=True)
+            self.health_reports.create_index(
+                [("meta.area", 1), ("meta.condition", 1), ("timestamp", 1)], background=True
+            )
+            self.crime_reports.create_index("timestamp", background=True)
+            self.crime_reports.create_index([("meta.area", 1), ("timestamp", 1)], background=True)
+            self.sms_jobs.create_index("id", unique=True, background=True)
+            self.sms_retries.create_index("id", unique=True, background=True)
+            self.sms_dead_letters.create_index([("job_id", 1), ("status", 1)], background=True)
+            self.sms_deliveries.create_index("sid", unique=True, background=True)
+            self.sms_deliveries.create_index("job_id", background=True)
+            self.broadcast_keys.create_index("key", unique=True, background=True)
+            self.broadcast_keys.create_index("expires_at", expireAfterSeconds=0, background=True)
+            self.sms_send_windows.create_index("phone", unique=True, background=True)
+            self.sms_send_windows.create_index("expires_at", expireAfterSeconds=0, background=True)
+            self.otps.create_index("phone", unique=True, background=True)
+            self.otps.create_index("expires_at", expireAfterSeconds=0, background=True)
+            self.rate_limits.create_index([("key", 1), ("bucket", 1)], unique=True, background=True)
+            self.rate_limits.create_index("expires_at", expireAfterSeconds=0, background=True)
+            self.retention_leases.create_index("name", unique=True, background=True)
+            for rollups in (self.prediction_rollups, self.alert_rollups):
+                rollups.create_index("key", unique=True, background=True)
+                rollups.create_index([("area", 1), ("day", 1)], background=True)
+            for name, policy in load_policies().items():
+                self._ensure_timestamp_index(self.db[name], policy)
+            print("✅ Database indexes created")
+        except Exception as e:
+            print(f"⚠️ Index creation error: {e}")
+    
+    def _ensure_time_series(self, name):
+        """Create a missing report collection as time-series
+        
+        An existing plain collection is left as it is (documents are still
+        written as measurements, and queries also match the reports it holds
+        from before); migrate_reports_to_timeseries.py converts it. Problems
+        are reported, never raised, so MongoDB stays the backend.
+        """
+        try:
+            names = self.db.list_collection_names()
+            if f'{name}_legacy' in names:
+                print(f"⚠️ {name}: unfinished conversion, run migrate_reports_to_timeseries.py to resume it")
+            if name in names:
+                if 'timeseries' not in self.db[name].options():
+                    print(f"⚠️ {name} is a plain collection, run migrate_reports_to_timeseries.py to convert it")
+                    self._plain_reports.add(name)
+                return
+            self.db.create_collection(name, timeseries=TIME_SERIES_OPTIONS)
+        except CollectionInvalid:
+            pass  # created by another worker starting at the same time
+        except Exception as e:
+            # Time-series collections need MongoDB 5.0+ (mongomock has none)
+            print(f"⚠️ {name}: time-series collections unavailable ({e}), using a plain collection")
+    
+    def _ensure_timestamp_index(self, collection, policy):
+        """Timestamp index for retention scans; a TTL index when the policy only deletes"""
+        ttl = policy['raw_days'] * 86400 if ttl_only(policy) else None
+        existing = next(
+            (index for index in collection.index_information().values() if index['key'] == [("timestamp", 1)]),
+            None
+        )
+        if existing is not None and existing.get('expireAfterSeconds') != ttl:
+            # The policy changed since the index was built: rebuild it with the new expiry
+            collection.drop_index([("timestamp", 1)])
+            existing = None
+        if existing is None:
+            options = {'expireAfterSeconds': ttl} if ttl else {}
+            collection.create_index("timestamp", background=True, **options)
+    
+    # User Management Methods
+    def save_user(self, user_data):
+        return self.users.replace_one(
+            {"phone": user_data["phone"]}, 
+            user_data, 
+            upsert=True
+        )
+    
+    def find_user_by_phone(self, phone):
+        return self.users.find_one({"phone": phone})
+    
+    def update_user_verified(self, phone):
+        return self.users.update_one(
+            {"phone": phone}, 
+            {"$set": {"verified": True, "verified_at": datetime.utcnow()}}
+        )
+    
+    def update_user_sms_status(self, phone, message_type, status):
+        entry = {"status": status, "updated_at": datetime.utcnow()}
+        return self.users.update_one({"phone": phone}, {"$set": {f"sms_status.{message_type}": entry}})
+    
+    def get_users_by_area(self, area, verified_only=True):
+        query = {"area": area, "active": True}
+        if verified_only:
+            query["verified"] = True
+        return list(self.users.find(query))
+    
+    def get_users_by_areas(self, areas, verified_only=True):
+        query = {"area": {"$in": list(areas)}, "active": True}
+        if verified_only:
+            query["verified"] = True
+        return list(self.users.find(query, {"_id": 0, "phone": 1, "area": 1}))
+    
+    def get_area_stats(self):
+        pipeline = [
+            {"$match": {"verified": True, "active": True}},
+            {"$group": {"_id": "$area", "user_count": {"$sum": 1}}},
+            {"$sort": {"_id": 1}}
+        ]
+        return list(self.users.aggregate(pipeline))
+    
+    # Staff User Management
+    def save_staff_user(self, staff_data):
+        return self.staff_users.insert_one(staff_data)
+    
+    def find_staff_user(self, username):
+        user = self.staff_users.find_one({"username": username, "is_active": True})
+        if user is not None:
+            # Users inserted without an id (e.g. by hand) are identified by their _id
+            user.setdefault('id', str(user['_id']))
+        return user
+    
+    def _staff_filter(self, user_id):
+        from bson.objectid import ObjectId
+        if ObjectId.is_valid(user_id):
+            return {"$or": [{"id": user_id}, {"_id": ObjectId(user_id)}]}
+        return {"id": user_id}
+    
+    def update_staff_login(self, user_id, login_time):
+        return self.staff_users.update_one(
+            self._staff_filter(user_id), 
+            {"$set": {"last_login": login_time}}
+        )
+    
+    def update_staff_logins(self, logins):
+        if not logins:
+            return None
+        from pymongo import UpdateOne
+        return self.staff_users.bulk_write([
+            UpdateOne(self._staff_filter(user_id), {"$set": {"last_login": login_time}})
+            for user_id, login_time in logins.items()
+        ], ordered=False)
+    
+    # Reports Management (time-series measurements, see to_measurement)
+    def save_health_report(self, report_data):
+        return self.health_reports.insert_one(to_measurement('health_reports', report_data))
+    
+    def save_crime_report(self, report_data):
+        return self.crime_reports.insert_one(to_measurement('crime_reports', report_data))
+    
+    def get_recent_health_reports(self, area, condition, since_date):
+        return [from_measurement(doc) for doc in self.health_reports.find(
+            self._series_query('health_reports', since_date, area=area, condition=condition)
+        )]
+    
+    def get_recent_crime_reports(self, area, since_date):
+        return self.crime_reports.count_documents(self._series_query('crime_reports', since_date, area=area))
+    
+    def get_daily_health_report_counts(self, area, condition, since_date):
+        return self._daily_counts(
+            self.health_reports, self._series_query('health_reports', since_date, area=area, condition=condition)
+        )
+    
+    def get_daily_crime_report_counts(self, area, since_date):
+        return self._daily_counts(self.crime_reports, self._series_query('crime_reports', since_date, area=area))
+    
+    def _series_query(self, collection, since_date, **series):
+        """Reports of one series since since_date; in a plain collection, in either document shape"""
+        query = {f"meta.{field}": value for field, value in series.items()}
+        if collection in self._plain_reports:
+            # Reports saved before time-series support have the series fields at the top level
+            query = {"$or": [query, series]}
+        query["timestamp"] = {"$gte": since_date}
+        return query
+    
+    def _daily_counts(self, collection, match):
+        # One series and a time range: the server only unpacks the buckets in the window
+        return [{'day': doc['_id'], 'count': doc['count']} for doc in collection.aggregate([
+            {"$match": match},
+            {"$group": {
+                "_id": {"$dateToString": {"format": "%Y-%m-%d", "date": "$timestamp"}},
+                "count": {"$sum": 1}
+            }},
+            {"$sort": {"_id": 1}}
+        ])]
+    
+    # Alert Management
+    def save_alert(self, alert_data):
+        return self.sent_alerts.insert_one(alert_data)
+    
+    def save_alerts(self, alerts):
+        if not alerts:
+            return None
+        return self.sent_alerts.insert_many(alerts)
+    
+    def get_alerts_history(self, area, limit=50, alert_type=None):
+        query = {"area": area}
+        if alert_type:
+            query["alert_type"] = alert_type
+        
+        alerts = list(self.sent_alerts.find(
+            query,
+            sort=[("timestamp", -1)],
+            limit=limit
+        ))
+        
+        # Convert ObjectId to string
+        for alert in alerts:
+            if '_id' in alert:
+                alert['_id'] = str(alert['_id'])
+        return alerts
+    
+    def get_recent_alerts(self, hours=24, area=None):
+        since_date = datetime.utcnow() - timedelta(hours=hours)
+        
+        query = {"timestamp": {"$gte": since_date}}
+        if area:
+            query["area"] = area
+        
+        alerts = list(self.sent_alerts.find(
+            query,
+            sort=[("timestamp", -1)]
+        ))
+        
+        for alert in alerts:
+            if '_id' in alert:
+                alert['_id'] = str(alert['_id'])
+        return alerts
+    
+    # SMS Delivery Tracking
+    def save_sms_job(self, job_data):
+        return self.sms_jobs.replace_one({"id": job_data["id"]}, job_data, upsert=True)
+    
+    def update_sms_job(self, job_id, fields=None, increments=None):
+        update = {}
+        if fields:
+            update["$set"] = fields
+        if increments:
+            update["$inc"] = increments
+        return self.sms_jobs.update_one({"id": job_id}, update) if update else None
+    
+    def find_sms_job(self, job_id):
+        job = self.sms_jobs.find_one({"id": job_id})
+        if job and '_id' in job:
+            job['_id'] = str(job['_id'])
+        return job
+    
+    def save_sms_retry(self, retry_data):
+        return self.sms_retries.replace_one({"id": retry_data["id"]}, retry_data, upsert=True)
+    
+    def delete_sms_retry(self, retry_id):
+        return self.sms_retries.delete_one({"id": retry_id})
+    
+    def get_sms_retries(self):
+        return list(self.sms_retries.find({}, {"_id": 0}))
+    
+    def claim_sms_retries(self, owner, lease_expires_at):
+        expired = {"$or": [{"lease_expires_at": None}, {"lease_expires_at": {"$lte": datetime.utcnow().isoformat()}}]}
+        claimed = []
+        for retry in self.sms_retries.find(expired, {"_id": 0}):
+            # Conditional update: of several workers starting together only one takes each retry
+            lease = {"owner": owner, "lease_expires_at": to_iso(lease_expires_at)}
+            if self.sms_retries.update_one(dict(expired, id=retry['id']), {"$set": lease}).modified_count:
+                claimed.append(dict(retry, **lease))
+        return claimed
+    
+    def save_dead_letter(self, entry):
+        return self.sms_dead_letters.insert_one(entry)
+    
+    def save_dead_letters(self, entries):
+        if not entries:
+            return None
+        return self.sms_dead_letters.insert_many(entries)
+    
+    def get_dead_letters(self, job_id, status=None):
+        query = {"job_id": job_id}
+        if status:
+            query["status"] = status
+        return list(self.sms_dead_letters.find(query, {"_id": 0}, sort=[("failed_at", 1)]))
+    
+    def update_dead_letters(self, ids, fields):
+        return self.sms_dead_letters.update_many({"id": {"$in": list(ids)}}, {"$set": fields})
+    
+    def renew_sms_leases(self, owner, lease_expires_at, progress):
+        self.sms_retries.update_many({"owner": owner}, {"$set": {"lease_expires_at": to_iso(lease_expires_at)}})
+        if not progress:
+            return None
+        from pymongo import UpdateOne
+        return self.sms_jobs.bulk_write([
+            UpdateOne({"id": job_id, "owner": owner, "status": "running"},
+                      {"$set": dict(fields, lease_expires_at=to_iso(lease_expires_at))})
+            for job_id, fields in progress.items()
+        ], ordered=False)
+    
+    def claim_interrupted_sms_jobs(self, owner, lease_expires_at):
+        expired = {
+            "status": "running",
+            "$or": [{"lease_expires_at": None}, {"lease_expires_at": {"$lte": datetime.utcnow().isoformat()}}]
+        }
+        claimed = []
+        for job in self.sms_jobs.find(expired, {"_id": 0}):
+            # Conditional update: of several workers starting together only one takes each job
+            lease = {"owner": owner, "lease_expires_at": to_iso(lease_expires_at)}
+            if self.sms_jobs.update_one(dict(expired, id=job['id']), {"$set": lease}).modified_count:
+                claimed.append(dict(job, **lease))
+        return claimed
+    
+    def get_sms_deliveries(self, sids):
+        if not sids:
+            return {}
+        return {d['sid']: d for d in self.sms_deliveries.find({"sid": {"$in": list(sids)}}, {"_id": 0})}
+    
+    def save_sms_deliveries(self, updates):
+        if not updates:
+            return None
+        from pymongo import UpdateOne
+        operations = []
+        for sid, set_fields, insert_fields in updates:
+            update = {"$setOnInsert": dict(insert_fields, sid=sid)}
+            if set_fields:
+                update["$set"] = set_fields
+            operations.append(UpdateOne({"sid": sid}, update, upsert=True))
+        return self.sms_deliveries.bulk_write(operations, ordered=False)
+    
+    def increment_sms_job_delivery(self, job_id, increments):
+        return self.sms_jobs.update_one(
+            {"id": job_id},
+            {"$inc": {f"delivery.{status}": count for status, count in increments.items()}}
+        )
+    
+    # SMS Frequency Cap
+    def admit_sms_sends(self, phones, limit, window, now, bypass=False):
+        from pymongo import UpdateOne
+        from pymongo.errors import BulkWriteError
+        phones = list(dict.fromkeys(phones))
+        # sent_at holds the last `limit` sends: there is room when it is shorter or its oldest left the window
+        room = {"$or": [{f"sent_at.{limit - 1}": {"$exists": False}}, {"sent_at.0": {"$lte": now - window}}]}
+        update = {
+            "$push": {"sent_at": {"$each": [now], "$slice": -limit}},
+            "$set": {"expires_at": datetime.utcfromtimestamp(now + window)}
+        }
+        # A phone at its cap doesn't match, so its upsert hits the unique phone index. The same
+        # happens to a new phone another worker inserted first: try those once more
+        for attempt in range(2):
+            if not phones:
+                return []
+            try:
+                self.sms_send_windows.bulk_write([
+                    UpdateOne({"phone": phone} if bypass else dict(room, phone=phone), update, upsert=True)
+                    for phone in phones
+                ], ordered=False)
+                return []
+            except BulkWriteError as e:
+                errors = e.details.get('writeErrors', [])
+                if any(error.get('code') != 11000 for error in errors):
+                    raise
+                phones = [phones[error['index']] for error in errors]
+        return phones
+    
+    def release_sms_sends(self, phones, sent_at):
+        return self.sms_send_windows.update_many({"phone": {"$in": list(phones)}}, {"$pull": {"sent_at": sent_at}})
+    
+    # Broadcast Idempotency Keys
+    def claim_broadcast_key(self, key, record, expires_at):
+        now = datetime.utcnow()
+        from pymongo import ReturnDocument
+        document = dict(record, key=key, expires_at=expires_at)
+        for _ in range(2):
+            existing = self.broadcast_keys.find_one_and_update(
+                {"key": key},
+                {"$setOnInsert": document},
+                projection={"_id": 0},
+                upsert=True,
+                return_document=ReturnDocument.BEFORE
+            )
+            if existing is None:
+                return None
+            if existing['expires_at'] > now:
+                return existing
+            # Expired but not yet removed by the TTL monitor (runs every 60s)
+            self.broadcast_keys.delete_one({"key": key, "expires_at": existing['expires_at']})
+        return existing
+    
+    def find_broadcast_key(self, key):
+        now = datetime.utcnow()
+        return self.broadcast_keys.find_one({"key": key, "expires_at": {"$gt": now}}, {"_id": 0})
+    
+    def complete_broadcast_key(self, key, fields):
+        return self.broadcast_keys.update_one({"key": key}, {"$set": fields})
+    
+    def release_broadcast_key(self, key, job_id=None):
+        query = {"key": key}
+        if job_id is not None:
+            query["job_id"] = job_id
+        return self.broadcast_keys.delete_one(query)
+    
+    # Prediction Management
+    def save_prediction(self, prediction_data):
+        return self.predictions.replace_one(
+            {
+                "area": prediction_data["area"], 
+                "date": prediction_data["date"], 
+                "type": prediction_data["type"],
+                "condition": prediction_data.get("condition")
+            },
+            prediction_data,
+            upsert=True
+        )
+    
+    def get_latest_predictions(self, area=None, limit=20):
+        query = {}
+        if area:
+            query["area"] = area
+        
+        predictions = list(self.predictions.find(query).sort("timestamp", -1).limit(limit))
+        for pred in predictions:
+            if '_id' in pred:
+                pred['_id'] = str(pred['_id'])
+        return predictions
+    
+    # Retention
+    def get_oldest_timestamp(self, collection):
+        # Dates only: legacy string timestamps sort before dates and would never match a date range
+        oldest = self.db[collection].find_one(
+            {"timestamp": {"$type": "date"}}, {"timestamp": 1}, sort=[("timestamp", 1)]
+        )
+        return oldest['timestamp'] if oldest else None
+    
+    def get_records_between(self, collection, start, end):
+        return list(self.db[collection].find({"timestamp": {"$gte": start, "$lt": end}}, {"_id": 0}))
+    
+    def delete_records_between(self, collection, start, end):
+        return self.db[collection].delete_many({"timestamp": {"$gte": start, "$lt": end}}).deleted_count
+    
+    def save_rollups(self, collection, rollups):
+        if not rollups:
+            return None
+        from pymongo import ReplaceOne
+        return self.db[collection].bulk_write(
+            [ReplaceOne({"key": rollup['key']}, rollup, upsert=True) for rollup in rollups],
+            ordered=False
+        )
+    
+    def get_rollups(self, collection, area=None, since_day=None):
+        query = {}
+        if area:
+            query['area'] = area
+        if since_day:
+            query['day'] = {"$gte": since_day}
+        return list(self.db[collection].find(query, {"_id": 0}).sort("day", 1))
+    
+    def claim_retention_lease(self, owner, lease_expires_at):
+        from pymongo.errors import DuplicateKeyError
+        free = {"$or": [{"owner": owner}, {"lease_expires_at": {"$lte": datetime.utcnow().isoformat()}}]}
+        try:
+            self.retention_leases.update_one(
+                dict(free, name="retention"),
+                {"$set": {"owner": owner, "lease_expires_at": to_iso(lease_expires_at)}},
+                upsert=True
+            )
+        except DuplicateKeyError:
+            # Held by another worker: the upsert collided with its lease document
+            return False
+        return True
+    
+    # Statistics
+    def get_stats(self):
+        since = datetime.utcnow() - timedelta(days=1)
+        counts = None
+        if self._union_stats:
+            try:
+                counts = self._count_in_one_pipeline(since)
+            except (OperationFailure, NotImplementedError) as e:
+                # $unionWith needs MongoDB 4.4+ (and mongomock has none)
+                print(f"⚠️ $unionWith unavailable ({e}), counting stats per collection")
+                self._union_stats = False
+        if counts is None:
+            counts = self._count_per_collection(since)
+        
+        def count(key, stat='total'):
+            return counts.get(key, {}).get(stat, 0)
+        
+        return {
+            'users': {
+                'total': count('users'),
+                'verified': count('users', 'verified'),
+                'active': count('users', 'active')
+            },
+            'staff': {
+                'total': count('staff_users'),
+                'active': count('staff_users', 'active')
+            },
+            'reports': {
+                'health_reports': count('health_reports'),
+                'crime_reports': count('crime_reports'),
+                'alerts_sent': count('sent_alerts'),
+                'predictions': count('predictions')
+            },
+            'recent_activity': {
+                'health_reports_24h': count('health_reports', 'recent'),
+                'crime_reports_24h': count('crime_reports', 'recent'),
+                'alerts_sent_24h': count('sent_alerts', 'recent'),
+                'predictions_24h': count('predictions', 'recent')
+            }
+        }
+    
+    def _count_in_one_pipeline(self, since):
+        """Every get_stats counter in a single round trip: {collection: {stat: n}}
+        
+        Each collection is one $group pass, its flags and last-24h count
+        summed alongside the total. Empty collections produce no document.
+        """
+        def totals(name, **flags):
+            group = {"_id": name, "total": {"$sum": 1}}
+            for stat, condition in flags.items():
+                group[stat] = {"$sum": {"$cond": [condition, 1, 0]}}
+            return [{"$group": group}]
+        
+        recent = {"$gte": ["$timestamp", since]}
+        branches = [('staff_users', totals('staff_users', active={"$eq": ["$is_active", True]}))]
+        for name in REPORT_COLLECTIONS:
+            branches.append((name, totals(name, recent=recent)))
+        pipeline = totals('users', verified={"$eq": ["$verified", True]}, active={"$eq": ["$active", True]}) + [
+            {"$unionWith": {"coll": coll, "pipeline": branch}} for coll, branch in branches
+        ]
+        return {doc.pop('_id'): doc for doc in self.users.aggregate(pipeline)}
+    
+    def _count_per_collection(self, since):
+        """Fallback for servers without $unionWith: one $facet aggregation per collection"""
+        def facet(collection, **filters):
+            facets = {stat: [{"$match": query}, {"$count": "n"}] for stat, query in filters.items()}
+            result = next(collection.aggregate([{"$facet": facets}]), {})
+            return {stat: result[stat][0]['n'] if result.get(stat) else 0 for stat in filters}
+        
+        counts = {
+            'users': facet(self.users, total={}, verified={"verified": True}, active={"active": True}),
+            'staff_users': facet(self.staff_users, total={}, active={"is_active": True})
+        }
+        for name in REPORT_COLLECTIONS:
+            counts[name] = facet(self.db[name], total={}, recent={"timestamp": {"$gte": since}})
+        return counts
@@ -0,0 +1,206 @@
+"""
+OTP storage shared by every worker process
+
+/register and /verify can be served by different gunicorn workers, so OTPs
+live outside the process:
+
+- MongoOTPStore: the otps collection with a TTL index on expires_at
+  (production, whenever MongoDB is connected)
+- SQLiteOTPStore: a SQLite file next to the JSON data (OTP_SQLITE_PATH),
+  shared by the workers of one host; expired rows are deleted through the
+  expires_at index
+- MemoryOTPStore: per-process dict with an expiry heap (single process only)
+
+Expiry never scans every OTP: Mongo's TTL monitor, an indexed range delete
+or heap pops only touch the expired entries.
+"""
+import heapq
+import os
+import sqlite3
+import threading
+import time
+from datetime import datetime, timedelta
+
+from config import Config
+
+class MemoryOTPStore:
+    """Single-process store; expired OTPs are popped off a heap on each write"""
+
+    def __init__(self):
+        self._otps = {}  # phone -> {'otp', 'expires_at', 'attempts'}
+        self._expiry = []  # heap of (expires_at, phone)
+        self._lock = threading.Lock()
+
+    def put(self, phone, otp, ttl_seconds):
+        expires_at = time.time() + ttl_seconds
+        with self._lock:
+            self._purge(time.time())
+            self._otps[phone] = {'otp': str(otp), 'expires_at': expires_at, 'attempts': 0}
+            heapq.heappush(self._expiry, (expires_at, phone))
+
+    def get(self, phone):
+        with self._lock:
+            record = self._otps.get(phone)
+            if record is None:
+                return None
+            return {
+                'otp': record['otp'],
+                'attempts': record['attempts'],
+                'expired': record['expires_at'] <= time.time()
+            }
+
+    def add_attempt(self, phone):
+        with self._lock:
+            record = self._otps.get(phone)
+            if record is None:
+                return 0
+            record['attempts'] += 1
+            return record['attempts']
+
+    def delete(self, phone):
+        with self._lock:
+            self._otps.pop(phone, None)
+
+    def _purge(self, now):
+        # Caller holds the lock; heap entries of replaced OTPs are skipped
+        purged = 0
+        while self._expiry and self._expiry[0][0] <= now:
+            expires_at, phone = heapq.heappop(self._expiry)
+            record = self._otps.get(phone)
+            if record is not None and record['expires_at'] == expires_at:
+                del self._otps[phone]
+                purged += 1
+        return purged
+
+    def purge_expired(self):
+        with self._lock:
+            return self._purge(time.time())
+
+    def __len__(self):
+        return len(self._otps)
+
+class SQLiteOTPStore:
+    """OTPs in a SQLite file shared by the worker processes of one host"""
+
+    # Expired rows are deleted at most this often, by writers
+    PURGE_INTERVAL_SECONDS = 60
+
+    def __init__(self, path):
+        self.path = path
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._local = threading.local()
+        self._last_purge = 0.0
+        with self._connect() as conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS otps ("
+                "phone TEXT PRIMARY KEY, otp TEXT NOT NULL, "
+                "expires_at REAL NOT NULL, attempts INTEGER NOT NULL DEFAULT 0)"
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS otps_expires_at ON otps (expires_at)")
+
+    def _connect(self):
+        # One connection per thread; WAL lets readers and the writer work side by side
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=10)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def put(self, phone, otp, ttl_seconds):
+        now = time.time()
+        with self._connect() as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO otps (phone, otp, expires_at, attempts) VALUES (?, ?, ?, 0)",
+                (phone, str(otp), now + ttl_seconds)
+            )
+            if now - self._last_purge >= self.PURGE_INTERVAL_SECONDS:
+                self._last_purge = now
+                conn.execute("DELETE FROM otps WHERE expires_at <= ?", (now,))
+
+    def get(self, phone):
+        row = self._connect().execute(
+            "SELECT otp, attempts, expires_at FROM otps WHERE phone = ?", (phone,)
+        ).fetchone()
+        if row is None:
+            return None
+        return {'otp': row[0], 'attempts': row[1], 'expired': row[2] <= time.time()}
+
+    def add_attempt(self, phone):
+        with self._connect() as conn:
+            conn.execute("UPDATE otps SET attempts = attempts + 1 WHERE phone = ?", (phone,))
+            row = conn.execute("SELECT attempts FROM otps WHERE phone = ?", (phone,)).fetchone()
+        return row[0] if row else 0
+
+    def delete(self, phone):
+        with self._connect() as conn:
+            conn.execute("DELETE FROM otps WHERE phone = ?", (phone,))
+
+    def purge_expired(self):
+        with self._connect() as conn:
+            return conn.execute("DELETE FROM otps WHERE expires_at <= ?", (time.time(),)).rowcount
+
+    def __len__(self):
+        return self._connect().execute("SELECT COUNT(*) FROM otps").fetchone()[0]
+
+class MongoOTPStore:
+    """OTPs in MongoDB; the TTL index removes them once expires_at passes"""
+
+    def __init__(self, collection):
+        self.collection = collection
+
+    def put(self, phone, otp, ttl_seconds):
+        self.collection.replace_one(
+            {"phone": phone},
+            {
+                "phone": phone,
+                "otp": str(otp),
+                "expires_at": datetime.utcnow() + timedelta(seconds=ttl_seconds),
+                "attempts": 0
+            },
+            upsert=True
+        )
+
+    def get(self, phone):
+        record = self.collection.find_one({"phone": phone}, {"_id": 0})
+        if record is None:
+            return None
+        # The TTL monitor runs once a minute, so expired documents can linger
+        return {
+            'otp': record['otp'],
+            'attempts': record.get('attempts', 0),
+            'expired': record['expires_at'] <= datetime.utcnow()
+        }
+
+    def add_attempt(self, phone):
+        from pymongo import ReturnDocument
+        record = self.collection.find_one_and_update(
+            {"phone": phone},
+            {"$inc": {"attempts": 1}},
+            projection={"attempts": 1},
+            return_document=ReturnDocument.AFTER
+        )
+        return record['attempts'] if record else 0
+
+    def delete(self, phone):
+        self.collection.delete_one({"phone": phone})
+
+    def purge_expired(self):
+        return self.collection.delete_many({"expires_at": {"$lte": datetime.utcnow()}}).deleted_count
+
+    def __len__(self):
+        return self.collection.estimated_document_count()
+
+def build_otp_store(db_manager):
+    """OTP store for OTP_STORE: 'auto' (Mongo when connected, else SQLite), 'mongo', 'sqlite' or 'memory'"""
+    kind = Config.OTP_STORE
+    if kind == 'auto':
+        kind = 'mongo' if db_manager.use_mongodb else 'sqlite'
+    if kind == 'mongo':
+        return MongoOTPStore(db_manager.otps)
+    if kind == 'sqlite':
+        return SQLiteOTPStore(Config.OTP_SQLITE_PATH or os.path.join(Config.DATA_DIR, 'otp.sqlite3'))
+    return MemoryOTPStore()
@@ -0,0 +1,197 @@
+"""
+Opt-in request profiling for slow endpoints
+
+Two modes, both writing to Config.DATA_DIR/profiles:
+
+- cProfile: a deterministic profile of one request, taken for a random
+  PROFILE_SAMPLE_RATE fraction of requests or when a logged-in staff member
+  sends the X-Alatem-Profile header. Saved as .prof (pstats) plus a .txt
+  summary sorted by cumulative time.
+- Stack sampling: a background thread samples the stacks of in-flight
+  requests every PROFILE_SAMPLE_INTERVAL_MS; requests slower than
+  PROFILE_SLOW_MS keep their samples as a .folded file (flamegraph format).
+"""
+import cProfile
+import io
+import os
+import pstats
+import random
+import re
+import sys
+import threading
+import time
+from collections import Counter
+from datetime import datetime
+
+from flask import g, request, session
+
+from config import Config
+
+PROFILE_HEADER = 'X-Alatem-Profile'
+
+class StackSampler:
+    def __init__(self, interval=0.005):
+        self.interval = interval
+        self._tracked = {}
+        self._lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._thread = None
+
+    def track(self, thread_id):
+        """Start collecting samples for a request thread"""
+        with self._lock:
+            self._tracked[thread_id] = Counter()
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name='stack-sampler', daemon=True)
+                self._thread.start()
+        self._wakeup.set()
+
+    def untrack(self, thread_id):
+        """Stop collecting and return the samples for a request thread"""
+        with self._lock:
+            return self._tracked.pop(thread_id, Counter())
+
+    def _run(self):
+        while True:
+            with self._lock:
+                thread_ids = list(self._tracked)
+            if not thread_ids:
+                self._wakeup.clear()
+                self._wakeup.wait()
+                continue
+
+            frames = sys._current_frames()
+            for thread_id in thread_ids:
+                frame = frames.get(thread_id)
+                if frame is None:
+                    continue
+                stack = self._collapse(frame)
+                with self._lock:
+                    samples = self._tracked.get(thread_id)
+                    if samples is not None:
+                        samples[stack] += 1
+            time.sleep(self.interval)
+
+    @staticmethod
+    def _collapse(frame):
+        parts = []
+        while frame is not None:
+            code = frame.f_code
+            parts.append(f"{os.path.basename(code.co_filename)}:{code.co_name}:{frame.f_lineno}")
+            frame = frame.f_back
+        return ';'.join(reversed(parts))
+
+class RequestProfiler:
+    def __init__(self, output_dir=None):
+        self.output_dir = output_dir or os.path.join(Config.DATA_DIR, 'profiles')
+        self.sample_rate = Config.PROFILE_SAMPLE_RATE
+        self.slow_ms = Config.PROFILE_SLOW_MS
+        self.max_files = Config.PROFILE_MAX_FILES
+        self.endpoints = set(Config.PROFILE_ENDPOINTS)
+        self.sampler = StackSampler(Config.PROFILE_SAMPLE_INTERVAL_MS / 1000)
+
+    def _wants_profile(self, rule):
+        if self.endpoints and rule not in self.endpoints:
+            return False
+        if request.headers.get(PROFILE_HEADER) and 'staff_user_id' in session:
+            return True
+        return self.sample_rate > 0 and random.random() < self.sample_rate
+
+    def start(self):
+        """Begin profiling the current request if selected (before_request)"""
+        rule = request.url_rule.rule if request.url_rule else None
+        if rule is None or rule.startswith('/system/profiles'):
+            return
+
+        g.profile_start = time.perf_counter()
+        if self._wants_profile(rule):
+            profiler = cProfile.Profile()
+            try:
+                profiler.enable()
+                g.cprofile = profiler
+            except ValueError:
+                # Another profiler is already active on this thread
+                pass
+        if self.slow_ms > 0 and (not self.endpoints or rule in self.endpoints):
+            g.sampled_thread = threading.get_ident()
+            self.sampler.track(g.sampled_thread)
+
+    def finish(self, exc=None):
+        """Stop profiling and persist any captured profile (teardown_request)"""
+        start = g.pop('profile_start', None)
+        profiler = g.pop('cprofile', None)
+        sampled_thread = g.pop('sampled_thread', None)
+        if start is None:
+            return
+
+        duration_ms = (time.perf_counter() - start) * 1000
+        if profiler is not None:
+            profiler.disable()
+            self._write_cprofile(profiler, duration_ms)
+        if sampled_thread is not None:
+            samples = self.sampler.untrack(sampled_thread)
+            if duration_ms >= self.slow_ms and samples:
+                self._write_folded(samples, duration_ms)
+
+    def _base_name(self, duration_ms, kind):
+        endpoint = re.sub(r'[^A-Za-z0-9]+', '-', request.url_rule.rule).strip('-') or 'root'
+        stamp = datetime.utcnow().strftime('%Y%m%dT%H%M%S%f')
+        return f"{stamp}_{request.method}_{endpoint}_{int(duration_ms)}ms_{kind}"
+
+    def _write_cprofile(self, profiler, duration_ms):
+        try:
+            os.makedirs(self.output_dir, exist_ok=True)
+            base = os.path.join(self.output_dir, self._base_name(duration_ms, 'cprofile'))
+            profiler.dump_stats(base + '.prof')
+
+            summary = io.StringIO()
+            summary.write(f"{request.method} {request.path} took {duration_ms:.1f} ms\n\n")
+            pstats.Stats(profiler, stream=summary).sort_stats('cumulative').print_stats(40)
+            with open(base + '.txt', 'w', encoding='utf-8') as f:
+                f.write(summary.getvalue())
+            self._prune()
+        except Exception as e:
+            print(f"⚠️ Failed to write profile: {e}")
+
+    def _write_folded(self, samples, duration_ms):
+        try:
+            os.makedirs(self.output_dir, exist_ok=True)
+            path = os.path.join(self.output_dir, self._base_name(duration_ms, 'stacks') + '.folded')
+            with open(path, 'w', encoding='utf-8') as f:
+                for stack, count in samples.most_common():
+                    f.write(f"{stack} {count}\n")
+            self._prune()
+        except Exception as e:
+            print(f"⚠️ Failed to write stack samples: {e}")
+
+    def _prune(self):
+        """Keep only the newest max_files profiles"""
+        files = sorted(os.listdir(self.output_dir))
+        for name in files[:max(0, len(files) - self.max_files)]:
+            try:
+                os.remove(os.path.join(self.output_dir, name))
+            except OSError:
+                pass
+
+    def list_profiles(self):
+        """Index of captured profiles, newest first"""
+        if not os.path.isdir(self.output_dir):
+            return []
+
+        profiles = []
+        for name in sorted(os.listdir(self.output_dir), reverse=True):
+            match = re.match(r'^(\d{8}T\d{12})_([A-Z]+)_(.+)_(\d+)ms_(cprofile|stacks)\.(prof|txt|folded)$', name)
+            if not match:
+                continue
+            stamp, method, endpoint, duration, kind, ext = match.groups()
+            profiles.append({
+                'file': name,
+                'captured_at': datetime.strptime(stamp, '%Y%m%dT%H%M%S%f').isoformat(),
+                'method': method,
+                'endpoint': endpoint,
+                'duration_ms': int(duration),
+                'kind': kind,
+                'format': ext,
+                'size_bytes': os.path.getsize(os.path.join(self.output_dir, name))
+            })
+        return profiles
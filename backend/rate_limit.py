@@ -0,0 +1,216 @@
+"""
+Sliding-window rate limiting for public endpoints
+
+/register sends an OTP SMS and writes a user for every call, so a script
+hammering it burns SMS capacity that broadcasts need. RateLimiter.limit()
+wraps a route with three sliding windows, each "limit/seconds":
+
+- global   all callers together (RATE_LIMIT_GLOBAL)
+- ip       per client address (RATE_LIMIT_PER_IP)
+- phone    per phone number in the JSON body (RATE_LIMIT_PER_PHONE)
+
+Windows use the sliding-window counter approximation: a counter per fixed
+bucket, with the previous bucket weighted by how much of it still overlaps
+the window, so a check is two counter reads whatever the traffic. Counters
+live in memory (per process) or, with RATE_LIMIT_STORAGE=sqlite|mongo, in
+storage shared by every worker. Rejected calls get 429 with Retry-After.
+"""
+import math
+import os
+import sqlite3
+import threading
+import time
+from datetime import datetime, timedelta
+from functools import wraps
+
+from flask import jsonify, request
+
+from config import Config
+from metrics import RATE_LIMIT_REQUESTS, RATE_LIMIT_REJECTED
+
+def parse_limit(spec):
+    """'20/60' -> (20, 60.0); empty or '0/...' disables the window"""
+    if not spec:
+        return None
+    limit, _, seconds = spec.partition('/')
+    limit, seconds = int(limit), float(seconds or 1)
+    if limit <= 0 or seconds <= 0:
+        return None
+    return limit, seconds
+
+class MemoryCounterStore:
+    """Per-process bucket counters"""
+
+    def __init__(self):
+        self._counts = {}  # (key, bucket) -> count
+        self._lock = threading.Lock()
+        self._last_sweep = 0
+
+    def get(self, key, bucket):
+        with self._lock:
+            return self._counts.get((key, bucket), 0)
+
+    def incr(self, key, bucket, ttl_seconds):
+        now = time.time()
+        with self._lock:
+            self._counts[(key, bucket)] = self._counts.get((key, bucket), 0) + 1
+            if now - self._last_sweep >= ttl_seconds:
+                # Only the current and previous buckets are ever read
+                self._last_sweep = now
+                latest = {}
+                for k, b in self._counts:
+                    latest[k] = max(latest.get(k, b), b)
+                self._counts = {(k, b): c for (k, b), c in self._counts.items() if b >= latest[k] - 1}
+
+class SQLiteCounterStore:
+    """Bucket counters in a SQLite file shared by the workers of one host"""
+
+    def __init__(self, path):
+        self.path = path
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._local = threading.local()
+        self._last_sweep = 0.0
+        with self._connect() as conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS rate_limits ("
+                "key TEXT NOT NULL, bucket INTEGER NOT NULL, count INTEGER NOT NULL, "
+                "expires_at REAL NOT NULL, PRIMARY KEY (key, bucket))"
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS rate_limits_expires_at ON rate_limits (expires_at)")
+
+    def _connect(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=10)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def get(self, key, bucket):
+        row = self._connect().execute(
+            "SELECT count FROM rate_limits WHERE key = ? AND bucket = ?", (key, bucket)
+        ).fetchone()
+        return row[0] if row else 0
+
+    def incr(self, key, bucket, ttl_seconds):
+        now = time.time()
+        with self._connect() as conn:
+            conn.execute(
+                "INSERT INTO rate_limits (key, bucket, count, expires_at) VALUES (?, ?, 1, ?) "
+                "ON CONFLICT (key, bucket) DO UPDATE SET count = count + 1",
+                (key, bucket, now + ttl_seconds)
+            )
+            if now - self._last_sweep >= 60:
+                self._last_sweep = now
+                conn.execute("DELETE FROM rate_limits WHERE expires_at <= ?", (now,))
+
+class MongoCounterStore:
+    """Bucket counters in a MongoDB collection with a TTL index"""
+
+    def __init__(self, collection):
+        self.collection = collection
+
+    def get(self, key, bucket):
+        doc = self.collection.find_one({"key": key, "bucket": bucket}, {"count": 1})
+        return doc['count'] if doc else 0
+
+    def incr(self, key, bucket, ttl_seconds):
+        self.collection.update_one(
+            {"key": key, "bucket": bucket},
+            {
+                "$inc": {"count": 1},
+                "$setOnInsert": {"expires_at": datetime.utcnow() + timedelta(seconds=ttl_seconds)}
+            },
+            upsert=True
+        )
+
+def build_counter_store(db_manager):
+    """Counter store for RATE_LIMIT_STORAGE: 'memory', 'sqlite' or 'mongo'"""
+    kind = Config.RATE_LIMIT_STORAGE
+    if kind == 'mongo' and db_manager.use_mongodb:
+        return MongoCounterStore(db_manager.rate_limits)
+    if kind in ('sqlite', 'mongo'):
+        return SQLiteCounterStore(Config.RATE_LIMIT_SQLITE_PATH or os.path.join(Config.DATA_DIR, 'rate_limits.sqlite3'))
+    return MemoryCounterStore()
+
+class RateLimiter:
+    def __init__(self, store, rules=None):
+        self.store = store
+        if rules is None:
+            rules = {
+                'global': Config.RATE_LIMIT_GLOBAL,
+                'ip': Config.RATE_LIMIT_PER_IP,
+                'phone': Config.RATE_LIMIT_PER_PHONE
+            }
+        self.rules = {scope: parse_limit(spec) for scope, spec in rules.items()}
+
+    def _estimate(self, key, window):
+        """Requests in the sliding window ending now, and the bucket timing"""
+        now = time.time()
+        bucket = int(now // window)
+        elapsed = (now - bucket * window) / window
+        current = self.store.get(key, bucket)
+        previous = self.store.get(key, bucket - 1)
+        return current, previous, bucket, elapsed
+
+    def _retry_after(self, limit, window, current, previous, elapsed):
+        """Seconds until the estimate drops below the limit"""
+        if current >= limit:
+            # Wait out this bucket, then until enough of it has slid away
+            wait = (1 - elapsed) * window + window * (1 - limit / (current + 1))
+        else:
+            wait = window * (1 - (limit - current) / previous) - elapsed * window
+        return max(1, math.ceil(wait))
+
+    def check(self, endpoint, ip=None, phone=None):
+        """Count one request; returns (allowed, scope that rejected it, retry_after seconds)"""
+        if not Config.RATE_LIMIT_ENABLED:
+            return True, None, 0
+        subjects = {'global': '*', 'ip': ip, 'phone': phone}
+        windows = []
+        for scope, rule in self.rules.items():
+            if rule is None or not subjects.get(scope):
+                continue
+            limit, window = rule
+            key = f"{endpoint}:{scope}:{subjects[scope]}"
+            current, previous, bucket, elapsed = self._estimate(key, window)
+            if previous * (1 - elapsed) + current >= limit:
+                RATE_LIMIT_REJECTED.inc(endpoint=endpoint, scope=scope)
+                RATE_LIMIT_REQUESTS.inc(endpoint=endpoint, result='rejected')
+                return False, scope, self._retry_after(limit, window, current, previous, elapsed)
+            windows.append((key, bucket, window))
+
+        # Only admitted requests are counted
+        for key, bucket, window in windows:
+            self.store.incr(key, bucket, 2 * window)
+        RATE_LIMIT_REQUESTS.inc(endpoint=endpoint, result='allowed')
+        return True, None, 0
+
+    def limit(self, endpoint):
+        """Decorator: reject the route with 429 once a window is full"""
+        def decorator(f):
+            @wraps(f)
+            def decorated_function(*args, **kwargs):
+                data = request.get_json(silent=True) or {}
+                phone = ''.join(ch for ch in str(data.get('phone', '')) if ch.isdigit())
+                try:
+                    allowed, scope, retry_after = self.check(endpoint, ip=request.remote_addr, phone=phone)
+                except Exception as e:
+                    # Never take registration down with the limiter's storage
+                    print(f"⚠️ Rate limiter unavailable: {e}")
+                    allowed = True
+                if not allowed:
+                    response = jsonify({
+                        'success': False,
+                        'error': 'Too many requests, please try again later',
+                        'limit': scope,
+                        'retry_after': retry_after
+                    })
+                    response.headers['Retry-After'] = str(retry_after)
+                    return response, 429
+                return f(*args, **kwargs)
+            return decorated_function
+        return decorator
@@ -0,0 +1,246 @@
+"""
+Retention, rollup and archival for predictions and sent alerts
+
+Each retained collection has a policy (RETENTION_POLICIES overrides the
+defaults below):
+
+    raw_days  keep raw records this many days
+    rollup    before deleting, fold the day into daily per-area summaries
+              (prediction_rollups / alert_rollups)
+    archive   before deleting, write the day's raw records to
+              RETENTION_ARCHIVE_DIR/<collection>/<YYYY-MM-DD>.json.gz
+
+RetentionEngine processes expired data one whole day at a time: archive,
+replace that day's summaries, then delete the day's raw records. Every worker
+starts an engine, but a run first takes the retention lease in storage for one
+interval: the worker holding it does the runs and the others skip theirs until
+it lapses (the holder stopped).
+
+Re-running a day that was interrupted before its delete recomputes the same
+summaries from the same records, and merges into the archive file already
+written. A day with no records left (another run got to it first) is neither
+archived nor rolled up, so an archive is never replaced by an empty one.
+
+On MongoDB a policy with neither rollup nor archive is left to a TTL index
+on timestamp (MongoBackend creates it) instead of the engine.
+"""
+import gzip
+import json
+import os
+import socket
+import threading
+import time
+import uuid
+from datetime import datetime, timedelta
+
+from config import Config
+from metrics import RETENTION_RECORDS
+from sqlite_storage import to_iso
+
+DEFAULT_POLICIES = {
+    'predictions': {'raw_days': 30, 'rollup': True, 'archive': True},
+    'sent_alerts': {'raw_days': 365, 'rollup': True, 'archive': True}
+}
+
+ROLLUP_COLLECTIONS = {
+    'predictions': 'prediction_rollups',
+    'sent_alerts': 'alert_rollups'
+}
+
+def load_policies():
+    """Policies per collection: the defaults with RETENTION_POLICIES (JSON) applied"""
+    policies = {name: dict(policy) for name, policy in DEFAULT_POLICIES.items()}
+    if Config.RETENTION_POLICIES:
+        for name, overrides in json.loads(Config.RETENTION_POLICIES).items():
+            if name not in policies:
+                raise ValueError(f"No retention support for collection '{name}'")
+            policies[name].update(overrides)
+    return policies
+
+def ttl_only(policy):
+    """Whether a policy only deletes, so a Mongo TTL index can enforce it"""
+    return policy['raw_days'] > 0 and not policy.get('rollup') and not policy.get('archive')
+
+# ======================
+# ROLLUPS
+# ======================
+
+def _day(record):
+    stamp = to_iso(record.get('timestamp'))
+    return stamp[:10] if isinstance(stamp, str) else None
+
+def rollup_predictions(records):
+    """Daily summaries per area, prediction type and condition"""
+    groups = {}
+    for record in records:
+        day = _day(record)
+        if day is None:
+            continue
+        key = f"{day}|{record.get('area')}|{record.get('type')}|{record.get('condition')}"
+        summary = groups.get(key)
+        if summary is None:
+            summary = groups[key] = {
+                'key': key, 'day': day, 'area': record.get('area'),
+                'type': record.get('type'), 'condition': record.get('condition'),
+                'predictions': 0, 'max_probability': 0.0, 'probability_sum': 0.0,
+                'forecast_days': 0, 'high_risk_days': 0, 'max_predicted_cases': 0
+            }
+        summary['predictions'] += 1
+        for forecast in record.get('predictions') or []:
+            probability = forecast.get('outbreak_probability') or 0.0
+            summary['forecast_days'] += 1
+            summary['probability_sum'] += probability
+            summary['max_probability'] = max(summary['max_probability'], probability)
+            summary['max_predicted_cases'] = max(summary['max_predicted_cases'], forecast.get('predicted_cases') or 0)
+            if str(forecast.get('risk_level', '')).upper() == 'HIGH':
+                summary['high_risk_days'] += 1
+    for summary in groups.values():
+        forecast_days = summary['forecast_days']
+        summary['avg_probability'] = round(summary.pop('probability_sum') / forecast_days, 4) if forecast_days else 0.0
+    return list(groups.values())
+
+def rollup_alerts(records):
+    """Daily summaries per area and alert type"""
+    groups = {}
+    for record in records:
+        day = _day(record)
+        if day is None:
+            continue
+        key = f"{day}|{record.get('area')}|{record.get('alert_type')}"
+        summary = groups.get(key)
+        if summary is None:
+            summary = groups[key] = {
+                'key': key, 'day': day, 'area': record.get('area'), 'alert_type': record.get('alert_type'),
+                'alerts': 0, 'recipients': 0, 'failed': 0, 'capped': 0, 'ml_triggered': 0
+            }
+        summary['alerts'] += 1
+        summary['recipients'] += record.get('recipients_count') or 0
+        summary['failed'] += record.get('failed_count') or 0
+        summary['capped'] += record.get('capped_count') or 0
+        if record.get('is_ml_triggered'):
+            summary['ml_triggered'] += 1
+    return list(groups.values())
+
+ROLLUPS = {
+    'predictions': rollup_predictions,
+    'sent_alerts': rollup_alerts
+}
+
+def _archive_key(record):
+    """Identity of a record in an archive file, which holds records as json.dump(default=str) wrote them"""
+    return record.get('id') or json.dumps(record, sort_keys=True, default=str)
+
+# ======================
+# ENGINE
+# ======================
+
+class RetentionEngine:
+    def __init__(self, db, policies=None, archive_dir=None, interval=None):
+        self.db = db
+        self.policies = load_policies() if policies is None else policies
+        self.archive_dir = archive_dir or Config.RETENTION_ARCHIVE_DIR or os.path.join(Config.DATA_DIR, 'archive')
+        self.interval = interval or Config.RETENTION_INTERVAL_HOURS * 3600
+        self._lock = threading.Lock()
+        self._thread = None
+        self.owner = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+        self.stats = {
+            'runs': 0, 'skipped_runs': 0, 'last_run': None, 'last_duration_ms': None, 'last_error': None,
+            'days_processed': 0, 'archived': 0, 'rolled_up': 0, 'deleted': 0
+        }
+
+    def start(self):
+        """Run in a background thread every RETENTION_INTERVAL_HOURS (first run after a short delay)"""
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name='retention', daemon=True)
+                self._thread.start()
+
+    def _run(self):
+        # Stay out of the way of startup
+        time.sleep(Config.RETENTION_START_DELAY_SECONDS)
+        while True:
+            try:
+                self.run_once()
+            except Exception as e:
+                self.stats['last_error'] = str(e)
+                print(f"⚠️ Retention run failed: {e}")
+            time.sleep(self.interval)
+
+    def run_once(self, now=None):
+        """Apply every policy; returns {collection: days processed}, or None when another worker holds the lease"""
+        now = now or datetime.utcnow()
+        start = time.perf_counter()
+        processed = {}
+        with self._lock:
+            if not self.db.claim_retention_lease(self.owner, datetime.utcnow() + timedelta(seconds=self.interval)):
+                self.stats['skipped_runs'] += 1
+                return None
+            for collection, policy in self.policies.items():
+                if policy['raw_days'] <= 0:
+                    continue
+                if self.db.use_mongodb and ttl_only(policy):
+                    continue  # the TTL index expires these
+                processed[collection] = self._apply(collection, policy, now)
+            self.stats['runs'] += 1
+            self.stats['last_run'] = now.isoformat()
+            self.stats['last_duration_ms'] = round((time.perf_counter() - start) * 1000, 1)
+            self.stats['last_error'] = None
+        if any(processed.values()):
+            print(f"🗃️ Retention: processed {processed} expired day(s)")
+        return processed
+
+    def _apply(self, collection, policy, now):
+        # Whole days only: everything before midnight raw_days ago
+        cutoff = now.replace(hour=0, minute=0, second=0, microsecond=0) - timedelta(days=policy['raw_days'])
+        days = 0
+        while True:
+            # Jump straight to the oldest remaining day, skipping gaps
+            oldest = self.db.get_oldest_timestamp(collection)
+            if oldest is None:
+                break
+            day = datetime.fromisoformat(to_iso(oldest)[:10])
+            if day >= cutoff:
+                break
+            next_day = day + timedelta(days=1)
+            records = self.db.get_records_between(collection, day, next_day)
+            if records and policy.get('archive'):
+                self._archive(collection, day, records)
+                self.stats['archived'] += len(records)
+                RETENTION_RECORDS.inc(len(records), collection=collection, action='archived')
+            if records and policy.get('rollup'):
+                self.db.save_rollups(ROLLUP_COLLECTIONS[collection], ROLLUPS[collection](records))
+                self.stats['rolled_up'] += len(records)
+                RETENTION_RECORDS.inc(len(records), collection=collection, action='rolled_up')
+            deleted = self.db.delete_records_between(collection, day, next_day)
+            self.stats['deleted'] += deleted
+            RETENTION_RECORDS.inc(deleted, collection=collection, action='deleted')
+            if not deleted:
+                # The oldest record isn't in its own day's range (unexpected timestamp type); don't spin
+                print(f"⚠️ Retention: could not delete {collection} records of {day.date()}, stopping")
+                break
+            days += 1
+            self.stats['days_processed'] += 1
+        return days
+
+    def _archive(self, collection, day, records):
+        directory = os.path.join(self.archive_dir, collection)
+        os.makedirs(directory, exist_ok=True)
+        path = os.path.join(directory, f"{day.strftime('%Y-%m-%d')}.json.gz")
+        if os.path.exists(path):
+            # Written by a run interrupted before its delete: keep what it archived
+            with gzip.open(path, 'rt', encoding='utf-8') as f:
+                archived = json.load(f)
+            keys = {_archive_key(record) for record in records}
+            records = [record for record in archived if _archive_key(record) not in keys] + records
+        tmp = path + '.tmp'
+        with gzip.open(tmp, 'wt', encoding='utf-8') as f:
+            json.dump(records, f, default=str)
+        os.replace(tmp, path)
+
+    def get_stats(self):
+        return {
+            'policies': self.policies,
+            'archive_dir': self.archive_dir,
+            'interval_hours': self.interval / 3600,
+            **self.stats
+        }
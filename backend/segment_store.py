@@ -0,0 +1,256 @@
+"""
+Time-partitioned JSON segments for append-mostly collections
+
+The JSON backend kept sent_alerts, health_reports and crime_reports as one
+ever-growing array each, so "last 24 hours" parsed the whole history.
+SegmentStore splits a collection into one file per day (or month) under
+data/segments/<collection>/, with a manifest recording each segment's record
+count and first/last timestamp:
+
+    data/segments/sent_alerts/manifest.json
+    data/segments/sent_alerts/2026-10-17.json
+    data/segments/sent_alerts/2026-09-30.json.gz     (compressed)
+    data/segments/sent_alerts/archive/2026-01-03.json.gz
+
+Range queries open only the segments whose [first, last] overlaps the range;
+"newest N" reads walk segments newest-first and stop once they have enough.
+Segments older than SEGMENT_COMPRESS_AFTER_DAYS are gzipped, and with
+SEGMENT_ARCHIVE_AFTER_DAYS set they move to archive/ and leave the queried
+set (the manifest keeps a record of them).
+"""
+import gzip
+import json
+import os
+import shutil
+import threading
+from datetime import datetime
+
+from sqlite_storage import json_default, to_iso
+
+UNDATED = 'undated'
+
+class SegmentStore:
+    def __init__(self, directory, granularity='day', compress_after_days=30, archive_after_days=0):
+        self.directory = directory
+        self.granularity = granularity
+        self.compress_after_days = compress_after_days
+        self.archive_after_days = archive_after_days
+        self.manifest_path = os.path.join(directory, 'manifest.json')
+        self._lock = threading.RLock()
+        os.makedirs(directory, exist_ok=True)
+        self._manifest = self._load_manifest()
+
+    # ======================
+    # MANIFEST
+    # ======================
+
+    def _load_manifest(self):
+        if os.path.exists(self.manifest_path):
+            with open(self.manifest_path, 'r', encoding='utf-8') as f:
+                return json.load(f)
+        return {'granularity': self.granularity, 'segments': {}, 'archived': {}}
+
+    def _save_manifest(self):
+        tmp = self.manifest_path + '.tmp'
+        with open(tmp, 'w', encoding='utf-8') as f:
+            json.dump(self._manifest, f, indent=2)
+        os.replace(tmp, self.manifest_path)
+
+    @property
+    def exists(self):
+        return os.path.exists(self.manifest_path)
+
+    def segment_key(self, timestamp):
+        """Segment a record belongs to: 'YYYY-MM-DD' (or 'YYYY-MM'), 'undated' without a usable timestamp"""
+        iso = to_iso(timestamp)
+        if not isinstance(iso, str) or len(iso) < 10 or iso[4] != '-':
+            return UNDATED
+        return iso[:7] if self._manifest['granularity'] == 'month' else iso[:10]
+
+    # ======================
+    # SEGMENT FILES
+    # ======================
+
+    def _path(self, entry):
+        return os.path.join(self.directory, entry['file'])
+
+    def _read(self, entry):
+        path = self._path(entry)
+        if not os.path.exists(path):
+            return []
+        opener = gzip.open if entry.get('compressed') else open
+        try:
+            with opener(path, 'rt', encoding='utf-8') as f:
+                return json.load(f)
+        except (json.JSONDecodeError, OSError) as e:
+            print(f"⚠️ Unreadable segment {path}: {e}")
+            return []
+
+    def _write(self, key, records, compressed):
+        filename = f'{key}.json.gz' if compressed else f'{key}.json'
+        opener = gzip.open if compressed else open
+        tmp = os.path.join(self.directory, filename + '.tmp')
+        with opener(tmp, 'wt', encoding='utf-8') as f:
+            json.dump(records, f, default=json_default)
+        os.replace(tmp, os.path.join(self.directory, filename))
+        stamps = [to_iso(r.get('timestamp')) for r in records]
+        stamps = [s for s in stamps if isinstance(s, str)]
+        return {
+            'file': filename,
+            'count': len(records),
+            'first': min(stamps) if stamps else None,
+            'last': max(stamps) if stamps else None,
+            'compressed': compressed
+        }
+
+    # ======================
+    # WRITES
+    # ======================
+
+    def append(self, records):
+        """Add records to their segments; only the touched segment files are rewritten"""
+        by_key = {}
+        for record in records:
+            by_key.setdefault(self.segment_key(record.get('timestamp')), []).append(record)
+        with self._lock:
+            opened_new = False
+            for key, batch in by_key.items():
+                entry = self._manifest['segments'].get(key)
+                existing = self._read(entry) if entry else []
+                opened_new = opened_new or entry is None
+                new_entry = self._write(key, existing + batch, entry.get('compressed', False) if entry else False)
+                if entry and entry['file'] != new_entry['file']:
+                    os.remove(self._path(entry))
+                self._manifest['segments'][key] = new_entry
+            self._save_manifest()
+            if opened_new:
+                # A new day/month started: older segments may now be due for compression or archival
+                self.maintain()
+        return True
+
+    def maintain(self, now=None):
+        """Compress and archive old segments per the configured ages; returns (compressed, archived)"""
+        now = now or datetime.utcnow()
+        compressed = archived = 0
+        with self._lock:
+            for key in sorted(self._manifest['segments']):
+                entry = self._manifest['segments'][key]
+                if key == UNDATED or not entry.get('last'):
+                    continue
+                age_days = (now - datetime.fromisoformat(entry['last'])).days
+                if self.archive_after_days and age_days >= self.archive_after_days:
+                    self._archive(key, entry)
+                    archived += 1
+                elif self.compress_after_days and age_days >= self.compress_after_days and not entry.get('compressed'):
+                    records = self._read(entry)
+                    self._manifest['segments'][key] = self._write(key, records, True)
+                    os.remove(self._path(entry))
+                    compressed += 1
+            if compressed or archived:
+                self._save_manifest()
+        return compressed, archived
+
+    def _archive(self, key, entry):
+        # Caller holds the lock; archived segments are always stored compressed
+        if not entry.get('compressed'):
+            records = self._read(entry)
+            os.remove(self._path(entry))
+            entry = self._write(key, records, True)
+        archive_dir = os.path.join(self.directory, 'archive')
+        os.makedirs(archive_dir, exist_ok=True)
+        shutil.move(self._path(entry), os.path.join(archive_dir, entry['file']))
+        del self._manifest['segments'][key]
+        self._manifest['archived'][key] = dict(entry, archived_at=datetime.utcnow().isoformat())
+
+    def delete_between(self, start, end):
+        """Remove records with start <= timestamp < end, rewriting only the overlapping segments"""
+        start, end = to_iso(start), to_iso(end)
+        deleted = 0
+        with self._lock:
+            for key, entry in list(self.segments(start, end)):
+                if key == UNDATED:
+                    continue
+                records = self._read(entry)
+                kept = [r for r in records if not start <= (to_iso(r.get('timestamp')) or '') < end]
+                if len(kept) == len(records):
+                    continue
+                deleted += len(records) - len(kept)
+                if kept:
+                    self._manifest['segments'][key] = self._write(key, kept, entry.get('compressed', False))
+                else:
+                    os.remove(self._path(entry))
+                    del self._manifest['segments'][key]
+            if deleted:
+                self._save_manifest()
+        return deleted
+
+    # ======================
+    # READS
+    # ======================
+
+    def segments(self, since=None, until=None, newest_first=False):
+        """(key, manifest entry) of the live segments overlapping [since, until]"""
+        since, until = to_iso(since), to_iso(until)
+        with self._lock:
+            # Undated records sort before everything, like a missing timestamp
+            items = sorted(
+                self._manifest['segments'].items(),
+                key=lambda item: '' if item[0] == UNDATED else item[0],
+                reverse=newest_first
+            )
+        for key, entry in items:
+            if key == UNDATED:
+                # No timestamps to compare, so only unbounded scans see them
+                if since is None and until is None:
+                    yield key, entry
+                continue
+            if since is not None and entry['last'] is not None and entry['last'] < since:
+                continue
+            if until is not None and entry['first'] is not None and entry['first'] > until:
+                continue
+            yield key, entry
+
+    def oldest(self):
+        """Earliest timestamp among the live segments (None when empty)"""
+        with self._lock:
+            firsts = [e['first'] for k, e in self._manifest['segments'].items() if k != UNDATED and e['first']]
+        return min(firsts) if firsts else None
+
+    def read_segment(self, entry):
+        return self._read(entry)
+
+    def query(self, since=None, until=None):
+        """Records with since <= timestamp <= until, reading only the overlapping segments"""
+        since_iso, until_iso = to_iso(since), to_iso(until)
+        for _, entry in self.segments(since, until):
+            for record in self._read(entry):
+                if since_iso is None and until_iso is None:
+                    yield record
+                    continue
+                stamp = to_iso(record.get('timestamp'))
+                if not isinstance(stamp, str):
+                    continue
+                if (since_iso is None or stamp >= since_iso) and (until_iso is None or stamp <= until_iso):
+                    yield record
+
+    def latest(self, predicate, limit):
+        """Newest records matching predicate, reading segments newest-first until limit is reached"""
+        found = []
+        for _, entry in self.segments(newest_first=True):
+            matches = [r for r in self._read(entry) if predicate(r)]
+            matches.sort(key=lambda r: to_iso(r.get('timestamp')) or '', reverse=True)
+            found.extend(matches)
+            if len(found) >= limit:
+                break
+        return found[:limit]
+
+    def count(self, since=None):
+        """Number of live records; segments entirely inside the range are counted from the manifest"""
+        since_iso = to_iso(since)
+        total = 0
+        for _, entry in self.segments(since):
+            if since_iso is None or (entry['first'] is not None and entry['first'] >= since_iso):
+                total += entry['count']
+            else:
+                total += sum(1 for r in self._read(entry) if (to_iso(r.get('timestamp')) or '') >= since_iso)
+        return total
@@ -0,0 +1,627 @@
+"""
+Prioritized SMS dispatch
+
+Two lanes share one pool of sender threads:
+
+- transactional: OTPs and welcome messages. Served first by every worker,
+  and SMS_RESERVED_WORKERS threads serve nothing else, so a verification
+  code never waits behind a broadcast that is already in flight.
+- broadcast: bulk alert jobs, paced by a token bucket (the providers'
+  combined rate, or SMS_BROADCAST_RATE_PER_SECOND) and shared between concurrent jobs with
+  deficit round robin, so a large broadcast cannot starve a smaller one
+  (a job with weight 2 gets twice the share of a job with weight 1).
+
+Transient failures (429, 5xx, network errors) are retried with jittered
+exponential backoff, or after the provider's Retry-After. Broadcast retries are persisted
+so they survive a restart (leased like jobs, below, so only one starting
+process re-queues each), and messages that exhaust SMS_MAX_ATTEMPTS are
+written to the dead-letter store for inspection and re-drive.
+
+With a FrequencyCap, a job's recipients are checked in bulk on submission
+and those over their per-phone cap are skipped (counted as 'capped');
+recipients that end up dead-lettered are uncounted again.
+
+A job's record is leased to the process sending it, which renews the lease
+and checkpoints how far down the recipient list it got every
+SMS_LEASE_SECONDS / 3. When a process stops mid-job the lease runs out; the
+next process to start marks the job 'interrupted' and dead-letters the
+recipients it never reached, so they can be re-driven. Those reached after the
+last checkpoint are dead-lettered too and get the message again if re-driven.
+"""
+import heapq
+import itertools
+import os
+import random
+import socket
+import threading
+import time
+import uuid
+from collections import deque
+from concurrent.futures import Future
+from datetime import datetime, timedelta
+
+from config import Config
+from metrics import SMS_QUEUE_DEPTH, SMS_QUEUE_WAIT, SMS_RETRIES, SMS_DEAD_LETTERS
+from sms_providers import SMSDeliveryError
+
+TRANSACTIONAL = 'transactional'
+BROADCAST = 'broadcast'
+
+class RetryPolicy:
+    def __init__(self, max_attempts=None, base_delay=None, max_delay=None):
+        self.max_attempts = max_attempts or Config.SMS_MAX_ATTEMPTS
+        self.base_delay = Config.SMS_RETRY_BASE_SECONDS if base_delay is None else base_delay
+        self.max_delay = Config.SMS_RETRY_MAX_SECONDS if max_delay is None else max_delay
+
+    def should_retry(self, error, attempt):
+        return error.retryable and attempt < self.max_attempts
+
+    def delay(self, error, attempt):
+        """Seconds before the next attempt (attempt = attempts made so far)"""
+        if error.retry_after:
+            # Honor the provider, with a little jitter so workers don't retry in lockstep
+            return error.retry_after + random.uniform(0, self.base_delay)
+        # Equal jitter: half the exponential backoff plus a random half
+        backoff = min(self.max_delay, self.base_delay * 2 ** (attempt - 1))
+        return backoff / 2 + random.uniform(0, backoff / 2)
+
+class TokenBucket:
+    def __init__(self, rate, burst=None):
+        self.rate = rate
+        self.capacity = burst or max(1.0, rate)
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+
+    def delay(self):
+        """Seconds until a token is available (0 = take one now); caller holds the lock"""
+        if self.rate <= 0:
+            return 0.0
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        if self.tokens >= 1:
+            return 0.0
+        return (1 - self.tokens) / self.rate
+
+    def take(self):
+        if self.rate > 0:
+            self.tokens -= 1
+
+class BroadcastJob:
+    def __init__(self, phones, encoded, weight=1, job_id=None, attempts=None, capped=None):
+        self.id = job_id or str(uuid.uuid4())
+        self.encoded = encoded
+        self.weight = max(1, int(weight))
+        self.total = len(phones)
+        # (phone, attempts made so far)
+        self.pending = deque((phone, (attempts or {}).get(phone, 0)) for phone in phones)
+        self.enqueued_at = time.monotonic()
+        self.deficit = 0
+        self.queued = False
+        self.recovered = False
+        self.dispatched = 0  # recipients taken off pending for their first attempt, in list order
+        self.counted_at = None  # epoch the frequency cap counted the recipients at
+        self.sent = 0
+        self.failed = 0
+        self.retried = 0
+        self.capped = list(capped or [])
+        self._lock = threading.Lock()
+        self._done = threading.Event()
+        self._callbacks = []
+        if not phones:
+            self._done.set()
+
+    def record(self, ok):
+        """Record a final outcome for one recipient; True when the job is complete"""
+        with self._lock:
+            if ok:
+                self.sent += 1
+            else:
+                self.failed += 1
+            if self.sent + self.failed >= self.total:
+                self._done.set()
+                return True
+            return False
+
+    def note_retry(self):
+        with self._lock:
+            self.retried += 1
+
+    def wait(self, timeout=None):
+        """Block until every recipient has been delivered or dead-lettered"""
+        return self._done.wait(timeout)
+
+    def add_done_callback(self, fn):
+        """Call fn(job) once every recipient is delivered or dead-lettered (right away if already)"""
+        with self._lock:
+            if not self._done.is_set():
+                self._callbacks.append(fn)
+                return
+        fn(self)
+
+    def notify_done(self):
+        """Run the completion callbacks; called by the worker that recorded the last outcome"""
+        with self._lock:
+            callbacks, self._callbacks = self._callbacks, []
+        for fn in callbacks:
+            try:
+                fn(self)
+            except Exception as e:
+                print(f"⚠️ Completion callback of SMS job {self.id} failed: {e}")
+
+    def progress(self):
+        """Fields checkpointed on the job record while it is sent"""
+        with self._lock:
+            return {'dispatched': self.dispatched, 'sent': self.sent, 'failed': self.failed, 'retried': self.retried}
+
+    def status(self):
+        with self._lock:
+            return {
+                'job_id': self.id,
+                'total': self.total,
+                'sent': self.sent,
+                'failed': self.failed,
+                'retried': self.retried,
+                'capped': len(self.capped),
+                'pending': self.total - self.sent - self.failed,
+                'weight': self.weight
+            }
+
+class SMSDispatcher:
+    def __init__(self, deliver, db=None, workers=None, reserved_workers=None, broadcast_rate=None, retry_policy=None,
+                 frequency_cap=None):
+        """deliver(phone, encoded, lane, job_id) sends one message or raises SMSDeliveryError"""
+        self.deliver = deliver
+        self.db = db
+        self.frequency_cap = frequency_cap
+        self.workers = max(1, workers or Config.SMS_DISPATCH_WORKERS)
+        self.reserved_workers = min(self.workers - 1, max(0, Config.SMS_RESERVED_WORKERS if reserved_workers is None else reserved_workers))
+        if broadcast_rate is None:
+            broadcast_rate = Config.SMS_BROADCAST_RATE_PER_SECOND or 0
+        self.bucket = TokenBucket(broadcast_rate)
+        self.retry_policy = retry_policy or RetryPolicy()
+        # Leaseholder name of this process on job records
+        self.owner = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+
+        self._transactional = deque()
+        self._jobs = deque()
+        self._retries = []  # heap of (due, seq, lane, item)
+        self._seq = itertools.count()
+        self._broadcast_depth = 0
+        self._leased = {}  # job id -> BroadcastJob whose record this process holds
+        self._cond = threading.Condition()
+        self._threads = []
+
+    def _ensure_started(self):
+        # Caller holds the lock; threads start on first use so imports stay cheap
+        if self._threads:
+            return
+        for i in range(self.workers):
+            reserved = i < self.reserved_workers
+            thread = threading.Thread(
+                target=self._run,
+                args=(reserved,),
+                name=f"sms-{'tx' if reserved else 'worker'}-{i}",
+                daemon=True
+            )
+            thread.start()
+            self._threads.append(thread)
+        if self.db is not None:
+            threading.Thread(target=self._keep_leases, name='sms-lease', daemon=True).start()
+
+    def _persist(self, method, *args, **kwargs):
+        """Best-effort write to the delivery store"""
+        if self.db is None:
+            return
+        try:
+            getattr(self.db, method)(*args, **kwargs)
+        except Exception as e:
+            print(f"⚠️ SMS dispatcher could not {method}: {e}")
+
+    def _lease_until(self):
+        return datetime.utcnow() + timedelta(seconds=Config.SMS_LEASE_SECONDS)
+
+    def _keep_leases(self):
+        """Renew the leases on this process's jobs and retries, and checkpoint job progress"""
+        while True:
+            time.sleep(Config.SMS_LEASE_SECONDS / 3)
+            with self._cond:
+                jobs = list(self._leased.values())
+                busy = bool(jobs or self._jobs or self._retries)
+            if busy:
+                self._persist('renew_sms_leases', self.owner, self._lease_until(),
+                              {job.id: job.progress() for job in jobs})
+
+    def _job_record(self, job, phones, encoded, **fields):
+        """Record of a new job, leased to this process"""
+        return dict({
+            'id': job.id,
+            'message': encoded.text,
+            'encoding': encoded.encoding,
+            'segments_per_message': encoded.segments,
+            'total': job.total,
+            'sent': 0,
+            'failed': 0,
+            'retried': 0,
+            'status': 'running' if job.total else 'completed',
+            'created_at': datetime.utcnow().isoformat(),
+            # Until completion: who sends the job, and enough to close it out if that process stops
+            'owner': self.owner,
+            'lease_expires_at': self._lease_until().isoformat(),
+            'recipients': phones,
+            'dispatched': 0
+        }, **fields)
+
+    # ======================
+    # SUBMISSION
+    # ======================
+
+    def submit_transactional(self, phone, encoded, timeout=None):
+        """Queue one message on the priority lane; returns its Future, or None when the queue is full
+        
+        The Future resolves to True/False; retries stop once timeout has passed.
+        """
+        timeout = Config.SMS_TRANSACTIONAL_TIMEOUT if timeout is None else timeout
+        future = Future()
+        now = time.monotonic()
+        with self._cond:
+            if Config.SMS_TRANSACTIONAL_QUEUE_SIZE and len(self._transactional) >= Config.SMS_TRANSACTIONAL_QUEUE_SIZE:
+                return None
+            self._ensure_started()
+            self._transactional.append((phone, encoded, now, future, 0, now + timeout))
+            SMS_QUEUE_DEPTH.set(len(self._transactional), lane=TRANSACTIONAL)
+            self._cond.notify_all()
+        return future
+
+    def send_transactional(self, phone, encoded, timeout=None):
+        """Send one message on the priority lane and wait for the result"""
+        timeout = Config.SMS_TRANSACTIONAL_TIMEOUT if timeout is None else timeout
+        future = self.submit_transactional(phone, encoded, timeout)
+        if future is None:
+            return False
+
+        try:
+            return future.result(timeout=timeout)
+        except Exception:
+            # Timed out: drop it if no worker has picked it up yet
+            future.cancel()
+            return False
+
+    def submit_broadcast(self, phones, encoded, weight=1, job_id=None, parent_job_id=None, attempts=None,
+                         bypass_cap=False, context=None):
+        """Queue a bulk job on the broadcast lane and return it
+        
+        Recipients over their frequency cap are left out (job.capped) unless
+        bypass_cap is set; bypassing sends still count toward the cap.
+        context is kept on the job record for whoever closes the job out if
+        this process stops before it completes.
+        """
+        phones, capped, counted_at = list(phones), [], None
+        if self.frequency_cap is not None and self.frequency_cap.enabled:
+            counted_at = time.time()
+            if bypass_cap:
+                self.frequency_cap.record(phones, counted_at)
+            else:
+                phones, capped = self.frequency_cap.admit(phones, counted_at)
+        job = BroadcastJob(phones, encoded, weight, job_id, attempts, capped)
+        job.counted_at = counted_at
+        if parent_job_id is None:
+            self._persist('save_sms_job', self._job_record(
+                job, phones, encoded, capped=len(capped), capped_phones=capped, context=context, counted_at=counted_at
+            ))
+        self._enqueue_job(job, leased=parent_job_id is None)
+        return job
+
+    def _enqueue_job(self, job, leased=True):
+        if not job.total:
+            return
+        with self._cond:
+            self._ensure_started()
+            if leased:
+                self._leased[job.id] = job
+            self._jobs.append(job)
+            job.queued = True
+            self._broadcast_depth += job.total
+            SMS_QUEUE_DEPTH.set(self._broadcast_depth, lane=BROADCAST)
+            self._cond.notify_all()
+
+    def redrive(self, job_id, weight=1):
+        """Re-queue every dead letter of a job as a new job; returns it (or None)"""
+        if self.db is None:
+            return None
+        dead_letters = self.db.get_dead_letters(job_id, status='dead')
+        if not dead_letters:
+            return None
+
+        from sms_encoding import analyze
+        encoded = analyze(dead_letters[0]['message'])
+        phones = [d['phone'] for d in dead_letters]
+        job = BroadcastJob(phones, encoded, weight)
+        self._persist('save_sms_job', self._job_record(job, phones, encoded, parent_job_id=job_id))
+        self._persist('update_dead_letters', [d['id'] for d in dead_letters], {
+            'status': 'redriven',
+            'redriven_at': datetime.utcnow().isoformat(),
+            'redrive_job_id': job.id
+        })
+        self._enqueue_job(job)
+        return job
+
+    def recover_interrupted(self):
+        """Close out the jobs of processes that stopped mid-send
+        
+        Recipients past a job's last checkpoint are dead-lettered (re-drivable)
+        and the job is marked 'interrupted'. Returns the claimed job records,
+        each with the dead-lettered phones as 'unsent'.
+        """
+        if self.db is None:
+            return []
+        try:
+            jobs = self.db.claim_interrupted_sms_jobs(self.owner, self._lease_until())
+        except Exception as e:
+            print(f"⚠️ Could not load interrupted SMS jobs: {e}")
+            return []
+
+        now = datetime.utcnow().isoformat()
+        for record in jobs:
+            record['unsent'] = (record.get('recipients') or [])[record.get('dispatched', 0):]
+            self._persist('save_dead_letters', [{
+                'id': str(uuid.uuid4()),
+                'job_id': record['id'],
+                'phone': phone,
+                'message': record['message'],
+                'attempts': 0,
+                'error': 'Not sent: the sending process stopped',
+                'status_code': None,
+                'error_code': None,
+                'provider': None,
+                'retryable': True,
+                'status': 'dead',
+                'failed_at': now
+            } for phone in record['unsent']])
+            self._persist('update_sms_job', record['id'], {
+                'status': 'interrupted',
+                'interrupted_at': now,
+                'recipients': [],
+                'lease_expires_at': None
+            }, {'failed': len(record['unsent'])})
+            SMS_DEAD_LETTERS.inc(len(record['unsent']))
+            if record.get('counted_at') is not None and self.frequency_cap is not None:
+                self.frequency_cap.release(record['unsent'], record['counted_at'])
+        if jobs:
+            print(f"🔁 Closed {len(jobs)} interrupted SMS jobs, "
+                  f"{sum(len(r['unsent']) for r in jobs)} unsent recipients dead-lettered")
+        return jobs
+
+    def recover(self):
+        """Re-queue the persisted broadcast retries of stopped processes
+        
+        Only retries whose lease expired are taken, so of several processes
+        starting together only one sends each.
+        """
+        if self.db is None:
+            return 0
+        try:
+            retries = self.db.claim_sms_retries(self.owner, self._lease_until())
+        except Exception as e:
+            print(f"⚠️ Could not load pending SMS retries: {e}")
+            return 0
+
+        from sms_encoding import analyze
+        by_job = {}
+        for retry in retries:
+            by_job.setdefault(retry['job_id'], []).append(retry)
+        for job_id, items in by_job.items():
+            job = BroadcastJob(
+                [r['phone'] for r in items],
+                analyze(items[0]['message']),
+                job_id=job_id,
+                attempts={r['phone']: r['attempts'] for r in items}
+            )
+            job.recovered = True
+            self._enqueue_job(job, leased=False)
+        if retries:
+            print(f"🔁 Recovered {len(retries)} pending SMS retries across {len(by_job)} jobs")
+        return len(retries)
+
+    # ======================
+    # SCHEDULING
+    # ======================
+
+    def _release_due_retries(self):
+        """Move retries whose backoff has elapsed back onto their lane; caller holds the lock"""
+        now = time.monotonic()
+        while self._retries and self._retries[0][0] <= now:
+            _, _, lane, item = heapq.heappop(self._retries)
+            if lane == TRANSACTIONAL:
+                self._transactional.appendleft(item)
+                SMS_QUEUE_DEPTH.set(len(self._transactional), lane=TRANSACTIONAL)
+            else:
+                phone, job, attempts = item
+                job.pending.appendleft((phone, attempts))
+                if not job.queued:
+                    self._jobs.append(job)
+                    job.queued = True
+                self._broadcast_depth += 1
+                SMS_QUEUE_DEPTH.set(self._broadcast_depth, lane=BROADCAST)
+
+    def _next_broadcast(self):
+        """Deficit round robin over active jobs; caller holds the lock"""
+        while self._jobs:
+            job = self._jobs[0]
+            if not job.pending:
+                self._jobs.popleft()
+                job.queued = False
+                continue
+            if job.deficit < 1:
+                job.deficit += job.weight
+            phone, attempts = job.pending.popleft()
+            if attempts == 0:
+                job.dispatched += 1
+            job.deficit -= 1
+            if not job.pending:
+                self._jobs.popleft()
+                job.queued = False
+            elif job.deficit < 1:
+                # Quantum used up: move to the back of the rotation
+                self._jobs.rotate(-1)
+            self._broadcast_depth -= 1
+            SMS_QUEUE_DEPTH.set(self._broadcast_depth, lane=BROADCAST)
+            return phone, job, attempts
+        return None
+
+    def _next(self, reserved):
+        with self._cond:
+            while True:
+                self._release_due_retries()
+                if self._transactional:
+                    item = self._transactional.popleft()
+                    SMS_QUEUE_DEPTH.set(len(self._transactional), lane=TRANSACTIONAL)
+                    return TRANSACTIONAL, item
+
+                wait = None
+                if not reserved and self._jobs:
+                    wait = self.bucket.delay()
+                    if wait <= 0:
+                        self.bucket.take()
+                        return BROADCAST, self._next_broadcast()
+                if self._retries:
+                    until_retry = max(0.0, self._retries[0][0] - time.monotonic())
+                    wait = until_retry if wait is None else min(wait, until_retry)
+                # Wakes early when new work (e.g. an OTP) arrives
+                self._cond.wait(wait)
+
+    def _schedule_retry(self, lane, item, delay):
+        with self._cond:
+            heapq.heappush(self._retries, (time.monotonic() + delay, next(self._seq), lane, item))
+            self._cond.notify_all()
+        SMS_RETRIES.inc(lane=lane)
+
+    def _attempt(self, phone, encoded, lane, job_id=None):
+        try:
+            self.deliver(phone, encoded, lane, job_id)
+            return None
+        except SMSDeliveryError as e:
+            return e
+        except Exception as e:
+            return SMSDeliveryError(str(e))
+
+    def _run(self, reserved):
+        while True:
+            lane, item = self._next(reserved)
+            if item is None:
+                continue
+            if lane == TRANSACTIONAL:
+                self._run_transactional(item)
+            else:
+                self._run_broadcast(*item)
+
+    def _run_transactional(self, item):
+        phone, encoded, enqueued_at, future, attempts, deadline = item
+        if attempts == 0:
+            if not future.set_running_or_notify_cancel():
+                return
+            SMS_QUEUE_WAIT.observe(time.monotonic() - enqueued_at, lane=TRANSACTIONAL)
+
+        attempts += 1
+        error = self._attempt(phone, encoded, TRANSACTIONAL)
+        if error is None:
+            future.set_result(True)
+            return
+
+        if self.retry_policy.should_retry(error, attempts):
+            delay = self.retry_policy.delay(error, attempts)
+            # Only worth retrying while the caller is still waiting
+            if time.monotonic() + delay < deadline:
+                self._schedule_retry(TRANSACTIONAL, (phone, encoded, enqueued_at, future, attempts, deadline), delay)
+                return
+        future.set_result(False)
+
+    def _run_broadcast(self, phone, job, attempts):
+        if attempts == 0:
+            SMS_QUEUE_WAIT.observe(time.monotonic() - job.enqueued_at, lane=BROADCAST)
+
+        attempts += 1
+        error = self._attempt(phone, job.encoded, BROADCAST, job.id)
+        retry_id = f"{job.id}:{phone}"
+
+        if error is None:
+            if attempts > 1:
+                self._persist('delete_sms_retry', retry_id)
+            self._finish(job, True)
+            return
+
+        if self.retry_policy.should_retry(error, attempts):
+            delay = self.retry_policy.delay(error, attempts)
+            job.note_retry()
+            self._persist('save_sms_retry', {
+                'id': retry_id,
+                'job_id': job.id,
+                'phone': phone,
+                'message': job.encoded.text,
+                'attempts': attempts,
+                'next_attempt_at': (datetime.utcnow() + timedelta(seconds=delay)).isoformat(),
+                'last_error': str(error),
+                'owner': self.owner,
+                'lease_expires_at': self._lease_until().isoformat()
+            })
+            self._schedule_retry(BROADCAST, (phone, job, attempts), delay)
+            return
+
+        if attempts > 1:
+            self._persist('delete_sms_retry', retry_id)
+        self._persist('save_dead_letter', {
+            'id': str(uuid.uuid4()),
+            'job_id': job.id,
+            'phone': phone,
+            'message': job.encoded.text,
+            'attempts': attempts,
+            'error': str(error),
+            'status_code': error.status,
+            'error_code': error.code,
+            'provider': error.provider,
+            'retryable': error.retryable,
+            'status': 'dead',
+            'failed_at': datetime.utcnow().isoformat()
+        })
+        SMS_DEAD_LETTERS.inc()
+        if job.counted_at is not None:
+            self.frequency_cap.release([phone], job.counted_at)
+        self._finish(job, False)
+
+    def _finish(self, job, ok):
+        if not job.record(ok):
+            return
+        status = job.status()
+        with self._cond:
+            self._leased.pop(job.id, None)
+        if job.recovered:
+            # The interrupted process never completed the record; add what the retries achieved
+            self._persist('update_sms_job', job.id, {'status': 'completed', 'recovered': True},
+                          {'sent': status['sent'], 'failed': status['failed']})
+        else:
+            self._persist('update_sms_job', job.id, {
+                'status': 'completed',
+                'sent': status['sent'],
+                'failed': status['failed'],
+                'retried': status['retried'],
+                'completed_at': datetime.utcnow().isoformat(),
+                'dispatched': job.total,
+                'recipients': [],
+                'lease_expires_at': None
+            })
+        job.notify_done()
+
+    def get_stats(self):
+        """Queue depths and active broadcast jobs"""
+        with self._cond:
+            jobs = list(self._jobs)
+            return {
+                'workers': self.workers,
+                'reserved_workers': self.reserved_workers,
+                'broadcast_rate_per_second': self.bucket.rate,
+                'transactional_queued': len(self._transactional),
+                'broadcast_queued': self._broadcast_depth,
+                'retries_scheduled': len(self._retries),
+                'frequency_cap': self.frequency_cap.get_stats() if self.frequency_cap is not None else None,
+                'active_jobs': [job.status() for job in jobs]
+            }
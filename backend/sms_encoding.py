@@ -0,0 +1,94 @@
+"""
+SMS encoding and segment calculation
+
+Any character outside the GSM 03.38 (GSM-7) alphabet forces the whole
+message into UCS-2, which cuts a segment from 160 to 70 characters. The
+alert templates use emoji and capital È, so they are billed as 2-3
+segments per recipient. compile_message() transliterates to GSM-7 (è, é,
+ò, à, ù, ì are part of GSM-7 and are kept) and reports the segment count.
+"""
+import re
+import unicodedata
+from collections import namedtuple
+
+from config import Config
+
+GSM7_BASIC = set(
+    "@£$¥èéùìòÇ\nØø\rÅåΔ_ΦΓΛΩΠΨΣΘΞÆæßÉ !\"#¤%&'()*+,-./0123456789:;<=>?"
+    "¡ABCDEFGHIJKLMNOPQRSTUVWXYZÄÖÑÜ§¿abcdefghijklmnopqrstuvwxyzäöñüà"
+)
+GSM7_EXTENSION = set("^{}\\[~]|€\f")  # cost two septets (escape + char)
+
+GSM7_SINGLE_SEGMENT = 160
+GSM7_MULTI_SEGMENT = 153
+UCS2_SINGLE_SEGMENT = 70
+UCS2_MULTI_SEGMENT = 67
+
+# Characters common in Haitian Creole/French text that are not in GSM-7
+TRANSLITERATIONS = {
+    'È': 'E', 'Ê': 'E', 'Ë': 'E', 'À': 'A', 'Â': 'A', 'Á': 'A', 'Ò': 'O', 'Ô': 'O', 'Ó': 'O',
+    'Ù': 'U', 'Û': 'U', 'Ú': 'U', 'Ì': 'I', 'Î': 'I', 'Ï': 'I', 'Í': 'I',
+    'ê': 'e', 'ë': 'e', 'â': 'a', 'á': 'a', 'ô': 'o', 'ó': 'o', 'û': 'u', 'ú': 'u',
+    'î': 'i', 'ï': 'i', 'í': 'i', 'ç': 'c',
+    '‘': "'", '’': "'", '“': '"', '”': '"', '–': '-', '—': '-', '…': '...',
+    ' ': ' ', '\t': ' '
+}
+
+EncodedMessage = namedtuple('EncodedMessage', ['text', 'encoding', 'units', 'segments', 'transliterated'])
+
+def is_gsm7(text):
+    """True if text can be sent with the GSM-7 alphabet"""
+    return all(ch in GSM7_BASIC or ch in GSM7_EXTENSION for ch in text)
+
+def analyze(text):
+    """Encoding, length in encoding units and segment count for a message"""
+    if is_gsm7(text):
+        units = sum(2 if ch in GSM7_EXTENSION else 1 for ch in text)
+        single, multi, encoding = GSM7_SINGLE_SEGMENT, GSM7_MULTI_SEGMENT, 'GSM-7'
+    else:
+        # UCS-2/UTF-16 code units: characters outside the BMP (most emoji) take two
+        units = len(text.encode('utf-16-le')) // 2
+        single, multi, encoding = UCS2_SINGLE_SEGMENT, UCS2_MULTI_SEGMENT, 'UCS-2'
+
+    segments = 1 if units <= single else -(-units // multi)
+    return EncodedMessage(text, encoding, units, segments, False)
+
+def to_gsm7(text, replacement='?'):
+    """Transliterate text into the GSM-7 alphabet, dropping emoji"""
+    result = []
+    for ch in text:
+        if ch in GSM7_BASIC or ch in GSM7_EXTENSION:
+            result.append(ch)
+        elif ch in TRANSLITERATIONS:
+            result.append(TRANSLITERATIONS[ch])
+        elif unicodedata.category(ch) in ('So', 'Sk', 'Cf', 'Mn', 'Cs', 'Co'):
+            # Symbols, emoji modifiers, joiners and variation selectors
+            continue
+        else:
+            base = ''.join(c for c in unicodedata.normalize('NFKD', ch) if not unicodedata.combining(c))
+            result.append(base if base and all(c in GSM7_BASIC for c in base) else replacement)
+
+    # Collapse the gaps left by dropped emoji
+    return re.sub(r' {2,}', ' ', ''.join(result)).strip()
+
+def compile_message(text, encoding=None):
+    """Compile a message for sending under the configured SMS_ENCODING
+
+    'gsm7' transliterates non-GSM text so the message fits 160-character
+    segments; 'unicode' sends the text unchanged.
+    """
+    encoding = encoding or Config.SMS_ENCODING
+    if encoding != 'gsm7' or is_gsm7(text):
+        return analyze(text)
+
+    converted = analyze(to_gsm7(text))
+    return converted._replace(transliterated=True)
+
+def message_variants(text):
+    """Unicode and GSM-7 variants of a message with their segment counts"""
+    original = analyze(text)
+    gsm7 = compile_message(text, encoding='gsm7')
+    return {
+        'unicode': original._asdict(),
+        'gsm7': gsm7._asdict()
+    }
@@ -0,0 +1,399 @@
+"""
+SMS provider layer
+
+SMSGateway spreads sends across several providers by weight, each with its
+own account rate limit, and fails over when one is down:
+
+- every provider has a token bucket at its own `rate` (messages/second), so
+  total broadcast throughput is the sum of the providers' limits
+- after SMS_PROVIDER_FAILURE_THRESHOLD consecutive transient failures a
+  provider is taken out of rotation for SMS_PROVIDER_COOLDOWN_SECONDS; back
+  in rotation, one more failure takes it out again (circuit breaker)
+- a 429 with Retry-After pauses only the provider that was throttled
+- a transient failure is retried once on another healthy provider before
+  the error is handed back to the dispatcher's retry policy
+
+Providers are configured with SMS_PROVIDERS (a JSON list); without it the
+gateway uses Twilio when USE_REAL_SMS is set and the console mock otherwise.
+
+    SMS_PROVIDERS='[
+      {"name": "twilio-main", "type": "twilio", "weight": 3, "rate": 10},
+      {"name": "twilio-backup", "type": "twilio", "sid": "AC...", "token": "...", "phone": "+1...", "rate": 10},
+      {"name": "local-mock", "type": "http", "base_url": "http://127.0.0.1:8081", "rate": 100}
+    ]'
+"""
+import base64
+import hashlib
+import hmac
+import json
+import logging
+import random
+import threading
+import time
+
+from config import Config
+from metrics import SMS_PROVIDER_HEALTHY, SMS_SEND_DURATION, SMS_MESSAGES
+from structured_logging import get_logger, log_event
+
+try:
+    from twilio.rest import Client as TwilioClient
+    from twilio.base.exceptions import TwilioRestException
+    from twilio.http.http_client import TwilioHttpClient
+    TWILIO_AVAILABLE = True
+except ImportError:
+    TWILIO_AVAILABLE = False
+
+try:
+    import requests
+    import sms_transport
+    REQUESTS_AVAILABLE = True
+except ImportError:
+    REQUESTS_AVAILABLE = False
+
+logger = get_logger('sms.providers')
+
+class SMSDeliveryError(Exception):
+    """A failed send, classified for the retry policy"""
+
+    def __init__(self, message, retryable=False, retry_after=None, status=None, code=None, provider=None):
+        super().__init__(message)
+        self.retryable = retryable
+        self.retry_after = retry_after
+        self.status = status
+        self.code = code
+        self.provider = provider
+
+def _retry_after(headers):
+    try:
+        return float((headers or {}).get('Retry-After'))
+    except (TypeError, ValueError):
+        return None
+
+def twilio_signature(auth_token, url, params):
+    """X-Twilio-Signature for a form POST: base64 HMAC-SHA1 of the URL plus sorted params"""
+    payload = url + ''.join(f"{key}{params[key]}" for key in sorted(params))
+    digest = hmac.new(auth_token.encode('utf-8'), payload.encode('utf-8'), hashlib.sha1).digest()
+    return base64.b64encode(digest).decode('ascii')
+
+def _is_transient(status):
+    # 429 and 5xx are transient; other 4xx (bad number, unsubscribed) will never succeed
+    return status is None or status == 429 or status >= 500
+
+class SMSProvider:
+    kind = 'base'
+
+    def __init__(self, name, weight=1, rate=0):
+        self.name = name
+        self.weight = max(0, weight)
+        self.rate = rate  # messages/second for this account; 0 = unlimited
+        self.tokens = max(1.0, rate)
+        self.updated = time.monotonic()
+        self.paused_until = 0.0
+        self.consecutive_failures = 0
+        self.down_until = 0.0
+        self.sent = 0
+        self.failed = 0
+        self.auth_token = None  # signs delivery status callbacks
+        self.status_callback = Config.SMS_STATUS_CALLBACK_URL
+
+    def send(self, phone, text):
+        """Send one message; returns the provider's message id or raises SMSDeliveryError"""
+        raise NotImplementedError
+
+    def describe(self):
+        return {'name': self.name, 'type': self.kind, 'weight': self.weight, 'rate': self.rate}
+
+    # Rate limiting and health are driven by SMSGateway under its lock
+
+    def wait_time(self, now):
+        """Seconds until this provider may send again"""
+        if now < self.paused_until:
+            return self.paused_until - now
+        if self.rate <= 0:
+            return 0.0
+        self.tokens = min(max(1.0, self.rate), self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        return 0.0 if self.tokens >= 1 else (1 - self.tokens) / self.rate
+
+    def take_token(self):
+        if self.rate > 0:
+            self.tokens -= 1
+
+    def is_healthy(self, now):
+        return now >= self.down_until
+
+class ConsoleProvider(SMSProvider):
+    """Development provider: sends nothing; SMSService logs the message body instead"""
+    kind = 'console'
+
+    def send(self, phone, text):
+        log_event(logger, logging.DEBUG, "MOCK SMS", phone=phone, provider=self.name)
+        return None
+
+class TwilioProvider(SMSProvider):
+    kind = 'twilio'
+
+    def __init__(self, name, sid, token, phone, base_url=None, weight=1, rate=10, session=None):
+        super().__init__(name, weight, rate)
+        if not TWILIO_AVAILABLE:
+            raise RuntimeError("Twilio SDK not available")
+        if not all([sid, token, phone]):
+            raise RuntimeError("Twilio credentials incomplete")
+
+        self.phone = phone
+        self.base_url = base_url
+        self.auth_token = token
+        # Headers of the last response, per sending thread (for Retry-After)
+        self._last_response = threading.local()
+        http_client = TwilioHttpClient(request_hooks={'response': self._remember_response})
+        if REQUESTS_AVAILABLE:
+            # Share the process-wide keep-alive pool instead of the SDK's default one
+            http_client.session = session or sms_transport.get_session()
+            http_client.timeout = sms_transport.timeout()
+        self.client = TwilioClient(sid, token, http_client=http_client)
+        if base_url:
+            self.client.api.base_url = base_url
+
+    def _remember_response(self, response, *args, **kwargs):
+        self._last_response.headers = response.headers
+
+    def send(self, phone, text):
+        try:
+            options = {'status_callback': self.status_callback} if self.status_callback else {}
+            return self.client.messages.create(body=text, from_=self.phone, to=phone, **options).sid
+        except TwilioRestException as e:
+            headers = getattr(self._last_response, 'headers', None)
+            raise SMSDeliveryError(str(e), _is_transient(e.status), _retry_after(headers),
+                                   e.status, e.code, self.name) from e
+        except Exception as e:
+            # Network errors and timeouts
+            raise SMSDeliveryError(str(e), True, provider=self.name) from e
+
+    def describe(self):
+        return dict(super().describe(), base_url=self.base_url)
+
+class HTTPProvider(SMSProvider):
+    """Any endpoint speaking Twilio's Messages API, e.g. mock_sms_provider.py"""
+    kind = 'http'
+
+    def __init__(self, name, base_url, sid='ACmock', token='mock', phone='+15005550006', weight=1, rate=0, session=None):
+        super().__init__(name, weight, rate)
+        if not REQUESTS_AVAILABLE:
+            raise RuntimeError("requests not available")
+        self.base_url = base_url.rstrip('/')
+        self.url = f"{self.base_url}/2010-04-01/Accounts/{sid}/Messages.json"
+        self.auth = (sid, token)
+        self.auth_token = token
+        self.phone = phone
+        self.session = session or sms_transport.get_session()
+
+    def send(self, phone, text):
+        try:
+            data = {'To': phone, 'From': self.phone, 'Body': text}
+            if self.status_callback:
+                data['StatusCallback'] = self.status_callback
+            response = self.session.post(
+                self.url,
+                data=data,
+                auth=self.auth,
+                timeout=sms_transport.timeout()
+            )
+        except requests.RequestException as e:
+            raise SMSDeliveryError(str(e), True, provider=self.name) from e
+
+        if response.status_code >= 400:
+            try:
+                payload = response.json()
+            except ValueError:
+                payload = {}
+            raise SMSDeliveryError(
+                f"HTTP {response.status_code}: {payload.get('message', response.reason)}",
+                _is_transient(response.status_code), _retry_after(response.headers),
+                response.status_code, payload.get('code'), self.name
+            )
+        return response.json().get('sid')
+
+    def describe(self):
+        return dict(super().describe(), base_url=self.base_url)
+
+def build_provider(spec):
+    """Create a provider from one SMS_PROVIDERS entry"""
+    provider = _build_provider(spec)
+    if 'status_callback' in spec:
+        provider.status_callback = spec['status_callback']
+    return provider
+
+def _build_provider(spec):
+    kind = spec.get('type', 'twilio')
+    name = spec.get('name', kind)
+    weight = spec.get('weight', 1)
+    if kind == 'twilio':
+        return TwilioProvider(
+            name,
+            spec.get('sid', Config.TWILIO_SID),
+            spec.get('token', Config.TWILIO_TOKEN),
+            spec.get('phone', Config.TWILIO_PHONE),
+            base_url=spec.get('base_url', Config.TWILIO_API_BASE_URL),
+            weight=weight,
+            rate=spec.get('rate', 10)
+        )
+    if kind == 'http':
+        return HTTPProvider(
+            name,
+            spec['base_url'],
+            sid=spec.get('sid', 'ACmock'),
+            token=spec.get('token', 'mock'),
+            phone=spec.get('phone', '+15005550006'),
+            weight=weight,
+            rate=spec.get('rate', 0)
+        )
+    if kind == 'console':
+        return ConsoleProvider(name, weight, spec.get('rate', 0))
+    raise ValueError(f"Unknown SMS provider type: {kind}")
+
+class SMSGateway:
+    def __init__(self, providers, failure_threshold=None, cooldown=None):
+        self.providers = list(providers)
+        self.failure_threshold = failure_threshold or Config.SMS_PROVIDER_FAILURE_THRESHOLD
+        self.cooldown = Config.SMS_PROVIDER_COOLDOWN_SECONDS if cooldown is None else cooldown
+        self._lock = threading.Lock()
+        for provider in self.providers:
+            SMS_PROVIDER_HEALTHY.set(1, provider=provider.name)
+
+    @classmethod
+    def from_config(cls):
+        """Build the gateway from SMS_PROVIDERS, or the legacy Twilio/mock settings"""
+        if Config.SMS_PROVIDERS:
+            specs = json.loads(Config.SMS_PROVIDERS)
+        elif Config.USE_REAL_SMS:
+            specs = [{'name': 'twilio', 'type': 'twilio'}]
+        else:
+            print("📱 SMS service in mock mode (USE_REAL_SMS=False)")
+            specs = [{'name': 'mock', 'type': 'console'}]
+
+        providers = []
+        for spec in specs:
+            try:
+                provider = build_provider(spec)
+                providers.append(provider)
+                print(f"✅ SMS provider '{provider.name}' ({provider.kind}) initialized")
+            except Exception as e:
+                print(f"❌ SMS provider '{spec.get('name', spec.get('type'))}' unavailable: {e}")
+        return cls(providers)
+
+    @property
+    def capacity(self):
+        """Combined messages/second across providers (0 = unlimited)"""
+        if any(p.rate <= 0 for p in self.providers):
+            return 0
+        return sum(p.rate for p in self.providers)
+
+    def is_available(self):
+        now = time.monotonic()
+        return any(p.is_healthy(now) for p in self.providers)
+
+    def _choose(self, exclude):
+        """Pick a healthy provider by weight, waiting for its rate limit if needed"""
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                candidates = [p for p in self.providers if p.name not in exclude and p.weight > 0]
+                healthy = [p for p in candidates if p.is_healthy(now)]
+                if not healthy:
+                    if not candidates:
+                        return None
+                    # Everything is tripped: try the one that has been down longest
+                    healthy = [min(candidates, key=lambda p: p.down_until)]
+
+                ready = [p for p in healthy if p.wait_time(now) <= 0]
+                if ready:
+                    provider = random.choices(ready, weights=[p.weight for p in ready])[0]
+                    provider.take_token()
+                    if not provider.is_healthy(now):
+                        # Half-open: one trial send, keep the others out until it reports back
+                        provider.down_until = now + self.cooldown
+                    return provider
+                wait = min(p.wait_time(now) for p in healthy)
+            time.sleep(wait)
+
+    def _record_success(self, provider):
+        with self._lock:
+            provider.sent += 1
+            provider.consecutive_failures = 0
+            if provider.down_until:
+                provider.down_until = 0.0
+                log_event(logger, logging.INFO, "SMS provider recovered", provider=provider.name)
+        SMS_PROVIDER_HEALTHY.set(1, provider=provider.name)
+
+    def _record_failure(self, provider, error):
+        with self._lock:
+            provider.failed += 1
+            if error.status == 429 and error.retry_after:
+                # Throttled, not broken: stop using this account for a while
+                provider.paused_until = time.monotonic() + error.retry_after
+                return
+            provider.consecutive_failures += 1
+            tripped = provider.consecutive_failures >= self.failure_threshold
+            if tripped:
+                provider.down_until = time.monotonic() + self.cooldown
+        if tripped:
+            SMS_PROVIDER_HEALTHY.set(0, provider=provider.name)
+            log_event(logger, logging.WARNING, "SMS provider marked down", provider=provider.name,
+                      failures=provider.consecutive_failures, cooldown_s=self.cooldown, error=str(error))
+
+    def send(self, phone, text):
+        """Send through the best provider, failing over once on transient errors
+
+        Returns (provider, message_id); raises SMSDeliveryError.
+        """
+        if not self.providers:
+            raise SMSDeliveryError("No SMS provider configured", retryable=False)
+
+        tried = set()
+        last_error = None
+        while len(tried) < min(2, len(self.providers)):
+            provider = self._choose(tried)
+            if provider is None:
+                break
+            tried.add(provider.name)
+            start = time.perf_counter()
+            try:
+                message_id = provider.send(phone, text)
+            except SMSDeliveryError as e:
+                SMS_SEND_DURATION.observe(time.perf_counter() - start, provider=provider.name)
+                SMS_MESSAGES.inc(provider=provider.name, result='failed')
+                if not e.retryable:
+                    # The message itself is bad; another provider won't help
+                    raise
+                self._record_failure(provider, e)
+                last_error = e
+                continue
+            SMS_SEND_DURATION.observe(time.perf_counter() - start, provider=provider.name)
+            SMS_MESSAGES.inc(provider=provider.name, result='sent')
+            self._record_success(provider)
+            return provider, message_id
+        raise last_error or SMSDeliveryError("No SMS provider available", retryable=True)
+
+    def validate_callback(self, url, params, signature):
+        """True if a status callback is signed by one of the providers' auth tokens"""
+        if not signature:
+            return False
+        return any(
+            hmac.compare_digest(twilio_signature(p.auth_token, url, params), signature)
+            for p in self.providers if p.auth_token
+        )
+
+    def get_status(self):
+        now = time.monotonic()
+        with self._lock:
+            return [
+                dict(
+                    p.describe(),
+                    healthy=p.is_healthy(now),
+                    throttled_for_s=round(max(0.0, p.paused_until - now), 1),
+                    consecutive_failures=p.consecutive_failures,
+                    sent=p.sent,
+                    failed=p.failed
+                )
+                for p in self.providers
+            ]
@@ -1,81 +1,152 @@
+import logging
 import time
 from datetime import datetime
 from config import Config
+from delivery_tracker import DeliveryTracker
+from frequency_cap import FrequencyCap
+from metrics import SMS_SEGMENTS
+from sms_dispatcher import SMSDispatcher, BROADCAST
+from sms_encoding import compile_message, message_variants
+from sms_providers import SMSGateway, SMSDeliveryError
+from structured_logging import get_logger, log_event
 
-# Conditional Twilio import
-try:
-    from twilio.rest import Client as TwilioClient
-    TWILIO_AVAILABLE = True
-except ImportError:
-    TWILIO_AVAILABLE = False
+logger = get_logger('sms')
+recipient_logger = get_logger('sms.recipient')
 
 class SMSService:
-    def __init__(self):
-        self.client = None
-        self.phone_number = None
-        self.setup_twilio()
-    
-    def setup_twilio(self):
-        """Initialize Twilio client"""
-        if not TWILIO_AVAILABLE:
-            print("⚠️ Twilio SDK not available")
-            return
-        
-        if not Config.USE_REAL_SMS:
-            print("📱 SMS service in mock mode (USE_REAL_SMS=False)")
-            return
+    def __init__(self, db=None):
+        self.db = db
+        self.gateway = SMSGateway.from_config()
+        self.delivery = DeliveryTracker(db) if db is not None else None
+        broadcast_rate = Config.SMS_BROADCAST_RATE_PER_SECOND
+        if broadcast_rate is None:
+            broadcast_rate = self.gateway.capacity
+        # Each worker process paces its own broadcasts, so each gets its share of the rate
+        broadcast_rate /= max(1, Config.WEB_CONCURRENCY)
+        self.frequency_cap = FrequencyCap(db)
+        self.dispatcher = SMSDispatcher(self._deliver, db=db, broadcast_rate=broadcast_rate,
+                                        frequency_cap=self.frequency_cap)
+    
+    def recover(self):
+        """Pick up the broadcast work of stopped processes
         
-        if not all([Config.TWILIO_SID, Config.TWILIO_TOKEN, Config.TWILIO_PHONE]):
-            print("⚠️ Twilio credentials incomplete")
-            return
+        Returns the records of the jobs they left interrupted (see
+        SMSDispatcher.recover_interrupted); persisted retries are re-queued.
+        """
+        interrupted = self.dispatcher.recover_interrupted()
+        self.dispatcher.recover()
+        return interrupted
+    
+    def compile_message(self, message):
+        """Encode message for sending (GSM-7 transliteration) with segment count"""
+        return compile_message(message)
+    
+    def message_variants(self, message):
+        """Unicode and GSM-7 variants of a message with their segment counts"""
+        return message_variants(message)
+    
+    def send_sms(self, phone, message):
+        """Send a transactional SMS (OTP, welcome) on the priority lane"""
+        return self.dispatcher.send_transactional(phone, self.compile_message(message))
+    
+    def send_sms_async(self, phone, message, record_as=None):
+        """Queue a transactional SMS without waiting for the provider
         
+        Returns False when the transactional queue is full. The outcome is
+        recorded on the user as sms_status.<record_as> once the send finishes.
+        """
+        future = self.dispatcher.submit_transactional(phone, self.compile_message(message))
+        if future is None:
+            log_event(logger, logging.WARNING, "SMS queue full", phone=phone, message_type=record_as)
+            return False
+        if record_as and self.db is not None:
+            future.add_done_callback(lambda f: self._record_send_status(phone, record_as, f))
+        return True
+    
+    def _record_send_status(self, phone, message_type, future):
+        """Completion callback: store the send outcome on the user"""
+        ok = not future.cancelled() and future.exception() is None and future.result()
         try:
-            self.client = TwilioClient(Config.TWILIO_SID, Config.TWILIO_TOKEN)
-            self.phone_number = Config.TWILIO_PHONE
-            print("✅ Twilio SMS service initialized")
+            self.db.update_user_sms_status(phone, message_type, 'sent' if ok else 'failed')
         except Exception as e:
-            print(f"❌ Twilio initialization failed: {e}")
+            log_event(logger, logging.WARNING, "Could not record SMS status", phone=phone,
+                      message_type=message_type, error=str(e))
     
-    def send_sms(self, phone, message):
-        """Send SMS message"""
+    def _deliver(self, phone, encoded, lane, job_id=None):
+        """Deliver a single compiled message through the provider gateway
+        
+        Raises SMSDeliveryError on failure.
+        """
+        # Per-recipient broadcast events go to the sampled logger
+        log = recipient_logger if lane == BROADCAST else logger
         try:
-            if self.client and self.phone_number:
-                # Send real SMS
-                message_obj = self.client.messages.create(
-                    body=message,
-                    from_=self.phone_number,
-                    to=phone
-                )
-                print(f"✅ SMS sent to {phone}: {message[:50]}...")
-                return True
-            else:
-                # Mock SMS (for development/testing)
-                print(f"📱 MOCK SMS to {phone}: {message}")
-                return True
-                
-        except Exception as e:
-            print(f"❌ Failed to send SMS to {phone}: {e}")
-            return False
+            provider, message_id = self.gateway.send(phone, encoded.text)
+        except SMSDeliveryError as e:
+            log_event(log, logging.WARNING, "SMS send failed", phone=phone, provider=e.provider,
+                      lane=lane, error=str(e), status=e.status, retryable=e.retryable)
+            raise
+        
+        if message_id:
+            log_event(log, logging.INFO, "SMS sent", phone=phone, provider=provider.name,
+                      sid=message_id, preview=encoded.text[:50])
+            if self.delivery is not None and Config.SMS_STATUS_CALLBACK_URL:
+                self.delivery.record_sent(message_id, phone, provider.name, lane, job_id)
+        else:
+            # Console provider: the body is all there is to see of a development send
+            log_event(log, logging.INFO, "MOCK SMS", phone=phone, provider=provider.name, body=encoded.text)
+        SMS_SEGMENTS.inc(encoded.segments, encoding=encoded.encoding)
+        return True
     
-    def send_bulk_sms(self, recipients, message, delay=0.1):
-        """Send SMS to multiple recipients with rate limiting"""
-        sent_count = 0
-        failed_count = 0
+    def send_bulk_sms(self, recipients, message, weight=1, job_id=None, bypass_cap=False, on_complete=None,
+                      context=None):
+        """Queue SMS to multiple recipients on the paced, fair-shared broadcast lane
         
-        for recipient in recipients:
-            phone = recipient.get('phone') if isinstance(recipient, dict) else recipient
-            
-            if self.send_sms(phone, message):
-                sent_count += 1
-            else:
-                failed_count += 1
-            
-            # Rate limiting to avoid overwhelming Twilio
-            if delay > 0:
-                time.sleep(delay)
+        Returns the BroadcastJob without waiting: a large area takes minutes at
+        provider pace. on_complete(job) runs on a dispatcher thread once every
+        recipient was delivered or dead-lettered after retries (job.sent,
+        job.failed, job.capped); recipients who reached their frequency cap
+        are skipped unless bypass_cap is set. context is stored on the job
+        record, for closing the job out if this process stops first.
+        """
+        start = time.perf_counter()
+        encoded = self.compile_message(message)
+        phones = [recipient.get('phone') if isinstance(recipient, dict) else recipient for recipient in recipients]
         
-        print(f"📊 Bulk SMS completed: {sent_count} sent, {failed_count} failed")
-        return sent_count, failed_count
+        job = self.dispatcher.submit_broadcast(phones, encoded, weight=weight, job_id=job_id, bypass_cap=bypass_cap,
+                                             context=context)
+        job.add_done_callback(lambda job: log_event(
+            logger, logging.INFO, "Bulk SMS completed",
+            job_id=job.id, sent=job.sent, failed=job.failed, capped=len(job.capped),
+            recipients=job.sent + job.failed,
+            duration_ms=round((time.perf_counter() - start) * 1000, 1), encoding=encoded.encoding,
+            segments_per_message=encoded.segments, total_segments=encoded.segments * job.sent,
+            preview=encoded.text[:50]
+        ))
+        if on_complete is not None:
+            job.add_done_callback(on_complete)
+        return job
+    
+    def record_status_callback(self, url, params, signature):
+        """Validate and buffer a provider delivery status callback
+        
+        Returns (ok, error message).
+        """
+        if self.delivery is None:
+            return False, "Delivery tracking disabled"
+        if Config.SMS_STATUS_VALIDATE_SIGNATURE and not self.gateway.validate_callback(url, params, signature):
+            return False, "Invalid signature"
+        
+        sid = params.get('MessageSid') or params.get('SmsSid')
+        status = params.get('MessageStatus') or params.get('SmsStatus')
+        if not sid or not status:
+            return False, "MessageSid and MessageStatus are required"
+        
+        self.delivery.record_status(sid, status.lower(), params.get('ErrorCode'))
+        return True, None
+    
+    def redrive_failures(self, job_id):
+        """Re-queue a job's dead letters as a new broadcast job (not awaited)"""
+        return self.dispatcher.redrive(job_id)
     
     def generate_otp_message(self, otp, app_name="Alatem"):
         """Generate OTP verification message in Haitian Creole"""
@@ -96,6 +167,18 @@ class SMSService:
         }
         return messages.get(condition, f"🚨 ALÈT SANTE: {condition} nan {area}")
     
+    def get_combined_health_alert_message(self, area, conditions, cases=None):
+        """One health alert message covering several conditions"""
+        names = {
+            'cholera': 'cholera',
+            'malnutrition': 'malnitrisyon',
+            'fever': 'lafyèv',
+            'diarrhea': 'dyare',
+            'respiratory': 'pwoblèm respiratwa'
+        }
+        listed = ', '.join(names.get(condition, condition) for condition in conditions)
+        return f"🚨 ALÈT SANTE: {cases if cases else 'Ka'} {listed} nan {area}. Bwè dlo pwòp, lave men nou. Ale kay doktè si nou gen simptòm."
+    
     def get_safety_alert_message(self, area, crime_type):
         """Generate safety alert message in Haitian Creole"""
         messages = {
@@ -109,4 +192,8 @@ class SMSService:
     
     def is_available(self):
         """Check if SMS service is available"""
-        return self.client is not None or not Config.USE_REAL_SMS
\ No newline at end of file
+        return self.gateway.is_available()
+    
+    def get_provider_status(self):
+        """Per-provider health, throttling and counters"""
+        return self.gateway.get_status()
\ No newline at end of file
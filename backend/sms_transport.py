@@ -0,0 +1,58 @@
+"""
+Shared HTTP transport for SMS providers
+
+One requests Session per process, with an HTTPAdapter pool sized for the
+dispatcher's sender threads, used by every HTTP-based provider (the Twilio
+SDK client included). Keep-alive connections are reused across threads,
+so concurrent sends don't each pay a TCP + TLS handshake. The pool keeps
+SMS_HTTP_POOL_MAXSIZE connections per host (requests' default is 10, fewer
+than a busy dispatcher can have in flight). Benchmark with
+benchmark_sms_transport.py.
+"""
+import threading
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from config import Config
+
+_session = None
+_lock = threading.Lock()
+
+def timeout():
+    """(connect, read) timeout for provider requests"""
+    return (Config.SMS_HTTP_CONNECT_TIMEOUT, Config.SMS_HTTP_READ_TIMEOUT)
+
+def build_session(pool_connections=None, pool_maxsize=None):
+    """Create a Session with a tuned connection pool
+
+    pool_connections is the number of hosts kept pooled, pool_maxsize the
+    number of keep-alive connections kept per host.
+    """
+    pool_connections = pool_connections or Config.SMS_HTTP_POOL_CONNECTIONS
+    pool_maxsize = pool_maxsize or Config.SMS_HTTP_POOL_MAXSIZE or Config.SMS_DISPATCH_WORKERS
+    adapter = HTTPAdapter(
+        pool_connections=pool_connections,
+        pool_maxsize=pool_maxsize,
+        max_retries=0,  # retries belong to the dispatcher, which honors Retry-After
+        pool_block=False
+    )
+    session = requests.Session()
+    session.mount('https://', adapter)
+    session.mount('http://', adapter)
+    return session
+
+def get_session():
+    """The process-wide pooled Session (created on first use)"""
+    global _session
+    with _lock:
+        if _session is None:
+            _session = build_session()
+        return _session
+
+def close_session():
+    global _session
+    with _lock:
+        if _session is not None:
+            _session.close()
+            _session = None
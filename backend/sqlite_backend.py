@@ -0,0 +1,408 @@
+"""
+SQLite storage backend (default single-node store)
+
+Queries run against the indexed columns of sqlite_storage.SCHEMA.
+"""
+import os
+from datetime import datetime, timedelta
+
+from config import Config
+from frequency_cap import count_sends
+from sqlite_storage import SQLiteStorage, to_iso
+from storage_backend import StorageBackend
+
+# Phones per IN (...) query, under SQLite's bound parameter limit
+SQL_BATCH = 500
+
+class SQLiteBackend(StorageBackend):
+    kind = 'sqlite'
+    label = 'SQLite'
+
+    def __init__(self, path=None):
+        """Open (or create) the database, importing existing JSON data on first run"""
+        path = path or Config.SQLITE_PATH or os.path.join(Config.DATA_DIR, 'alatem.sqlite3')
+        self.sqlite = SQLiteStorage(path)
+        print(f"🗄️ SQLite storage initialized ({path})")
+        if self.sqlite.created:
+            # One write transaction for the check and the import: when several workers
+            # start together, the first imports and the others find the tables filled
+            with self.sqlite.transaction() as conn:
+                counts = self.sqlite.import_json_dir(Config.DATA_DIR, conn=conn) if self.sqlite.is_empty(conn) else {}
+            if any(counts.values()):
+                print(f"📦 Imported {sum(counts.values())} records from JSON files in {Config.DATA_DIR}")
+    
+    # User Management Methods
+    def save_user(self, user_data):
+        return self.sqlite.replace('users', [user_data])
+    
+    def find_user_by_phone(self, phone):
+        return self.sqlite.find_one('users', 'phone = ?', (phone,))
+    
+    def update_user_verified(self, phone):
+        verified_at = datetime.utcnow().isoformat()
+        return self.sqlite.update(
+            'users', 'phone = ?', (phone,),
+            lambda user: user.update(verified=True, verified_at=verified_at)
+        ) > 0
+    
+    def update_user_sms_status(self, phone, message_type, status):
+        entry = {"status": status, "updated_at": datetime.utcnow().isoformat()}
+        return self.sqlite.update(
+            'users', 'phone = ?', (phone,),
+            lambda user: user.setdefault('sms_status', {}).update({message_type: entry})
+        ) > 0
+    
+    def get_users_by_area(self, area, verified_only=True):
+        where = 'area = ? AND active = 1' + (' AND verified = 1' if verified_only else '')
+        return self.sqlite.find('users', where, (area,))
+    
+    def get_users_by_areas(self, areas, verified_only=True):
+        areas = list(areas)
+        where = f"area IN ({', '.join('?' for _ in areas)}) AND active = 1"
+        if verified_only:
+            where += ' AND verified = 1'
+        return self.sqlite.find('users', where, areas)
+    
+    def get_area_stats(self):
+        rows = self.sqlite.connection().execute(
+            'SELECT area, COUNT(*) FROM users WHERE verified = 1 AND active = 1 AND area IS NOT NULL '
+            'GROUP BY area ORDER BY area'
+        ).fetchall()
+        return [{'_id': area, 'user_count': count} for area, count in rows]
+    
+    # Staff User Management
+    def save_staff_user(self, staff_data):
+        return self.sqlite.insert('staff_users', [staff_data])
+    
+    def find_staff_user(self, username):
+        return self.sqlite.find_one('staff_users', 'username = ? AND is_active = 1', (username,))
+    
+    def update_staff_login(self, user_id, login_time):
+        return self.sqlite.update(
+            'staff_users', 'id = ?', (user_id,),
+            lambda user: user.update(last_login=login_time.isoformat())
+        ) > 0
+    
+    def update_staff_logins(self, logins):
+        if not logins:
+            return None
+        ids = list(logins)
+        return self.sqlite.update(
+            'staff_users', f"id IN ({', '.join('?' for _ in ids)})", ids,
+            lambda user: user.update(last_login=logins[user['id']].isoformat())
+        )
+    
+    # Reports Management
+    def save_health_report(self, report_data):
+        return self.sqlite.insert('health_reports', [report_data])
+    
+    def save_crime_report(self, report_data):
+        return self.sqlite.insert('crime_reports', [report_data])
+    
+    def get_recent_health_reports(self, area, condition, since_date):
+        return self.sqlite.find(
+            'health_reports', 'area = ? AND condition = ? AND timestamp >= ?',
+            (area, condition, to_iso(since_date))
+        )
+    
+    def get_recent_crime_reports(self, area, since_date):
+        return self.sqlite.count('crime_reports', 'area = ? AND timestamp >= ?', (area, to_iso(since_date)))
+    
+    def get_daily_health_report_counts(self, area, condition, since_date):
+        return self._daily_counts(
+            'health_reports', 'area = ? AND condition = ? AND timestamp >= ?', (area, condition, to_iso(since_date))
+        )
+    
+    def get_daily_crime_report_counts(self, area, since_date):
+        return self._daily_counts('crime_reports', 'area = ? AND timestamp >= ?', (area, to_iso(since_date)))
+    
+    def _daily_counts(self, table, where, params):
+        # Timestamps are ISO strings: the first 10 characters are the day
+        rows = self.sqlite.connection().execute(
+            f'SELECT substr(timestamp, 1, 10) AS day, COUNT(*) FROM {table} WHERE {where} GROUP BY day ORDER BY day',
+            params
+        ).fetchall()
+        return [{'day': day, 'count': count} for day, count in rows]
+    
+    # Alert Management
+    def save_alert(self, alert_data):
+        return self.sqlite.insert('sent_alerts', [alert_data])
+    
+    def save_alerts(self, alerts):
+        if not alerts:
+            return None
+        return self.sqlite.insert('sent_alerts', alerts)
+    
+    def get_alerts_history(self, area, limit=50, alert_type=None):
+        where, params = 'area = ?', [area]
+        if alert_type:
+            where += ' AND alert_type = ?'
+            params.append(alert_type)
+        return self.sqlite.find('sent_alerts', where, params, order='timestamp DESC', limit=limit)
+    
+    def get_recent_alerts(self, hours=24, area=None):
+        since_date = datetime.utcnow() - timedelta(hours=hours)
+        
+        where, params = 'timestamp >= ?', [to_iso(since_date)]
+        if area:
+            where += ' AND area = ?'
+            params.append(area)
+        return self.sqlite.find('sent_alerts', where, params, order='timestamp DESC')
+    
+    # SMS Delivery Tracking
+    def save_sms_job(self, job_data):
+        return self.sqlite.replace('sms_jobs', [job_data])
+    
+    def update_sms_job(self, job_id, fields=None, increments=None):
+        def apply(job):
+            job.update(fields or {})
+            for key, amount in (increments or {}).items():
+                job[key] = job.get(key, 0) + amount
+        return self.sqlite.update('sms_jobs', 'id = ?', (job_id,), apply) > 0
+    
+    def find_sms_job(self, job_id):
+        return self.sqlite.find_one('sms_jobs', 'id = ?', (job_id,))
+    
+    def save_sms_retry(self, retry_data):
+        return self.sqlite.replace('sms_retries', [retry_data])
+    
+    def delete_sms_retry(self, retry_id):
+        return self.sqlite.delete('sms_retries', 'id = ?', (retry_id,)) > 0
+    
+    def get_sms_retries(self):
+        return self.sqlite.find('sms_retries')
+    
+    def claim_sms_retries(self, owner, lease_expires_at):
+        claimed = []
+        
+        def claim(retry):
+            retry.update(owner=owner, lease_expires_at=to_iso(lease_expires_at))
+            claimed.append(retry)
+        # One write transaction: of several workers starting together, one takes each retry
+        self.sqlite.update(
+            'sms_retries', "COALESCE(json_extract(doc, '$.lease_expires_at'), '') <= ?",
+            (datetime.utcnow().isoformat(),), claim
+        )
+        return claimed
+    
+    def save_dead_letter(self, entry):
+        return self.sqlite.insert('sms_dead_letters', [entry])
+    
+    def save_dead_letters(self, entries):
+        if not entries:
+            return None
+        return self.sqlite.insert('sms_dead_letters', entries)
+    
+    def get_dead_letters(self, job_id, status=None):
+        where, params = 'job_id = ?', [job_id]
+        if status:
+            where += ' AND status = ?'
+            params.append(status)
+        return self.sqlite.find('sms_dead_letters', where, params, order='failed_at')
+    
+    def update_dead_letters(self, ids, fields):
+        ids = list(ids)
+        return self.sqlite.update(
+            'sms_dead_letters', f"id IN ({', '.join('?' for _ in ids)})", ids,
+            lambda entry: entry.update(fields)
+        )
+    
+    def renew_sms_leases(self, owner, lease_expires_at, progress):
+        renewed = self.sqlite.update(
+            'sms_retries', "json_extract(doc, '$.owner') = ?", (owner,),
+            lambda retry: retry.update(lease_expires_at=to_iso(lease_expires_at))
+        )
+        if not progress:
+            return renewed
+        ids = list(progress)
+        return renewed + self.sqlite.update(
+            'sms_jobs',
+            f"id IN ({', '.join('?' for _ in ids)}) AND json_extract(doc, '$.owner') = ? "
+            "AND json_extract(doc, '$.status') = 'running'",
+            ids + [owner],
+            lambda job: job.update(progress[job['id']], lease_expires_at=to_iso(lease_expires_at))
+        )
+    
+    def claim_interrupted_sms_jobs(self, owner, lease_expires_at):
+        claimed = []
+        
+        def claim(job):
+            job.update(owner=owner, lease_expires_at=to_iso(lease_expires_at))
+            claimed.append(job)
+        # One write transaction: of several workers starting together, one takes each job
+        self.sqlite.update(
+            'sms_jobs',
+            "json_extract(doc, '$.status') = 'running' AND COALESCE(json_extract(doc, '$.lease_expires_at'), '') <= ?",
+            (datetime.utcnow().isoformat(),),
+            claim
+        )
+        return claimed
+    
+    def get_sms_deliveries(self, sids):
+        if not sids:
+            return {}
+        sids = list(sids)
+        found = self.sqlite.find('sms_deliveries', f"sid IN ({', '.join('?' for _ in sids)})", sids)
+        return {d['sid']: d for d in found}
+    
+    def save_sms_deliveries(self, updates):
+        if not updates:
+            return None
+        sids = [sid for sid, _, _ in updates]
+        with self.sqlite.transaction() as conn:
+            by_sid = {d['sid']: d for d in self.sqlite.find(
+                'sms_deliveries', f"sid IN ({', '.join('?' for _ in sids)})", sids, conn=conn
+            )}
+            for sid, set_fields, insert_fields in updates:
+                record = by_sid.get(sid)
+                if record is None:
+                    record = by_sid[sid] = dict(insert_fields, sid=sid)
+                record.update(set_fields)
+            self.sqlite.replace('sms_deliveries', list(by_sid.values()), conn=conn)
+        return True
+    
+    def increment_sms_job_delivery(self, job_id, increments):
+        def apply(job):
+            delivery = job.setdefault('delivery', {})
+            for status, count in increments.items():
+                delivery[status] = delivery.get(status, 0) + count
+        return self.sqlite.update('sms_jobs', 'id = ?', (job_id,), apply) > 0
+    
+    # SMS Frequency Cap
+    def admit_sms_sends(self, phones, limit, window, now, bypass=False):
+        phones = list(dict.fromkeys(phones))
+        expires_at = datetime.utcfromtimestamp(now + window).isoformat()
+        # One write transaction: concurrent checks from other workers wait, then see these sends
+        with self.sqlite.transaction() as conn:
+            self.sqlite.delete('sms_send_windows', 'expires_at <= ?', (datetime.utcfromtimestamp(now).isoformat(),), conn=conn)
+            windows = {}
+            for start in range(0, len(phones), SQL_BATCH):
+                batch = phones[start:start + SQL_BATCH]
+                for entry in self.sqlite.find(
+                    'sms_send_windows', f"phone IN ({', '.join('?' for _ in batch)})", batch, conn=conn
+                ):
+                    windows[entry['phone']] = entry['sent_at']
+            capped, counted = count_sends(windows, phones, limit, window, now, bypass)
+            self.sqlite.replace('sms_send_windows', [
+                {"phone": phone, "sent_at": windows[phone], "expires_at": expires_at} for phone in counted
+            ], conn=conn)
+        return capped
+    
+    def release_sms_sends(self, phones, sent_at):
+        phones = list(phones)
+        
+        def release(entry):
+            if sent_at in entry.get('sent_at', []):
+                entry['sent_at'].remove(sent_at)
+        released = 0
+        for start in range(0, len(phones), SQL_BATCH):
+            batch = phones[start:start + SQL_BATCH]
+            released += self.sqlite.update(
+                'sms_send_windows', f"phone IN ({', '.join('?' for _ in batch)})", batch, release
+            )
+        return released
+    
+    # Broadcast Idempotency Keys
+    def claim_broadcast_key(self, key, record, expires_at):
+        now = datetime.utcnow()
+        with self.sqlite.transaction() as conn:
+            self.sqlite.delete('broadcast_keys', 'key = ? AND expires_at <= ?', (key, now.isoformat()), conn=conn)
+            existing = self.sqlite.find_one('broadcast_keys', 'key = ?', (key,), conn=conn)
+            if existing is not None:
+                return existing
+            self.sqlite.insert('broadcast_keys', [dict(record, key=key, expires_at=expires_at.isoformat())], conn=conn)
+            return None
+    
+    def find_broadcast_key(self, key):
+        now = datetime.utcnow()
+        return self.sqlite.find_one('broadcast_keys', 'key = ? AND expires_at > ?', (key, now.isoformat()))
+    
+    def complete_broadcast_key(self, key, fields):
+        return self.sqlite.update('broadcast_keys', 'key = ?', (key,), lambda entry: entry.update(fields))
+    
+    def release_broadcast_key(self, key, job_id=None):
+        if job_id is None:
+            return self.sqlite.delete('broadcast_keys', 'key = ?', (key,))
+        with self.sqlite.transaction() as conn:
+            existing = self.sqlite.find_one('broadcast_keys', 'key = ?', (key,), conn=conn)
+            if existing is None or existing.get('job_id') != job_id:
+                return 0
+            return self.sqlite.delete('broadcast_keys', 'key = ?', (key,), conn=conn)
+    
+    # Prediction Management
+    def save_prediction(self, prediction_data):
+        with self.sqlite.transaction() as conn:
+            # Replace the prediction for the same area/date/type/condition (IS matches NULL conditions)
+            self.sqlite.delete(
+                'predictions', 'area = ? AND date = ? AND type = ? AND condition IS ?',
+                (prediction_data['area'], prediction_data['date'], prediction_data['type'],
+                 prediction_data.get('condition')),
+                conn=conn
+            )
+            return self.sqlite.insert('predictions', [prediction_data], conn=conn)
+    
+    def get_latest_predictions(self, area=None, limit=20):
+        if area:
+            return self.sqlite.find('predictions', 'area = ?', (area,), order='timestamp DESC', limit=limit)
+        return self.sqlite.find('predictions', order='timestamp DESC', limit=limit)
+    
+    # Retention
+    def get_oldest_timestamp(self, collection):
+        return self.sqlite.connection().execute(f'SELECT MIN(timestamp) FROM {collection}').fetchone()[0]
+    
+    def get_records_between(self, collection, start, end):
+        return self.sqlite.find(collection, 'timestamp >= ? AND timestamp < ?', (to_iso(start), to_iso(end)))
+    
+    def delete_records_between(self, collection, start, end):
+        return self.sqlite.delete(collection, 'timestamp >= ? AND timestamp < ?', (to_iso(start), to_iso(end)))
+    
+    def save_rollups(self, collection, rollups):
+        return self.sqlite.replace(collection, rollups)
+    
+    def get_rollups(self, collection, area=None, since_day=None):
+        conditions, params = [], []
+        if area:
+            conditions.append('area = ?')
+            params.append(area)
+        if since_day:
+            conditions.append('day >= ?')
+            params.append(since_day)
+        return self.sqlite.find(collection, ' AND '.join(conditions), params, order='day')
+    
+    def claim_retention_lease(self, owner, lease_expires_at):
+        with self.sqlite.transaction() as conn:
+            lease = self.sqlite.find_one('retention_leases', 'name = ?', ('retention',), conn=conn)
+            if lease and lease.get('owner') != owner and (lease.get('lease_expires_at') or '') > datetime.utcnow().isoformat():
+                return False
+            self.sqlite.replace('retention_leases', [
+                {"name": "retention", "owner": owner, "lease_expires_at": to_iso(lease_expires_at)}
+            ], conn=conn)
+        return True
+    
+    # Statistics
+    def get_stats(self):
+        yesterday = (datetime.utcnow() - timedelta(days=1)).isoformat()
+        count = self.sqlite.count
+        return {
+            'users': {
+                'total': count('users'),
+                'verified': count('users', 'verified = 1'),
+                'active': count('users', 'active = 1')
+            },
+            'staff': {
+                'total': count('staff_users'),
+                'active': count('staff_users', 'is_active = 1')
+            },
+            'reports': {
+                'health_reports': count('health_reports'),
+                'crime_reports': count('crime_reports'),
+                'alerts_sent': count('sent_alerts'),
+                'predictions': count('predictions')
+            },
+            'recent_activity': {
+                'health_reports_24h': count('health_reports', 'timestamp >= ?', (yesterday,)),
+                'crime_reports_24h': count('crime_reports', 'timestamp >= ?', (yesterday,)),
+                'alerts_sent_24h': count('sent_alerts', 'timestamp >= ?', (yesterday,)),
+                'predictions_24h': count('predictions', 'timestamp >= ?', (yesterday,))
+            }
+        }
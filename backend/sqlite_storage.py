@@ -0,0 +1,296 @@
+"""
+SQLite document storage for DatabaseManager
+
+Each collection is a table holding the full record as JSON in `doc`, plus
+the fields DatabaseManager filters, sorts or enforces uniqueness on,
+copied into indexed columns on every write. Reads return the same
+dictionaries as the JSON backend (timestamps as ISO strings).
+
+Connections are per thread (a thread-local pool) in WAL mode, so request
+threads and the SMS dispatcher read concurrently while one writer commits.
+Read-modify-write updates run inside BEGIN IMMEDIATE transactions.
+"""
+import json
+import os
+import sqlite3
+import threading
+from contextlib import contextmanager
+from datetime import datetime, timezone
+
+# table -> indexed columns, unique keys and secondary indexes.
+# Columns listed in TIME_COLUMNS are stored as normalized UTC ISO strings so
+# range comparisons work on the text; BOOL_DEFAULTS fills flags the record omits.
+SCHEMA = {
+    'users': {
+        'columns': ['phone', 'area', 'verified', 'active'],
+        'unique': ['phone'],
+        'indexes': [['area', 'verified', 'active'], ['verified'], ['active']]
+    },
+    'staff_users': {
+        'columns': ['id', 'username', 'is_active'],
+        'unique': ['username'],
+        'indexes': [['id']]
+    },
+    'health_reports': {
+        'columns': ['area', 'condition', 'timestamp'],
+        'indexes': [['area', 'condition', 'timestamp'], ['timestamp']]
+    },
+    'crime_reports': {
+        'columns': ['area', 'timestamp'],
+        'indexes': [['area', 'timestamp'], ['timestamp']]
+    },
+    'sent_alerts': {
+        'columns': ['area', 'alert_type', 'timestamp'],
+        'indexes': [['area', 'timestamp'], ['timestamp']]
+    },
+    'predictions': {
+        'columns': ['area', 'date', 'type', 'condition', 'timestamp'],
+        'indexes': [['area', 'date', 'type', 'condition'], ['area', 'timestamp'], ['timestamp']]
+    },
+    'prediction_rollups': {
+        'columns': ['key', 'area', 'day'],
+        'unique': ['key'],
+        'indexes': [['area', 'day'], ['day']]
+    },
+    'alert_rollups': {
+        'columns': ['key', 'area', 'day'],
+        'unique': ['key'],
+        'indexes': [['area', 'day'], ['day']]
+    },
+    'sms_jobs': {'columns': ['id'], 'unique': ['id']},
+    'sms_retries': {'columns': ['id'], 'unique': ['id']},
+    'sms_dead_letters': {
+        'columns': ['id', 'job_id', 'status', 'failed_at'],
+        'indexes': [['job_id', 'status'], ['id']]
+    },
+    'sms_deliveries': {
+        'columns': ['sid', 'job_id'],
+        'unique': ['sid'],
+        'indexes': [['job_id']]
+    },
+    'sms_send_windows': {
+        'columns': ['phone', 'expires_at'],
+        'unique': ['phone'],
+        'indexes': [['expires_at']]
+    },
+    'broadcast_keys': {
+        'columns': ['key', 'expires_at'],
+        'unique': ['key'],
+        'indexes': [['expires_at']]
+    },
+    'retention_leases': {'columns': ['name'], 'unique': ['name']}
+}
+
+TIME_COLUMNS = {'timestamp', 'expires_at', 'failed_at'}
+BOOL_DEFAULTS = {('users', 'active'): True, ('users', 'verified'): False}
+
+def to_iso(value):
+    """Normalize a datetime or ISO string to a naive UTC ISO string (None if unparseable)"""
+    if value is None:
+        return None
+    if isinstance(value, str):
+        try:
+            value = datetime.fromisoformat(value.replace('Z', '+00:00'))
+        except ValueError:
+            return value
+    if isinstance(value, datetime):
+        if value.tzinfo is not None:
+            value = value.astimezone(timezone.utc).replace(tzinfo=None)
+        return value.isoformat()
+    return value
+
+def json_default(value):
+    """json.dump default shared by the file and SQLite stores: datetimes as ISO strings"""
+    if isinstance(value, datetime):
+        return value.isoformat()
+    return str(value)
+
+class SQLiteStorage:
+    def __init__(self, path):
+        self.path = path
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self.created = not os.path.exists(path)
+        self._local = threading.local()
+        self._create_schema()
+
+    # ======================
+    # CONNECTIONS
+    # ======================
+
+    def connection(self):
+        """This thread's connection (opened on first use)"""
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute("PRAGMA busy_timeout=30000")
+            self._local.conn = conn
+        return conn
+
+    @contextmanager
+    def transaction(self):
+        """BEGIN IMMEDIATE ... COMMIT: takes the write lock up front, so read-modify-write is atomic"""
+        conn = self.connection()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            yield conn
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        else:
+            conn.execute("COMMIT")
+
+    def _create_schema(self):
+        with self.transaction() as conn:
+            for table, spec in SCHEMA.items():
+                columns = ', '.join(f'"{c}"' for c in spec['columns'])
+                conn.execute(
+                    f'CREATE TABLE IF NOT EXISTS {table} (rowid INTEGER PRIMARY KEY, {columns}, doc TEXT NOT NULL)'
+                )
+                if spec.get('unique'):
+                    conn.execute(
+                        f'CREATE UNIQUE INDEX IF NOT EXISTS {table}_unique ON {table} '
+                        f'({", ".join(chr(34) + c + chr(34) for c in spec["unique"])})'
+                    )
+                for index in spec.get('indexes', []):
+                    conn.execute(
+                        f'CREATE INDEX IF NOT EXISTS {table}_{"_".join(index)} ON {table} '
+                        f'({", ".join(chr(34) + c + chr(34) for c in index)})'
+                    )
+
+    # ======================
+    # ROWS
+    # ======================
+
+    def _row(self, table, doc):
+        """Column values and serialized document for a record"""
+        values = []
+        for column in SCHEMA[table]['columns']:
+            value = doc.get(column, BOOL_DEFAULTS.get((table, column)))
+            if column in TIME_COLUMNS:
+                value = to_iso(value)
+            elif isinstance(value, bool):
+                value = int(value)
+            values.append(value)
+        values.append(json.dumps(doc, default=json_default))
+        return values
+
+    def _placeholders(self, table):
+        columns = SCHEMA[table]['columns'] + ['doc']
+        return ', '.join(f'"{c}"' for c in columns), ', '.join('?' for _ in columns)
+
+    def insert(self, table, docs, conn=None):
+        """Insert records; returns the number inserted"""
+        columns, marks = self._placeholders(table)
+        rows = [self._row(table, doc) for doc in docs]
+        if conn is not None:
+            conn.executemany(f'INSERT INTO {table} ({columns}) VALUES ({marks})', rows)
+        else:
+            with self.transaction() as conn:
+                conn.executemany(f'INSERT INTO {table} ({columns}) VALUES ({marks})', rows)
+        return len(rows)
+
+    def replace(self, table, docs, conn=None):
+        """Insert records, replacing any with the same unique key"""
+        columns, marks = self._placeholders(table)
+        rows = [self._row(table, doc) for doc in docs]
+        if conn is not None:
+            conn.executemany(f'INSERT OR REPLACE INTO {table} ({columns}) VALUES ({marks})', rows)
+        else:
+            with self.transaction() as conn:
+                conn.executemany(f'INSERT OR REPLACE INTO {table} ({columns}) VALUES ({marks})', rows)
+        return len(rows)
+
+    def find(self, table, where='', params=(), order=None, limit=None, conn=None):
+        """Records matching a SQL condition on the indexed columns"""
+        sql = f'SELECT doc FROM {table}'
+        if where:
+            sql += f' WHERE {where}'
+        if order:
+            sql += f' ORDER BY {order}'
+        if limit is not None:
+            sql += f' LIMIT {int(limit)}'
+        rows = (conn or self.connection()).execute(sql, tuple(params)).fetchall()
+        return [json.loads(row[0]) for row in rows]
+
+    def find_one(self, table, where='', params=(), conn=None):
+        found = self.find(table, where, params, limit=1, conn=conn)
+        return found[0] if found else None
+
+    def count(self, table, where='', params=()):
+        sql = f'SELECT COUNT(*) FROM {table}' + (f' WHERE {where}' if where else '')
+        return self.connection().execute(sql, tuple(params)).fetchone()[0]
+
+    def update(self, table, where, params, mutate):
+        """Apply mutate(doc) to every matching record in one transaction; returns the count"""
+        with self.transaction() as conn:
+            rows = conn.execute(f'SELECT rowid, doc FROM {table} WHERE {where}', tuple(params)).fetchall()
+            self._rewrite(conn, table, [(rowid, json.loads(doc)) for rowid, doc in rows], mutate)
+        return len(rows)
+
+    def _rewrite(self, conn, table, rows, mutate):
+        assignments = ', '.join(f'"{c}" = ?' for c in SCHEMA[table]['columns'] + ['doc'])
+        updates = []
+        for rowid, doc in rows:
+            mutate(doc)
+            updates.append(self._row(table, doc) + [rowid])
+        conn.executemany(f'UPDATE {table} SET {assignments} WHERE rowid = ?', updates)
+
+    def delete(self, table, where, params=(), conn=None):
+        sql = f'DELETE FROM {table} WHERE {where}'
+        if conn is not None:
+            return conn.execute(sql, tuple(params)).rowcount
+        with self.transaction() as conn:
+            return conn.execute(sql, tuple(params)).rowcount
+
+    def is_empty(self, conn=None):
+        conn = conn or self.connection()
+        return all(conn.execute(f'SELECT 1 FROM {table} LIMIT 1').fetchone() is None for table in SCHEMA)
+
+    # ======================
+    # IMPORT
+    # ======================
+
+    def import_json_dir(self, data_dir, replace=False, conn=None):
+        """Load JSON backend files (data/*.json and data/segments/) into the tables
+
+        Returns {table: records imported}. With replace, tables are emptied first.
+        Each table is imported in its own transaction unless conn is given.
+        """
+        from segment_store import SegmentStore
+
+        counts = {}
+        for table in SCHEMA:
+            filename = os.path.join(data_dir, f'{table}.json')
+            segments_dir = os.path.join(data_dir, 'segments', table)
+            if os.path.exists(os.path.join(segments_dir, 'manifest.json')):
+                # Time-partitioned collections of the JSON backend (live segments only)
+                records = list(SegmentStore(segments_dir).query())
+            elif os.path.exists(filename):
+                try:
+                    with open(filename, 'r', encoding='utf-8') as f:
+                        records = json.load(f)
+                except json.JSONDecodeError as e:
+                    print(f"⚠️ Skipping {filename}: {e}")
+                    continue
+            else:
+                continue
+            if conn is not None:
+                self._import_table(conn, table, records, replace)
+            else:
+                with self.transaction() as table_conn:
+                    self._import_table(table_conn, table, records, replace)
+            counts[table] = len(records)
+        return counts
+
+    def _import_table(self, conn, table, records, replace):
+        if replace:
+            conn.execute(f'DELETE FROM {table}')
+        # Later records win on unique keys, as with the JSON backend's upserts
+        if SCHEMA[table].get('unique'):
+            self.replace(table, records, conn=conn)
+        else:
+            self.insert(table, records, conn=conn)
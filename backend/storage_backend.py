@@ -0,0 +1,402 @@
+"""
+Storage backend interface for DatabaseManager
+
+StorageBackend lists every storage operation the services use. Each backend
+(MongoBackend, SQLiteBackend, JSONBackend) implements all of them against
+its own store and is chosen once at startup (database.build_backend).
+
+Cross-cutting behaviour lives in layers that wrap the interface instead of
+in the backends: a StorageLayer wraps each operation of the backend (or
+layer) beneath it, and passes any other attribute straight through, so
+layers compose in any order:
+
+    CachedStorage(InstrumentedStorage(SQLiteBackend(path)))
+
+- InstrumentedStorage: per-operation latency and error metrics
+- CachedStorage: short-lived read cache for aggregate queries, dropped
+  whenever an operation writes to a collection the query reads
+"""
+import copy
+import threading
+import time
+
+from config import Config
+from metrics import instrument_db, record_cache_lookup
+
+class StorageBackend:
+    kind = 'base'
+    label = 'Storage'
+    # Callers store datetimes (Mongo) or ISO strings (everything else) in timestamps
+    use_mongodb = False
+
+    # User Management Methods
+    def save_user(self, user_data):
+        """Save or update user"""
+        raise NotImplementedError
+    
+    def find_user_by_phone(self, phone):
+        """Find user by phone number"""
+        raise NotImplementedError
+    
+    def update_user_verified(self, phone):
+        """Mark user as verified"""
+        raise NotImplementedError
+    
+    def update_user_sms_status(self, phone, message_type, status):
+        """Record the outcome of a transactional SMS (otp, welcome) on the user"""
+        raise NotImplementedError
+    
+    def get_users_by_area(self, area, verified_only=True):
+        """Get all users in a specific area"""
+        raise NotImplementedError
+    
+    def get_users_by_areas(self, areas, verified_only=True):
+        """Get all users in any of several areas, in one query"""
+        raise NotImplementedError
+    
+    def get_area_stats(self):
+        """Get user count statistics by area"""
+        raise NotImplementedError
+    
+    # Staff User Management
+    def save_staff_user(self, staff_data):
+        """Save staff user"""
+        raise NotImplementedError
+    
+    def find_staff_user(self, username):
+        """Find staff user by username"""
+        raise NotImplementedError
+    
+    def update_staff_login(self, user_id, login_time):
+        """Update staff user last login"""
+        raise NotImplementedError
+    
+    def update_staff_logins(self, logins):
+        """Update last_login of several staff users at once ({user_id: login_time})"""
+        raise NotImplementedError
+    
+    # Reports Management
+    def save_health_report(self, report_data):
+        """Save health report"""
+        raise NotImplementedError
+    
+    def save_crime_report(self, report_data):
+        """Save crime report"""
+        raise NotImplementedError
+    
+    def get_recent_health_reports(self, area, condition, since_date):
+        """Get recent health reports for ML predictions"""
+        raise NotImplementedError
+    
+    def get_recent_crime_reports(self, area, since_date):
+        """Get recent crime report count"""
+        raise NotImplementedError
+    
+    def get_daily_health_report_counts(self, area, condition, since_date):
+        """Health reports per day since since_date: [{'day': 'YYYY-MM-DD', 'count'}], oldest first, empty days omitted"""
+        raise NotImplementedError
+    
+    def get_daily_crime_report_counts(self, area, since_date):
+        """Crime reports per day since since_date, like get_daily_health_report_counts"""
+        raise NotImplementedError
+    
+    # Alert Management
+    def save_alert(self, alert_data):
+        """Save sent alert"""
+        raise NotImplementedError
+    
+    def save_alerts(self, alerts):
+        """Save several sent alerts in one write"""
+        raise NotImplementedError
+    
+    def get_alerts_history(self, area, limit=50, alert_type=None):
+        """Get alert history for an area"""
+        raise NotImplementedError
+    
+    def get_recent_alerts(self, hours=24, area=None):
+        """Get recent alerts"""
+        raise NotImplementedError
+    
+    # SMS Delivery Tracking
+    def save_sms_job(self, job_data):
+        """Save or replace a bulk SMS job record"""
+        raise NotImplementedError
+    
+    def update_sms_job(self, job_id, fields=None, increments=None):
+        """Set fields and/or increment counters on a bulk SMS job"""
+        raise NotImplementedError
+    
+    def find_sms_job(self, job_id):
+        """Find a bulk SMS job by id"""
+        raise NotImplementedError
+    
+    def save_sms_retry(self, retry_data):
+        """Persist a scheduled SMS retry"""
+        raise NotImplementedError
+    
+    def delete_sms_retry(self, retry_id):
+        """Remove a retry once it was delivered or dead-lettered"""
+        raise NotImplementedError
+    
+    def get_sms_retries(self):
+        """All pending SMS retries"""
+        raise NotImplementedError
+    
+    def claim_sms_retries(self, owner, lease_expires_at):
+        """Lease to owner the retries whose lease expired (their process stopped); returns them"""
+        raise NotImplementedError
+    
+    def save_dead_letter(self, entry):
+        """Record an SMS that exhausted its retries"""
+        raise NotImplementedError
+    
+    def save_dead_letters(self, entries):
+        """Record several dead letters in one write"""
+        raise NotImplementedError
+    
+    def get_dead_letters(self, job_id, status=None):
+        """Dead letters for a bulk SMS job, optionally filtered by status"""
+        raise NotImplementedError
+    
+    def update_dead_letters(self, ids, fields):
+        """Set fields (e.g. status='redriven') on dead letters by id"""
+        raise NotImplementedError
+    
+    def renew_sms_leases(self, owner, lease_expires_at, progress):
+        """Extend the lease of the running jobs and the retries owner holds, checkpointing job progress
+        
+        progress is {job_id: fields}; a job another process took over is left alone.
+        """
+        raise NotImplementedError
+    
+    def claim_interrupted_sms_jobs(self, owner, lease_expires_at):
+        """Lease to owner the running jobs whose lease expired (their process stopped); returns them"""
+        raise NotImplementedError
+    
+    def get_sms_deliveries(self, sids):
+        """Delivery records by provider message id, as {sid: record}"""
+        raise NotImplementedError
+    
+    def save_sms_deliveries(self, updates):
+        """Bulk upsert delivery records from (sid, set_fields, insert_only_fields) tuples"""
+        raise NotImplementedError
+    
+    def increment_sms_job_delivery(self, job_id, increments):
+        """Add to the delivered/undelivered/failed counters of a bulk SMS job (and so its alert)"""
+        raise NotImplementedError
+    
+    # SMS Frequency Cap
+    def admit_sms_sends(self, phones, limit, window, now, bypass=False):
+        """Count a send at epoch now for each phone with fewer than limit in the last window seconds
+        
+        Check and count are atomic across processes; with bypass every phone
+        is counted. Returns the phones over the cap (not counted).
+        """
+        raise NotImplementedError
+    
+    def release_sms_sends(self, phones, sent_at):
+        """Uncount the send counted at epoch sent_at for each phone"""
+        raise NotImplementedError
+    
+    # Broadcast Idempotency Keys
+    def claim_broadcast_key(self, key, record, expires_at):
+        """Store an idempotency key unless it is already held
+        
+        Returns None when the key was claimed, otherwise the record of the
+        submission that holds it.
+        """
+        raise NotImplementedError
+    
+    def find_broadcast_key(self, key):
+        """Unexpired idempotency key record, or None"""
+        raise NotImplementedError
+    
+    def complete_broadcast_key(self, key, fields):
+        """Record the outcome of the submission holding a key"""
+        raise NotImplementedError
+    
+    def release_broadcast_key(self, key, job_id=None):
+        """Drop a key whose submission sent nothing, so it can be retried
+        
+        With job_id, only while the key is still held by that job's claim.
+        """
+        raise NotImplementedError
+    
+    # Prediction Management
+    def save_prediction(self, prediction_data):
+        """Save ML prediction"""
+        raise NotImplementedError
+    
+    def get_latest_predictions(self, area=None, limit=20):
+        """Get latest ML predictions"""
+        raise NotImplementedError
+    
+    # Retention
+    def get_oldest_timestamp(self, collection):
+        """Timestamp of the oldest raw record of a retained collection (predictions, sent_alerts), or None"""
+        raise NotImplementedError
+    
+    def get_records_between(self, collection, start, end):
+        """Raw records of a retained collection with start <= timestamp < end"""
+        raise NotImplementedError
+    
+    def delete_records_between(self, collection, start, end):
+        """Delete raw records with start <= timestamp < end; returns the number deleted"""
+        raise NotImplementedError
+    
+    def save_rollups(self, collection, rollups):
+        """Upsert daily summaries by their 'key' into prediction_rollups or alert_rollups"""
+        raise NotImplementedError
+    
+    def get_rollups(self, collection, area=None, since_day=None):
+        """Daily summaries, oldest first, optionally for one area and from a 'YYYY-MM-DD' day on"""
+        raise NotImplementedError
+    
+    def claim_retention_lease(self, owner, lease_expires_at):
+        """Take or renew the lease on retention runs, shared by every worker
+        
+        Succeeds (True) when the lease is free, lapsed or already owner's; it
+        is then held by owner until lease_expires_at.
+        """
+        raise NotImplementedError
+    
+    # Statistics
+    def get_stats(self):
+        """Get system statistics"""
+        raise NotImplementedError
+
+# Every operation of the interface
+OPERATIONS = tuple(
+    name for name, value in vars(StorageBackend).items()
+    if callable(value) and not name.startswith('_')
+)
+
+# Operations that change data, by the collections they write
+WRITE_OPERATIONS = {
+    'save_user': ('users',),
+    'update_user_verified': ('users',),
+    'update_user_sms_status': ('users',),
+    'save_staff_user': ('staff_users',),
+    'update_staff_login': ('staff_users',),
+    'update_staff_logins': ('staff_users',),
+    'save_health_report': ('health_reports',),
+    'save_crime_report': ('crime_reports',),
+    'save_alert': ('sent_alerts',),
+    'save_alerts': ('sent_alerts',),
+    'save_sms_job': ('sms_jobs',),
+    'update_sms_job': ('sms_jobs',),
+    'increment_sms_job_delivery': ('sms_jobs',),
+    'save_sms_retry': ('sms_retries',),
+    'delete_sms_retry': ('sms_retries',),
+    'claim_sms_retries': ('sms_retries',),
+    'save_dead_letter': ('sms_dead_letters',),
+    'save_dead_letters': ('sms_dead_letters',),
+    'update_dead_letters': ('sms_dead_letters',),
+    'renew_sms_leases': ('sms_jobs', 'sms_retries'),
+    'claim_interrupted_sms_jobs': ('sms_jobs',),
+    'save_sms_deliveries': ('sms_deliveries',),
+    'admit_sms_sends': ('sms_send_windows',),
+    'release_sms_sends': ('sms_send_windows',),
+    'claim_broadcast_key': ('broadcast_keys',),
+    'complete_broadcast_key': ('broadcast_keys',),
+    'release_broadcast_key': ('broadcast_keys',),
+    'save_prediction': ('predictions',),
+    'delete_records_between': ('predictions', 'sent_alerts'),
+    'save_rollups': ('prediction_rollups', 'alert_rollups'),
+    'claim_retention_lease': ('retention_leases',)
+}
+
+# Reads CachedStorage serves from memory, by the collections they read
+CACHED_READS = {
+    'get_stats': ('users', 'staff_users', 'health_reports', 'crime_reports', 'sent_alerts', 'predictions'),
+    'get_area_stats': ('users',)
+}
+
+class StorageLayer:
+    """Wraps every operation of an inner backend or layer; other attributes pass through"""
+
+    def __init__(self, inner):
+        self.inner = inner
+        for name in OPERATIONS:
+            setattr(self, name, self.wrap(name, getattr(inner, name)))
+
+    def wrap(self, name, operation):
+        return operation
+
+    def __getattr__(self, name):
+        # Only reached for attributes the layer doesn't define (kind, use_mongodb, collections...)
+        if 'inner' not in self.__dict__:
+            raise AttributeError(name)
+        return getattr(self.__dict__['inner'], name)
+
+class InstrumentedStorage(StorageLayer):
+    """Times every operation into alatem_db_operation_duration_seconds"""
+
+    def wrap(self, name, operation):
+        return instrument_db(self.inner.kind, operation)
+
+class CachedStorage(StorageLayer):
+    """Serves CACHED_READS from memory for DB_CACHE_TTL_SECONDS
+
+    Writes through this layer drop the cached reads of the collections they
+    touch. The cache is per process, so writes made by other workers show up
+    once the TTL runs out.
+    """
+
+    def __init__(self, inner, ttl=None, reads=None):
+        self.ttl = Config.DB_CACHE_TTL_SECONDS if ttl is None else ttl
+        self.reads = CACHED_READS if reads is None else reads
+        self._cache = {}  # (operation, args) -> (value, cached_at)
+        self._generation = 0  # bumped by every invalidation
+        self._lock = threading.Lock()
+        super().__init__(inner)
+
+    def wrap(self, name, operation):
+        if self.ttl <= 0:
+            return operation
+        if name in self.reads:
+            return self._cached(name, operation)
+        if name in WRITE_OPERATIONS:
+            return self._invalidating(name, operation)
+        return operation
+
+    def _cached(self, name, operation):
+        def cached(*args, **kwargs):
+            key = (name, repr(args), repr(sorted(kwargs.items())))
+            with self._lock:
+                entry = self._cache.get(key)
+                generation = self._generation
+            if entry and time.monotonic() - entry[1] < self.ttl:
+                record_cache_lookup(f'db_{name}', True)
+                return copy.deepcopy(entry[0])
+            record_cache_lookup(f'db_{name}', False)
+            value = operation(*args, **kwargs)
+            with self._lock:
+                # Not if a write landed while reading: the value may predate it
+                if generation == self._generation:
+                    self._cache[key] = (value, time.monotonic())
+            # Callers may modify what they get back (e.g. /stats adds keys)
+            return copy.deepcopy(value)
+        cached.__name__ = name
+        return cached
+
+    def _invalidating(self, name, operation):
+        stale = {read for read, collections in self.reads.items() if set(collections) & set(WRITE_OPERATIONS[name])}
+        if not stale:
+            return operation
+        def invalidating(*args, **kwargs):
+            try:
+                return operation(*args, **kwargs)
+            finally:
+                self.invalidate(stale)
+        invalidating.__name__ = name
+        return invalidating
+
+    def invalidate(self, reads=None):
+        """Drop cached results of the given reads (all of them by default)"""
+        with self._lock:
+            self._generation += 1
+            if reads is None:
+                self._cache.clear()
+            else:
+                self._cache = {key: entry for key, entry in self._cache.items() if key[0] not in reads}
@@ -0,0 +1,136 @@
+"""
+Structured, non-blocking logging for the Alatem backend
+
+Records are handed to a bounded in-memory queue (QueueHandler) and written
+by a background QueueListener thread, so request and broadcast threads
+never block on stdout or disk. Per-recipient SMS events go through a
+level-sampled logger so bulk sends cost a handful of lines, not one per
+recipient.
+"""
+import atexit
+import json
+import logging
+import logging.handlers
+import queue
+import random
+import sys
+import threading
+from datetime import datetime
+
+from config import Config
+
+ROOT_LOGGER = 'alatem'
+RECIPIENT_LOGGER = 'alatem.sms.recipient'
+
+_listener = None
+_setup_lock = threading.Lock()
+
+class JSONFormatter(logging.Formatter):
+    def format(self, record):
+        entry = {
+            'timestamp': datetime.utcfromtimestamp(record.created).isoformat() + 'Z',
+            'level': record.levelname,
+            'logger': record.name,
+            'message': record.getMessage()
+        }
+        entry.update(getattr(record, 'fields', {}))
+        if record.exc_info:
+            entry['exception'] = self.formatException(record.exc_info)
+        return json.dumps(entry, default=str, ensure_ascii=False)
+
+class TextFormatter(logging.Formatter):
+    def format(self, record):
+        fields = getattr(record, 'fields', {})
+        line = f"[{datetime.utcfromtimestamp(record.created).isoformat()}] {record.levelname} {record.name}: {record.getMessage()}"
+        if fields:
+            line += ' ' + ' '.join(f"{key}={value}" for key, value in fields.items())
+        if record.exc_info:
+            line += '\n' + self.formatException(record.exc_info)
+        return line
+
+class LevelSamplingFilter(logging.Filter):
+    """Keep a fraction of records per level (levels not listed are kept)"""
+
+    def __init__(self, rates):
+        super().__init__()
+        self.rates = rates
+
+    def filter(self, record):
+        rate = self.rates.get(record.levelno, 1.0)
+        return rate >= 1.0 or (rate > 0 and random.random() < rate)
+
+class DroppingQueueHandler(logging.handlers.QueueHandler):
+    """QueueHandler that drops (and counts) records instead of blocking when full"""
+
+    def __init__(self, log_queue):
+        super().__init__(log_queue)
+        self.dropped = 0
+
+    def prepare(self, record):
+        # Formatting happens on the listener thread, not the caller's
+        return record
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+def parse_sample_rates(spec):
+    """Parse 'DEBUG=0,INFO=0.01' into {logging.DEBUG: 0.0, logging.INFO: 0.01}"""
+    rates = {}
+    for part in (spec or '').split(','):
+        if '=' not in part:
+            continue
+        level_name, rate = part.split('=', 1)
+        level = logging.getLevelName(level_name.strip().upper())
+        if isinstance(level, int):
+            rates[level] = float(rate)
+    return rates
+
+def setup_logging():
+    """Install the queue handler and start the writer thread (idempotent)"""
+    global _listener
+
+    with _setup_lock:
+        if _listener is not None:
+            return
+
+        formatter = JSONFormatter() if Config.LOG_FORMAT == 'json' else TextFormatter()
+        handlers = [logging.StreamHandler(sys.stdout)]
+        if Config.LOG_FILE:
+            handlers.append(logging.handlers.WatchedFileHandler(Config.LOG_FILE, encoding='utf-8'))
+        for handler in handlers:
+            handler.setFormatter(formatter)
+
+        log_queue = queue.Queue(maxsize=Config.LOG_QUEUE_SIZE)
+        root = logging.getLogger(ROOT_LOGGER)
+        root.setLevel(Config.LOG_LEVEL)
+        root.addHandler(DroppingQueueHandler(log_queue))
+        root.propagate = False
+
+        recipient_logger = logging.getLogger(RECIPIENT_LOGGER)
+        recipient_logger.addFilter(LevelSamplingFilter(parse_sample_rates(Config.LOG_RECIPIENT_SAMPLE_RATES)))
+
+        _listener = logging.handlers.QueueListener(log_queue, *handlers, respect_handler_level=True)
+        _listener.start()
+        atexit.register(shutdown_logging)
+
+def shutdown_logging():
+    """Flush queued records and stop the writer thread"""
+    global _listener
+
+    with _setup_lock:
+        if _listener is not None:
+            _listener.stop()
+            _listener = None
+
+def get_logger(name):
+    """Return an alatem.<name> logger, setting up logging on first use"""
+    setup_logging()
+    return logging.getLogger(f"{ROOT_LOGGER}.{name}")
+
+def log_event(logger, level, message, **fields):
+    """Log a message with structured fields"""
+    if logger.isEnabledFor(level):
+        logger.log(level, message, extra={'fields': fields})
@@ -0,0 +1,84 @@
+import itertools
+from datetime import datetime, timedelta
+from types import SimpleNamespace
+
+import pytest
+
+from alert_service import AlertService
+from config import Config
+from sms_service import SMSService
+from sqlite_backend import SQLiteBackend
+
+STAFF = {'username': 'nurse', 'user_id': 'staff-1'}
+
+@pytest.fixture
+def db(tmp_path, monkeypatch):
+    monkeypatch.setattr(Config, 'DATA_DIR', str(tmp_path / 'empty'))
+    db = SQLiteBackend(str(tmp_path / 'alatem.sqlite3'))
+    for i in range(6):
+        db.save_user({'id': f'user-{i}', 'phone': f'+{i}', 'area': ['DELMAS', 'CARREFOUR'][i % 2],
+                      'verified': True, 'active': True})
+    return db
+
+@pytest.fixture
+def alerts(db):
+    ids = itertools.count()
+    auth = SimpleNamespace(generate_id=lambda: f'id-{next(ids)}', get_current_user=lambda: dict(STAFF))
+    return AlertService(db, SMSService(db), auth)
+
+def test_interrupted_broadcast_gets_its_alert_records(db, alerts):
+    encoded = alerts.sms.compile_message('ALET SANTE: cholera')
+    # Left running by a stopped process after two of five recipients; +5 was capped
+    db.save_sms_job({
+        'id': 'job-1', 'message': encoded.text, 'encoding': encoded.encoding, 'segments_per_message': 1,
+        'total': 5, 'sent': 2, 'failed': 0, 'retried': 0, 'status': 'running', 'owner': 'stopped',
+        'lease_expires_at': '2026-01-01T00:00:00', 'recipients': ['+0', '+1', '+2', '+3', '+4'], 'dispatched': 2,
+        'capped': 1, 'capped_phones': ['+5'],
+        'context': {'kind': 'broadcast', 'alert_type': 'health', 'areas': ['DELMAS', 'CARREFOUR'],
+                    'fields': {'condition': 'cholera'}, 'variants': alerts.sms.message_variants(encoded.text),
+                    'current_user': STAFF}
+    })
+
+    assert alerts.recover_interrupted_broadcasts() == 1
+    recorded = {
+        alert['area']: (alert['recipients_count'], alert['failed_count'], alert['capped_count'], alert['condition'])
+        for area in ('DELMAS', 'CARREFOUR') for alert in db.get_alerts_history(area)
+    }
+    # +2 +3 +4 were never reached
+    assert recorded == {'DELMAS': (1, 2, 0, 'cholera'), 'CARREFOUR': (1, 1, 1, 'cholera')}
+    assert db.find_sms_job('job-1')['status'] == 'interrupted'
+    assert alerts.recover_interrupted_broadcasts() == 0
+
+def test_broadcast_once_returns_the_first_result_for_a_key(alerts):
+    status, first = alerts.broadcast_once('health', ['DELMAS'], 'key-1', condition='cholera')
+    assert (status, first['success'], first['recipients_count']) == ('sent', True, 3)
+    assert alerts.broadcast_once('health', ['DELMAS'], 'key-1', condition='cholera') == ('duplicate', first)
+
+def test_identical_content_without_a_key_is_deduplicated(alerts):
+    _, first = alerts.broadcast_once('safety', ['CARREFOUR'], crime_type='kidnapping')
+    status, again = alerts.broadcast_once('safety', ['CARREFOUR'], crime_type='kidnapping')
+    assert (status, again['job_id']) == ('duplicate', first['job_id'])
+    assert alerts.broadcast_once('safety', ['CARREFOUR'], crime_type='armed_robbery')[0] == 'sent'
+
+def test_stale_claim_is_taken_over(db, alerts):
+    # A worker claimed the key long ago and died before its SMS job was saved
+    claimed_at = datetime.utcnow() - timedelta(seconds=Config.BROADCAST_CLAIM_STALE_SECONDS + 1)
+    db.claim_broadcast_key('client:key-2', {'job_id': 'lost', 'status': 'in_progress', 'created_at': claimed_at},
+                           expires_at=datetime.utcnow() + timedelta(hours=1))
+    status, result = alerts.broadcast_once('health', ['DELMAS'], 'key-2', condition='cholera')
+    assert status == 'sent'
+    assert db.find_broadcast_key('client:key-2')['job_id'] == result['job_id'] != 'lost'
+
+def test_recent_claim_is_in_progress(db, alerts):
+    db.claim_broadcast_key('client:key-3', {'job_id': 'busy', 'status': 'in_progress', 'created_at': datetime.utcnow()},
+                           expires_at=datetime.utcnow() + timedelta(hours=1))
+    status, result = alerts.broadcast_once('health', ['DELMAS'], 'key-3', condition='cholera')
+    assert (status, result['job_id']) == ('in_progress', 'busy')
+
+def test_key_is_released_when_the_broadcast_raises(db, alerts, monkeypatch):
+    def fail(*args, **kwargs):
+        raise RuntimeError("boom")
+    monkeypatch.setattr(alerts, 'broadcast_to_areas', fail)
+    with pytest.raises(RuntimeError):
+        alerts.broadcast_once('health', ['DELMAS'], 'key-4', condition='cholera')
+    assert db.find_broadcast_key('client:key-4') is None
@@ -0,0 +1,69 @@
+"""/broadcast through the Flask test client, against a scratch SQLite store"""
+import pytest
+
+from config import Config
+
+@pytest.fixture(scope='module')
+def app_module(tmp_path_factory):
+    data_dir = tmp_path_factory.mktemp('data')
+    patch = pytest.MonkeyPatch()
+    for name, value in {'DATA_DIR': str(data_dir), 'DATABASE_BACKEND': 'sqlite', 'SQLITE_PATH': None,
+                        'MONGODB_URI': None, 'OTP_STORE': 'memory', 'RETENTION_ENABLED': False,
+                        'RATE_LIMIT_ENABLED': False, 'SMS_FREQUENCY_CAP': 0}.items():
+        patch.setattr(Config, name, value)
+    import app
+    app.auth_service.create_default_admin()
+    for i in range(4):
+        app.db_manager.save_user({'id': f'user-{i}', 'name': f'User {i}', 'phone': f'+5093000000{i}',
+                                  'area': ['DELMAS', 'CARREFOUR'][i % 2], 'verified': True, 'active': True})
+    yield app
+    patch.undo()
+
+@pytest.fixture
+def client(app_module):
+    client = app_module.app.test_client()
+    assert client.post('/login', data={'username': 'admin', 'password': 'admin123'}).status_code == 302
+    return client
+
+def broadcast(client, key=None, **body):
+    return client.post('/broadcast', json=body, headers={'Idempotency-Key': key} if key else {})
+
+def test_repeated_request_returns_the_original_job(client):
+    body = {'alert_type': 'health', 'area': 'DELMAS', 'condition': 'cholera'}
+    first = broadcast(client, 'repeat', **body)
+    again = broadcast(client, 'repeat', **body)
+    assert first.status_code == 202
+    assert again.status_code == 200
+    assert again.get_json()['duplicate'] is True
+    assert again.get_json()['job_id'] == first.get_json()['job_id']
+
+def test_unknown_body_fields_are_ignored(client, app_module):
+    response = broadcast(client, 'stray-fields', alert_type='safety', area='CARREFOUR', crime_type='kidnapping',
+                         job_id='chosen-by-client', weight=50)
+    assert response.status_code == 202
+    job_id = response.get_json()['job_id']
+    assert job_id != 'chosen-by-client'
+    assert app_module.db_manager.find_broadcast_key('client:stray-fields')['job_id'] == job_id
+
+@pytest.mark.parametrize('body, error', [
+    ({'alert_type': 'flood', 'area': 'DELMAS'}, 'Invalid alert type'),
+    ({'alert_type': 'health', 'areas': 'DELMAS', 'condition': 'cholera'}, 'areas must be a list'),
+    ({'alert_type': 'health', 'areas': [['DELMAS']], 'condition': 'cholera'}, 'areas must be a list'),
+    ({'alert_type': 'health', 'areas': ['DELMAS', 'ATLANTIS'], 'condition': 'cholera'}, 'Invalid area: ATLANTIS'),
+    ({'alert_type': 'health', 'area': 'DELMAS', 'condition': 'ebola'}, 'Invalid health condition: ebola'),
+    ({'alert_type': 'health', 'area': 'DELMAS', 'conditions': 'cholera'}, 'conditions must be a list'),
+    ({'alert_type': 'safety', 'area': 'DELMAS'}, 'Invalid crime type: None'),
+    ({'alert_type': 'custom', 'area': 'DELMAS', 'message': '   '}, 'Custom message cannot be empty'),
+    ({'alert_type': 'custom', 'area': 'DELMAS', 'message': 'x' * 500}, 'Message too long'),
+], ids=['type', 'areas-string', 'areas-nested', 'area', 'condition', 'conditions-string', 'crime-type',
+        'empty-message', 'long-message'])
+def test_invalid_broadcasts_are_rejected(client, app_module, body, error):
+    response = broadcast(client, f'invalid-{error}', **body)
+    assert response.status_code == 400
+    assert error in response.get_json()['error']
+    assert app_module.db_manager.find_broadcast_key(f'client:invalid-{error}') is None
+
+def test_custom_message_within_the_limit_is_sent(client):
+    response = broadcast(client, 'custom', alert_type='custom', areas=['DELMAS', 'CARREFOUR'], message='x' * 160)
+    assert response.status_code == 202
+    assert response.get_json()['recipients_count'] == 4
@@ -0,0 +1,88 @@
+import threading
+import time
+from unittest import mock
+
+import pytest
+
+from config import Config
+from frequency_cap import FrequencyCap, count_sends
+from json_backend import JSONBackend
+from mongo_backend import MongoBackend
+from sms_dispatcher import SMSDispatcher
+from sms_encoding import analyze
+from sms_providers import SMSDeliveryError
+from sqlite_backend import SQLiteBackend
+
+NOW = float(int(time.time()))  # mongomock expires windows by the real clock
+WINDOW = 3600
+
+@pytest.fixture(params=['memory', 'json', 'sqlite', 'mongo'])
+def db(request, tmp_path, monkeypatch):
+    monkeypatch.setattr(Config, 'DATA_DIR', str(tmp_path / 'empty'))
+    if request.param == 'memory':
+        return None
+    if request.param == 'json':
+        return JSONBackend(str(tmp_path / 'json'))
+    if request.param == 'sqlite':
+        return SQLiteBackend(str(tmp_path / 'alatem.sqlite3'))
+    mongomock = pytest.importorskip('mongomock')
+    with mock.patch('mongo_backend.MongoClient', mongomock.MongoClient):
+        return MongoBackend('mongodb://localhost', 'alatem_test')
+
+def cap(db, limit=2):
+    return FrequencyCap(db, limit=limit, window=WINDOW)
+
+def test_count_sends():
+    windows = {'+1': [NOW - WINDOW, NOW - 10]}
+    # The send one window ago has slid out
+    assert count_sends(windows, ['+1', '+2'], 2, WINDOW, NOW) == ([], ['+1', '+2'])
+    assert windows == {'+1': [NOW - 10, NOW], '+2': [NOW]}
+    assert count_sends(windows, ['+1', '+2'], 2, WINDOW, NOW + 1) == (['+1'], ['+2'])
+    assert count_sends(windows, ['+1'], 2, WINDOW, NOW + 2, bypass=True) == ([], ['+1'])
+    assert windows['+1'] == [NOW, NOW + 2]
+
+def test_caps_each_phone(db):
+    frequency_cap = cap(db)
+    assert frequency_cap.admit(['+1', '+2'], NOW) == (['+1', '+2'], [])
+    assert frequency_cap.admit(['+1'], NOW + 1) == (['+1'], [])
+    assert frequency_cap.admit(['+1', '+2'], NOW + 2) == (['+2'], ['+1'])
+    # A window after the first send, one slot is free again
+    assert frequency_cap.admit(['+1'], NOW + WINDOW) == (['+1'], [])
+    assert frequency_cap.admit(['+1'], NOW + WINDOW) == ([], ['+1'])
+
+def test_bypassing_sends_count(db):
+    frequency_cap = cap(db)
+    frequency_cap.record(['+1'], NOW)
+    frequency_cap.record(['+1'], NOW + 1)
+    assert frequency_cap.admit(['+1'], NOW + 2) == ([], ['+1'])
+
+def test_released_sends_are_uncounted(db):
+    frequency_cap = cap(db, limit=1)
+    frequency_cap.admit(['+1', '+2'], NOW)
+    frequency_cap.release(['+1'], NOW)
+    assert frequency_cap.admit(['+1', '+2'], NOW + 1) == (['+1'], ['+2'])
+
+def test_workers_share_the_count(tmp_path, monkeypatch):
+    monkeypatch.setattr(Config, 'DATA_DIR', str(tmp_path / 'empty'))
+    path = str(tmp_path / 'alatem.sqlite3')
+    worker_a, worker_b = cap(SQLiteBackend(path)), cap(SQLiteBackend(path))
+    assert worker_a.admit(['+1'], NOW) == (['+1'], [])
+    assert worker_b.admit(['+1'], NOW + 1) == (['+1'], [])
+    assert worker_a.admit(['+1'], NOW + 2) == ([], ['+1'])
+
+def test_dead_lettered_recipients_are_uncounted(tmp_path):
+    db = JSONBackend(str(tmp_path))
+    frequency_cap = FrequencyCap(db, limit=1, window=WINDOW)
+
+    def deliver(phone, encoded, lane, job_id):
+        if phone == '+1':
+            raise SMSDeliveryError("invalid number", retryable=False)
+
+    dispatcher = SMSDispatcher(deliver, db=db, workers=1, reserved_workers=0, frequency_cap=frequency_cap)
+    job = dispatcher.submit_broadcast(['+1', '+2'], analyze("Test alert"))
+    done = threading.Event()
+    job.add_done_callback(lambda _: done.set())
+    assert done.wait(5)
+
+    again = dispatcher.submit_broadcast(['+1', '+2'], analyze("Test alert"))
+    assert again.capped == ['+2']
@@ -0,0 +1,84 @@
+"""MongoBackend against mongomock (which has no $unionWith or time-series collections)"""
+from datetime import datetime, timedelta
+from unittest import mock
+
+import pytest
+
+from mongo_backend import MongoBackend
+
+mongomock = pytest.importorskip('mongomock')
+
+NOW = datetime.utcnow().replace(microsecond=0)
+
+@pytest.fixture
+def db():
+    with mock.patch('mongo_backend.MongoClient', mongomock.MongoClient):
+        return MongoBackend('mongodb://localhost', 'alatem_test')
+
+def round_trips(monkeypatch):
+    """Counting and aggregation calls from now on (mongomock's aggregate runs find itself)"""
+    calls = []
+    for method in ('aggregate', 'count_documents', 'estimated_document_count'):
+        original = getattr(mongomock.collection.Collection, method)
+
+        def spy(collection, *args, _method=method, _original=original, **kwargs):
+            calls.append((collection.name, _method))
+            return _original(collection, *args, **kwargs)
+        monkeypatch.setattr(mongomock.collection.Collection, method, spy)
+    return calls
+
+def test_stats_count_each_collection_once(db, monkeypatch):
+    for i in range(4):
+        db.save_user({'id': f'user-{i}', 'phone': f'+{i}', 'area': 'DELMAS', 'verified': i % 2 == 0, 'active': True})
+        db.save_health_report({'id': f'h-{i}', 'area': 'DELMAS', 'condition': 'cholera', 'cases': 1,
+                               'timestamp': NOW - timedelta(hours=20 * i)})
+    db.save_alerts([{'id': 'a-1', 'area': 'DELMAS', 'timestamp': NOW - timedelta(days=3)}])
+    db.get_stats()  # finds out there is no $unionWith
+
+    calls = round_trips(monkeypatch)
+    stats = db.get_stats()
+    assert (stats['users'], stats['staff']) == ({'total': 4, 'verified': 2, 'active': 4}, {'total': 0, 'active': 0})
+    assert stats['reports'] == {'health_reports': 4, 'crime_reports': 0, 'alerts_sent': 1, 'predictions': 0}
+    assert stats['recent_activity'] == {'health_reports_24h': 2, 'crime_reports_24h': 0,
+                                        'alerts_sent_24h': 0, 'predictions_24h': 0}
+    # One aggregation per collection, totals included
+    assert sorted(calls) == sorted((name, 'aggregate') for name in (
+        'users', 'staff_users', 'health_reports', 'crime_reports', 'sent_alerts', 'predictions'
+    ))
+
+def test_stats_pipeline_is_one_round_trip(db):
+    with mock.patch.object(db, 'users') as users:
+        users.aggregate.return_value = iter([
+            {'_id': 'users', 'total': 3, 'verified': 2, 'active': 3},
+            {'_id': 'health_reports', 'total': 7, 'recent': 1}
+        ])
+        stats = db.get_stats()
+    assert users.aggregate.call_count == 1
+    assert stats['users'] == {'total': 3, 'verified': 2, 'active': 3}
+    assert (stats['reports']['health_reports'], stats['recent_activity']['health_reports_24h']) == (7, 1)
+    assert stats['reports']['predictions'] == 0
+
+def test_plain_report_collections_match_both_shapes():
+    client = mongomock.MongoClient()
+    # Saved before time-series support: series fields at the top level
+    client.alatem_test.health_reports.insert_many([
+        {'id': 'old-1', 'area': 'DELMAS', 'condition': 'cholera', 'cases': 3, 'timestamp': NOW - timedelta(days=1)},
+        {'id': 'old-2', 'area': 'DELMAS', 'condition': 'dengue', 'cases': 1, 'timestamp': NOW - timedelta(days=1)}
+    ])
+    client.alatem_test.crime_reports.insert_one({'id': 'old-3', 'area': 'DELMAS', 'timestamp': NOW})
+    # mongomock has no Collection.options(); a real server reports no 'timeseries' for these
+    with mock.patch('mongo_backend.MongoClient', lambda uri: client), \
+            mock.patch.object(mongomock.collection.Collection, 'options', create=True, return_value={}):
+        db = MongoBackend('mongodb://localhost', 'alatem_test')
+    assert db._plain_reports == {'health_reports', 'crime_reports'}
+    db.save_health_report({'id': 'new-1', 'area': 'DELMAS', 'condition': 'cholera', 'cases': 2, 'timestamp': NOW})
+    db.save_crime_report({'id': 'new-2', 'area': 'DELMAS', 'timestamp': NOW})
+
+    since = NOW - timedelta(days=7)
+    reports = db.get_recent_health_reports('DELMAS', 'cholera', since)
+    assert sorted((r['id'], r['area'], r['condition']) for r in reports) == [
+        ('new-1', 'DELMAS', 'cholera'), ('old-1', 'DELMAS', 'cholera')
+    ]
+    assert db.get_recent_crime_reports('DELMAS', since) == 2
+    assert sum(day['count'] for day in db.get_daily_health_report_counts('DELMAS', 'cholera', since)) == 2
+    assert db.get_recent_crime_reports('CARREFOUR', since) == 0
@@ -0,0 +1,96 @@
+from datetime import datetime, timedelta
+from types import SimpleNamespace
+
+import pytest
+
+import otp_store
+from auth import AuthService
+from config import Config
+from otp_store import MemoryOTPStore, MongoOTPStore, SQLiteOTPStore
+
+class Clock:
+    """Stands in for time.time() and datetime.utcnow() in otp_store"""
+
+    def __init__(self):
+        self.offset = 0.0
+
+    def advance(self, seconds):
+        self.offset += seconds
+
+    def time(self):
+        return 1_700_000_000.0 + self.offset
+
+    def utcnow(self):
+        return datetime(2026, 1, 1) + timedelta(seconds=self.offset)
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(otp_store.time, 'time', clock.time)
+    monkeypatch.setattr(otp_store, 'datetime', SimpleNamespace(utcnow=clock.utcnow))
+    return clock
+
+@pytest.fixture(params=['memory', 'sqlite', 'mongo'])
+def store(request, tmp_path, clock):
+    if request.param == 'memory':
+        return MemoryOTPStore()
+    if request.param == 'sqlite':
+        return SQLiteOTPStore(str(tmp_path / 'otp.sqlite3'))
+    mongomock = pytest.importorskip('mongomock')
+    return MongoOTPStore(mongomock.MongoClient().db.otps)
+
+def test_fresh_otp(store):
+    store.put('+1', 123456, 300)
+    assert store.get('+1') == {'otp': '123456', 'attempts': 0, 'expired': False}
+    assert store.get('+2') is None
+
+def test_expires_after_ttl(store, clock):
+    store.put('+1', 123456, 300)
+    clock.advance(299)
+    assert not store.get('+1')['expired']
+    clock.advance(1)
+    assert store.get('+1')['expired']
+
+def test_purge_removes_only_expired(store, clock):
+    store.put('+1', 111111, 60)
+    store.put('+2', 222222, 600)
+    clock.advance(120)
+    assert store.purge_expired() == 1
+    assert store.get('+1') is None
+    assert store.get('+2')['otp'] == '222222'
+    assert len(store) == 1
+
+def test_new_otp_replaces_the_old_one(store, clock):
+    store.put('+1', 111111, 60)
+    store.add_attempt('+1')
+    clock.advance(30)
+    store.put('+1', 222222, 300)
+    clock.advance(60)
+    # The first OTP's expiry must not take the replacement with it
+    store.purge_expired()
+    assert store.get('+1') == {'otp': '222222', 'attempts': 0, 'expired': False}
+
+def test_attempts_and_delete(store):
+    store.put('+1', 123456, 300)
+    assert [store.add_attempt('+1') for _ in range(3)] == [1, 2, 3]
+    assert store.add_attempt('+2') == 0
+    store.delete('+1')
+    assert store.get('+1') is None
+
+def test_writes_purge_expired_otps(clock):
+    store = MemoryOTPStore()
+    store.put('+1', 111111, 60)
+    clock.advance(61)
+    store.put('+2', 222222, 60)
+    assert len(store) == 1
+
+def test_verify_otp_rejects_and_drops_expired_codes(clock, monkeypatch):
+    monkeypatch.setattr(Config, 'OTP_STORE', 'memory')
+    auth = AuthService(SimpleNamespace(use_mongodb=False))
+    auth.store_otp('+1', 123456, expires_minutes=5)
+    auth.store_otp('+2', 654321, expires_minutes=5)
+    clock.advance(5 * 60 - 1)
+    assert auth.verify_otp('+1', '123456') == (True, "OTP verified successfully")
+    clock.advance(1)
+    assert auth.verify_otp('+2', '654321') == (False, "OTP has expired")
+    assert auth.verify_otp('+2', '654321') == (False, "No OTP found for this phone number")
@@ -0,0 +1,114 @@
+import pytest
+
+import rate_limit
+from config import Config
+from rate_limit import MemoryCounterStore, RateLimiter, SQLiteCounterStore, parse_limit
+
+WINDOW = 60
+
+class Clock:
+    def __init__(self, now):
+        self.now = now
+
+    def __call__(self):
+        return self.now
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock(1_000_000 * WINDOW)  # at a bucket boundary
+    monkeypatch.setattr(rate_limit.time, 'time', clock)
+    monkeypatch.setattr(Config, 'RATE_LIMIT_ENABLED', True)
+    return clock
+
+def limiter(store=None, **rules):
+    return RateLimiter(store or MemoryCounterStore(), rules or {'ip': f'5/{WINDOW}'})
+
+def test_parse_limit():
+    assert parse_limit('20/60') == (20, 60.0)
+    assert parse_limit('20') == (20, 1.0)
+    assert parse_limit('') is None
+    assert parse_limit('0/60') is None
+
+def test_allows_up_to_the_limit(clock):
+    rl = limiter()
+    assert [rl.check('register', ip='a')[0] for _ in range(6)] == [True] * 5 + [False]
+    assert rl.check('register', ip='a')[1] == 'ip'
+    # Separate counters per subject and per endpoint
+    assert rl.check('register', ip='b')[0]
+    assert rl.check('login', ip='a')[0]
+
+def test_rejected_requests_are_not_counted(clock):
+    rl = limiter(ip=f'5/{WINDOW}', phone=f'2/{WINDOW}')
+    assert rl.check('register', ip='a', phone='1')[0]
+    assert rl.check('register', ip='a', phone='1')[0]
+    # Rejected by the phone window: the ip window must not count them
+    for _ in range(5):
+        assert rl.check('register', ip='a', phone='1')[:2] == (False, 'phone')
+    assert [rl.check('register', ip='a', phone=str(n))[0] for n in range(2, 6)] == [True, True, True, False]
+
+def test_scopes_without_a_subject_are_skipped(clock):
+    rl = limiter(ip=f'1/{WINDOW}', phone=f'1/{WINDOW}')
+    assert rl.check('register', ip='a')[0]
+    assert rl.check('register', phone='1')[0]
+
+def test_previous_bucket_counts_by_its_overlap(clock):
+    rl = limiter()
+    for _ in range(5):
+        rl.check('register', ip='a')
+    # A quarter into the next bucket 3/4 of the previous 5 still count: room for two (3.75 + 2 > 5)
+    clock.now += WINDOW * 1.25
+    assert [rl.check('register', ip='a')[0] for _ in range(3)] == [True, True, False]
+    # Halfway: 2.5 + 2, room for one more
+    clock.now += WINDOW * 0.25
+    assert [rl.check('register', ip='a')[0] for _ in range(2)] == [True, False]
+
+def test_disabled(clock, monkeypatch):
+    monkeypatch.setattr(Config, 'RATE_LIMIT_ENABLED', False)
+    rl = limiter(ip=f'1/{WINDOW}')
+    assert all(rl.check('register', ip='a')[0] for _ in range(10))
+
+def test_retry_after_a_full_bucket(clock):
+    rl = limiter()
+    clock.now += WINDOW / 2
+    for _ in range(5):
+        rl.check('register', ip='a')
+
+    allowed, _, retry_after = rl.check('register', ip='a')
+    assert not allowed
+    assert WINDOW / 2 < retry_after <= WINDOW / 2 + WINDOW
+    clock.now += WINDOW / 2 - 1
+    assert not rl.check('register', ip='a')[0]
+    clock.now += retry_after - (WINDOW / 2 - 1)
+    assert rl.check('register', ip='a')[0]
+
+@pytest.mark.parametrize('into_bucket', [0.12, 0.17])
+def test_retry_after_the_previous_bucket_slides_out(clock, into_bucket):
+    rl = limiter()
+    for _ in range(5):
+        rl.check('register', ip='a')
+    clock.now += WINDOW * 1.05
+    assert rl.check('register', ip='a')[0]
+    clock.now += WINDOW * (into_bucket - 0.05)
+
+    allowed, _, retry_after = rl.check('register', ip='a')
+    assert not allowed
+    start = clock.now
+    # Exact: a second earlier is still over the limit
+    clock.now = start + retry_after - 1
+    assert not rl.check('register', ip='a')[0]
+    clock.now = start + retry_after
+    assert rl.check('register', ip='a')[0]
+
+def test_retry_after_formula():
+    rl = limiter()
+    # 5 of 5 in the current bucket, 80% through it: 12s left, then 1/6 of the window
+    assert rl._retry_after(5, WINDOW, 5, 0, 0.8) == 22
+    # 2 now, 6 in the previous bucket, 15% in: the overlap must drop to 3/6 (21s away)
+    assert rl._retry_after(5, WINDOW, 2, 6, 0.15) == 21
+    assert rl._retry_after(5, WINDOW, 4, 10, 0.9999) == 1
+
+def test_shared_sqlite_counters(clock, tmp_path):
+    path = str(tmp_path / 'rate_limits.sqlite3')
+    worker_a, worker_b = limiter(SQLiteCounterStore(path)), limiter(SQLiteCounterStore(path))
+    results = [(worker_a if i % 2 else worker_b).check('register', ip='a')[0] for i in range(6)]
+    assert results == [True] * 5 + [False]
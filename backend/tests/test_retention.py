@@ -0,0 +1,72 @@
+import gzip
+import json
+import os
+from datetime import datetime, timedelta
+
+import pytest
+
+from config import Config
+from retention import RetentionEngine
+from sqlite_backend import SQLiteBackend
+
+NOW = datetime(2026, 6, 1, 3, 0)
+POLICIES = {'sent_alerts': {'raw_days': 30, 'rollup': True, 'archive': True}}
+EXPIRED_DAY = datetime(2026, 4, 1)
+
+@pytest.fixture
+def workers(tmp_path, monkeypatch):
+    """Two workers' engines on one SQLite file and archive directory"""
+    monkeypatch.setattr(Config, 'DATA_DIR', str(tmp_path / 'empty'))
+    path = str(tmp_path / 'alatem.sqlite3')
+    engines = [
+        RetentionEngine(SQLiteBackend(path), POLICIES, archive_dir=str(tmp_path / 'archive'), interval=3600)
+        for _ in range(2)
+    ]
+    engines[0].db.save_alerts([
+        {'id': f'alert-{i}', 'area': 'DELMAS', 'alert_type': 'health', 'recipients_count': 10,
+         'timestamp': (EXPIRED_DAY + timedelta(hours=i)).isoformat()}
+        for i in range(3)
+    ])
+    return engines
+
+def archived(engine):
+    with gzip.open(os.path.join(engine.archive_dir, 'sent_alerts', '2026-04-01.json.gz'), 'rt') as f:
+        return sorted(record['id'] for record in json.load(f))
+
+def test_one_worker_runs_per_interval(workers):
+    first, second = workers
+    assert first.run_once(NOW) == {'sent_alerts': 1}
+    assert second.run_once(NOW) is None
+    assert second.stats['skipped_runs'] == 1
+    # The holder renews its own lease
+    assert first.run_once(NOW) == {'sent_alerts': 0}
+
+def test_lapsed_lease_is_taken_over(workers):
+    first, second = workers
+    first.db.claim_retention_lease(first.owner, datetime.utcnow() - timedelta(seconds=1))
+    assert second.run_once(NOW) == {'sent_alerts': 1}
+    assert first.run_once(NOW) is None
+
+def test_overlapping_runs_keep_the_archive(workers, monkeypatch):
+    first, second = workers
+    oldest = first.db.get_oldest_timestamp
+
+    def second_finishes_the_day_first(collection):
+        stamp = oldest(collection)
+        if stamp is not None:
+            monkeypatch.setattr(first.db, 'get_oldest_timestamp', oldest)
+            second._apply(collection, POLICIES[collection], NOW)
+        return stamp
+    monkeypatch.setattr(first.db, 'get_oldest_timestamp', second_finishes_the_day_first)
+
+    # The first run finds the day already gone
+    first.run_once(NOW)
+    assert archived(first) == ['alert-0', 'alert-1', 'alert-2']
+    rollups = first.db.get_rollups('alert_rollups')
+    assert [(r['day'], r['alerts'], r['recipients']) for r in rollups] == [('2026-04-01', 3, 30)]
+
+def test_rerun_merges_into_the_archive(workers):
+    first, _ = workers
+    first._archive('sent_alerts', EXPIRED_DAY, [{'id': 'alert-0'}, {'id': 'already-deleted'}])
+    first.run_once(NOW)
+    assert archived(first) == ['alert-0', 'alert-1', 'alert-2', 'already-deleted']
@@ -0,0 +1,129 @@
+import gzip
+import json
+import os
+from datetime import datetime, timedelta
+
+import pytest
+
+from json_backend import open_segments
+from segment_store import UNDATED, SegmentStore
+
+START = datetime(2026, 3, 1, 12, 0)
+
+# Stores are created with compression off: append() runs maintain() against the real clock
+
+def record(i, days=0, hours=0):
+    return {'id': f'r-{i}', 'timestamp': (START + timedelta(days=days, hours=hours)).isoformat()}
+
+@pytest.fixture
+def store(tmp_path):
+    store = SegmentStore(str(tmp_path / 'sent_alerts'), compress_after_days=0)
+    # Three days, two records a day, plus one without a timestamp
+    store.append([record(i, days=i // 2, hours=i % 2) for i in range(6)] + [{'id': 'undated'}])
+    return store
+
+def reads(store, monkeypatch):
+    """Segment files opened by the store from now on"""
+    opened = []
+    read = store._read
+    monkeypatch.setattr(store, '_read', lambda entry: opened.append(entry['file']) or read(entry))
+    return opened
+
+def test_append_splits_records_by_day(store):
+    segments = store._manifest['segments']
+    assert sorted(segments) == ['2026-03-01', '2026-03-02', '2026-03-03', UNDATED]
+    assert segments['2026-03-02']['count'] == 2
+    assert segments['2026-03-02']['first'] == '2026-03-02T12:00:00'
+    assert segments['2026-03-02']['last'] == '2026-03-02T13:00:00'
+    assert sorted(os.listdir(store.directory)) == [
+        '2026-03-01.json', '2026-03-02.json', '2026-03-03.json', 'manifest.json', 'undated.json'
+    ]
+
+def test_append_rewrites_only_the_touched_segment(store, monkeypatch):
+    opened = reads(store, monkeypatch)
+    store.append([record(9, days=1, hours=5)])
+    assert opened == ['2026-03-02.json']
+    assert store._manifest['segments']['2026-03-02']['count'] == 3
+
+def test_manifest_survives_reopening(store):
+    reopened = SegmentStore(store.directory)
+    assert reopened._manifest == store._manifest
+    assert len(list(reopened.query())) == 7
+
+def test_query_reads_only_overlapping_segments(store, monkeypatch):
+    opened = reads(store, monkeypatch)
+    found = list(store.query(START + timedelta(days=1), START + timedelta(days=1, hours=1)))
+    assert [r['id'] for r in found] == ['r-2', 'r-3']
+    assert opened == ['2026-03-02.json']
+
+def test_query_across_segments(store):
+    found = list(store.query(since=START + timedelta(hours=1)))
+    assert [r['id'] for r in found] == ['r-1', 'r-2', 'r-3', 'r-4', 'r-5']
+    # Undated records only show up in unbounded scans
+    assert 'undated' in [r['id'] for r in store.query()]
+
+def test_latest_stops_once_it_has_enough(store, monkeypatch):
+    opened = reads(store, monkeypatch)
+    assert [r['id'] for r in store.latest(lambda r: True, 3)] == ['r-5', 'r-4', 'r-3']
+    assert opened == ['2026-03-03.json', '2026-03-02.json']
+
+def test_count_uses_the_manifest_for_whole_segments(store, monkeypatch):
+    opened = reads(store, monkeypatch)
+    assert store.count(START + timedelta(days=1)) == 4
+    assert opened == []
+    assert store.count(START + timedelta(days=1, hours=1)) == 3
+    assert opened == ['2026-03-02.json']
+    assert store.count() == 7
+
+def test_delete_between(store):
+    assert store.delete_between(START, START + timedelta(days=1, hours=1)) == 3
+    assert sorted(store._manifest['segments']) == ['2026-03-02', '2026-03-03', UNDATED]
+    assert not os.path.exists(os.path.join(store.directory, '2026-03-01.json'))
+    assert [r['id'] for r in store.query(since=START)] == ['r-3', 'r-4', 'r-5']
+
+def test_maintain_compresses_old_segments(tmp_path):
+    store = SegmentStore(str(tmp_path / 'health_reports'), compress_after_days=0)
+    store.append([record(i, days=i) for i in range(4)])
+    store.compress_after_days = 3
+
+    assert store.maintain(now=START + timedelta(days=4)) == (2, 0)
+    segments = store._manifest['segments']
+    assert [key for key in sorted(segments) if segments[key]['compressed']] == ['2026-03-01', '2026-03-02']
+    with gzip.open(os.path.join(store.directory, '2026-03-01.json.gz'), 'rt', encoding='utf-8') as f:
+        assert json.load(f) == [record(0)]
+    assert not os.path.exists(os.path.join(store.directory, '2026-03-01.json'))
+    assert [r['id'] for r in store.query()] == ['r-0', 'r-1', 'r-2', 'r-3']
+
+    # Appending to a compressed segment keeps it compressed
+    store.append([record(9, hours=3)])
+    assert segments['2026-03-01']['file'] == '2026-03-01.json.gz'
+    assert segments['2026-03-01']['count'] == 2
+
+def test_maintain_archives_segments_out_of_queries(tmp_path):
+    store = SegmentStore(str(tmp_path / 'crime_reports'), compress_after_days=0)
+    store.append([record(i, days=i) for i in range(4)])
+    store.compress_after_days, store.archive_after_days = 2, 4
+
+    assert store.maintain(now=START + timedelta(days=4)) == (2, 1)
+    assert sorted(store._manifest['archived']) == ['2026-03-01']
+    assert os.path.exists(os.path.join(store.directory, 'archive', '2026-03-01.json.gz'))
+    assert [r['id'] for r in store.query()] == ['r-1', 'r-2', 'r-3']
+    assert store.oldest() == '2026-03-02T12:00:00'
+
+def test_month_granularity(tmp_path):
+    store = SegmentStore(str(tmp_path / 'sent_alerts'), granularity='month')
+    store.append([record(0), record(1, days=40)])
+    assert sorted(store._manifest['segments']) == ['2026-03', '2026-04']
+
+def test_legacy_file_is_copied_once_and_kept(tmp_path):
+    legacy = tmp_path / 'sent_alerts.json'
+    legacy.write_text(json.dumps([record(0), record(1, days=1)]))
+    store = open_segments(str(tmp_path), 'sent_alerts')
+    assert [r['id'] for r in store.query()] == ['r-0', 'r-1']
+    # The seed file stays as it was, and reopening doesn't copy it again
+    assert json.loads(legacy.read_text()) == [record(0), record(1, days=1)]
+    assert [r['id'] for r in open_segments(str(tmp_path), 'sent_alerts').query()] == ['r-0', 'r-1']
+
+def test_empty_legacy_file_is_marked_copied(tmp_path):
+    (tmp_path / 'crime_reports.json').write_text('[]')
+    assert open_segments(str(tmp_path), 'crime_reports').exists
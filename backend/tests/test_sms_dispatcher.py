@@ -0,0 +1,184 @@
+import threading
+import time
+from datetime import datetime, timedelta
+
+from json_backend import JSONBackend
+from sms_dispatcher import RetryPolicy, SMSDispatcher
+from sms_encoding import analyze
+from sms_providers import SMSDeliveryError
+
+MESSAGE = analyze("Test alert")
+FAST_RETRY = RetryPolicy(max_attempts=3, base_delay=0.01, max_delay=0.01)
+
+class Provider:
+    """deliver() stand-in: fails each phone per its script, records the send order"""
+
+    def __init__(self, failures=None):
+        self.failures = dict(failures or {})
+        self.sent = []
+        self.attempts = {}
+        self.lock = threading.Lock()
+
+    def __call__(self, phone, encoded, lane, job_id):
+        with self.lock:
+            self.attempts[phone] = self.attempts.get(phone, 0) + 1
+            script = self.failures.get(phone)
+            if script:
+                error = script.pop(0) if isinstance(script, list) else script
+                raise error
+            self.sent.append((lane, phone))
+
+def wait_done(job, timeout=5):
+    """Wait until the job finished, including its record update"""
+    done = threading.Event()
+    job.add_done_callback(lambda _: done.set())
+    assert done.wait(timeout)
+
+def test_retries_transient_failures():
+    provider = Provider({'+1': [SMSDeliveryError("busy", retryable=True)]})
+    dispatcher = SMSDispatcher(provider, workers=1, reserved_workers=0, retry_policy=FAST_RETRY)
+    job = dispatcher.submit_broadcast(['+1', '+2'], MESSAGE)
+    wait_done(job)
+
+    assert job.status()['sent'] == 2
+    assert job.status()['retried'] == 1
+    assert provider.attempts['+1'] == 2
+
+def test_exhausted_retries_are_dead_lettered(tmp_path):
+    db = JSONBackend(str(tmp_path))
+    provider = Provider({'+1': SMSDeliveryError("down", retryable=True, status=503)})
+    dispatcher = SMSDispatcher(provider, db=db, workers=1, reserved_workers=0, retry_policy=FAST_RETRY)
+    job = dispatcher.submit_broadcast(['+1', '+2'], MESSAGE)
+    wait_done(job)
+
+    assert provider.attempts['+1'] == FAST_RETRY.max_attempts
+    dead = db.get_dead_letters(job.id)
+    assert [(d['phone'], d['status'], d['attempts'], d['status_code']) for d in dead] == [('+1', 'dead', 3, 503)]
+    assert db.get_sms_retries() == []
+    record = db.find_sms_job(job.id)
+    assert (record['status'], record['sent'], record['failed']) == ('completed', 1, 1)
+
+def test_permanent_failures_are_not_retried(tmp_path):
+    db = JSONBackend(str(tmp_path))
+    provider = Provider({'+1': SMSDeliveryError("invalid number", retryable=False)})
+    dispatcher = SMSDispatcher(provider, db=db, workers=1, reserved_workers=0, retry_policy=FAST_RETRY)
+    job = dispatcher.submit_broadcast(['+1'], MESSAGE)
+    wait_done(job)
+
+    assert provider.attempts['+1'] == 1
+    assert len(db.get_dead_letters(job.id, status='dead')) == 1
+
+def test_redrive_requeues_dead_letters(tmp_path):
+    db = JSONBackend(str(tmp_path))
+    provider = Provider({'+1': SMSDeliveryError("invalid", retryable=False),
+                         '+2': SMSDeliveryError("invalid", retryable=False)})
+    dispatcher = SMSDispatcher(provider, db=db, workers=1, reserved_workers=0, retry_policy=FAST_RETRY)
+    job = dispatcher.submit_broadcast(['+1', '+2', '+3'], MESSAGE)
+    wait_done(job)
+
+    provider.failures.clear()
+    retry = dispatcher.redrive(job.id)
+    wait_done(retry)
+
+    assert retry.status()['sent'] == 2
+    assert db.find_sms_job(retry.id)['parent_job_id'] == job.id
+    assert db.get_dead_letters(job.id, status='dead') == []
+    assert {d['redrive_job_id'] for d in db.get_dead_letters(job.id, status='redriven')} == {retry.id}
+    assert dispatcher.redrive(job.id) is None
+
+def test_concurrent_jobs_share_the_broadcast_lane():
+    # Hold the only worker on the big job's first message while the small job is queued
+    gate, in_flight = threading.Event(), threading.Event()
+    provider = Provider()
+
+    def deliver(phone, encoded, lane, job_id):
+        if phone == 'big-0':
+            in_flight.set()
+            gate.wait(5)
+        provider(phone, encoded, lane, job_id)
+
+    dispatcher = SMSDispatcher(deliver, workers=1, reserved_workers=0)
+    big = dispatcher.submit_broadcast([f'big-{i}' for i in range(20)], MESSAGE)
+    assert in_flight.wait(5)
+    small = dispatcher.submit_broadcast([f'small-{i}' for i in range(6)], MESSAGE, weight=2)
+    gate.set()
+    wait_done(big)
+    wait_done(small)
+
+    order = [phone for _, phone in provider.sent]
+    # Weight 2: two of the small job's messages per message of the big one
+    assert order[:10] == ['big-0', 'big-1', 'small-0', 'small-1', 'big-2', 'small-2', 'small-3',
+                          'big-3', 'small-4', 'small-5']
+
+def test_transactional_lane_goes_first():
+    gate, in_flight = threading.Event(), threading.Event()
+    provider = Provider()
+
+    def deliver(phone, encoded, lane, job_id):
+        if phone == 'b-0':
+            in_flight.set()
+            gate.wait(5)
+        provider(phone, encoded, lane, job_id)
+
+    dispatcher = SMSDispatcher(deliver, workers=1, reserved_workers=0)
+    job = dispatcher.submit_broadcast([f'b-{i}' for i in range(5)], MESSAGE)
+    assert in_flight.wait(5)
+    future = dispatcher.submit_transactional('otp', MESSAGE, timeout=5)
+    gate.set()
+
+    assert future.result(timeout=5) is True
+    wait_done(job)
+    assert provider.sent[:2] == [('broadcast', 'b-0'), ('transactional', 'otp')]
+
+def test_interrupted_job_is_closed_out(tmp_path):
+    db = JSONBackend(str(tmp_path))
+    gate, in_flight = threading.Event(), threading.Event()
+    provider = Provider()
+
+    def deliver(phone, encoded, lane, job_id):
+        if phone == 'p-2':
+            in_flight.set()
+            gate.wait(5)
+        provider(phone, encoded, lane, job_id)
+
+    stopped = SMSDispatcher(deliver, db=db, workers=1, reserved_workers=0)
+    job = stopped.submit_broadcast([f'p-{i}' for i in range(5)], MESSAGE)
+    assert in_flight.wait(5)
+    starting = SMSDispatcher(Provider(), db=db, workers=1, reserved_workers=0)
+    try:
+        # Still leased to a live process
+        assert starting.recover_interrupted() == []
+
+        # Its last checkpoint, then the lease runs out
+        db.renew_sms_leases(stopped.owner, datetime.utcnow() - timedelta(seconds=1), {job.id: job.progress()})
+        [record] = starting.recover_interrupted()
+        assert record['unsent'] == ['p-3', 'p-4']
+        assert starting.recover_interrupted() == []
+
+        closed = db.find_sms_job(job.id)
+        assert (closed['status'], closed['sent'], closed['failed'], closed['owner']) == ('interrupted', 2, 2, starting.owner)
+        assert sorted(d['phone'] for d in db.get_dead_letters(job.id, status='dead')) == ['p-3', 'p-4']
+    finally:
+        gate.set()
+
+def test_persisted_retries_are_recovered_once(tmp_path):
+    db = JSONBackend(str(tmp_path))
+    expired, held = datetime.utcnow() - timedelta(seconds=1), datetime.utcnow() + timedelta(minutes=2)
+    db.save_sms_job({'id': 'job-1', 'status': 'interrupted', 'sent': 3, 'failed': 0})
+    for phone, owner, lease in [('+1', 'stopped', expired), ('+2', 'stopped', expired), ('+3', 'live', held)]:
+        db.save_sms_retry({'id': f'job-1:{phone}', 'job_id': 'job-1', 'phone': phone, 'message': 'Test alert',
+                           'attempts': 1, 'owner': owner, 'lease_expires_at': lease.isoformat()})
+
+    # Two workers starting together
+    providers = [Provider(), Provider()]
+    dispatchers = [SMSDispatcher(provider, db=db, workers=1, reserved_workers=0) for provider in providers]
+    assert [dispatcher.recover() for dispatcher in dispatchers] == [2, 0]
+
+    deadline = time.monotonic() + 5
+    while db.find_sms_job('job-1')['status'] != 'completed' and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert sorted(phone for _, phone in providers[0].sent) == ['+1', '+2']
+    assert providers[1].sent == []
+    assert db.find_sms_job('job-1')['sent'] == 5
+    # The live process's retry stays with it
+    assert [r['phone'] for r in db.get_sms_retries()] == ['+3']
@@ -0,0 +1,43 @@
+import pytest
+
+from sms_encoding import analyze, compile_message, is_gsm7, message_variants, to_gsm7
+
+@pytest.mark.parametrize('length, segments', [(160, 1), (161, 2), (306, 2), (307, 3)])
+def test_gsm7_segments(length, segments):
+    encoded = analyze('a' * length)
+    assert (encoded.encoding, encoded.units, encoded.segments) == ('GSM-7', length, segments)
+
+@pytest.mark.parametrize('length, segments', [(70, 1), (71, 2), (134, 2), (135, 3)])
+def test_ucs2_segments(length, segments):
+    encoded = analyze('Ê' * length)
+    assert (encoded.encoding, encoded.units, encoded.segments) == ('UCS-2', length, segments)
+
+def test_extension_characters_cost_two_units():
+    assert analyze('€' * 80).units == 160
+    assert analyze('€' * 81).segments == 2
+
+def test_emoji_take_two_ucs2_units():
+    assert analyze('🚨').units == 2
+
+def test_creole_accents_in_gsm7_are_kept():
+    assert is_gsm7('Bwè dlo pwòp, lave men nou')
+    assert to_gsm7('Bwè dlo pwòp') == 'Bwè dlo pwòp'
+
+def test_to_gsm7_transliterates_and_drops_emoji():
+    assert to_gsm7('🚨 ALÈT SANTE 🚨 “Kolera” – DELMAS') == 'ALET SANTE "Kolera" - DELMAS'
+    assert to_gsm7('Ŋ') == '?'
+
+def test_compile_message():
+    text = '🚨 ALÈT SANTE: ' + 'x' * 100
+    unicode_message = compile_message(text, encoding='unicode')
+    gsm7_message = compile_message(text, encoding='gsm7')
+    assert (unicode_message.encoding, unicode_message.segments, unicode_message.transliterated) == ('UCS-2', 2, False)
+    assert (gsm7_message.encoding, gsm7_message.segments, gsm7_message.transliterated) == ('GSM-7', 1, True)
+    # Already GSM-7: sent unchanged
+    assert compile_message('Plain text', encoding='gsm7').transliterated is False
+
+def test_message_variants():
+    variants = message_variants('ALÈT: ' + 'x' * 80)
+    assert (variants['unicode']['encoding'], variants['unicode']['segments']) == ('UCS-2', 2)
+    assert (variants['gsm7']['encoding'], variants['gsm7']['segments']) == ('GSM-7', 1)
+    assert variants['gsm7']['text'] == 'ALET: ' + 'x' * 80
@@ -0,0 +1,24 @@
+import logging
+
+import sms_providers
+import sms_service
+from sms_dispatcher import BROADCAST, TRANSACTIONAL
+from sms_service import SMSService
+
+def test_mock_sms_bodies_go_through_the_callers_logger(monkeypatch):
+    logged = []
+    record = lambda logger, level, message, **fields: logged.append((logger.name, level, message, 'body' in fields))
+    monkeypatch.setattr(sms_service, 'log_event', record)
+    monkeypatch.setattr(sms_providers, 'log_event', record)
+    sms = SMSService()
+    encoded = sms.compile_message("ALET SANTE")
+
+    sms._deliver('+1', encoded, BROADCAST, 'job-1')
+    sms._deliver('+2', encoded, TRANSACTIONAL)
+    assert logged == [
+        ('alatem.sms.providers', logging.DEBUG, "MOCK SMS", False),
+        # Broadcasts: the sampled per-recipient logger
+        ('alatem.sms.recipient', logging.INFO, "MOCK SMS", True),
+        ('alatem.sms.providers', logging.DEBUG, "MOCK SMS", False),
+        ('alatem.sms', logging.INFO, "MOCK SMS", True)
+    ]
@@ -0,0 +1,167 @@
+"""SQLiteBackend answers every query the way the JSON backend does"""
+from datetime import datetime, timedelta
+
+import pytest
+
+from config import Config
+from json_backend import JSONBackend
+from sqlite_backend import SQLiteBackend
+
+NOW = datetime.utcnow().replace(microsecond=0)
+AREAS = ['DELMAS', 'PETION-VILLE', 'CARREFOUR']
+
+def seed(db):
+    for i in range(30):
+        db.save_user({
+            'id': f'user-{i}', 'name': f'User {i}', 'phone': f'+509300000{i:02d}', 'area': AREAS[i % 3],
+            'verified': i % 4 != 0, 'active': i % 7 != 0, 'created_at': (NOW - timedelta(days=i)).isoformat()
+        })
+    db.update_user_verified('+50930000000')
+    db.save_staff_user({'id': 'staff-1', 'username': 'nurse', 'full_name': 'Nurse', 'role': 'health_worker',
+                        'is_active': True, 'last_login': None})
+    db.save_staff_user({'id': 'staff-2', 'username': 'former', 'full_name': 'Former', 'role': 'health_worker',
+                        'is_active': False, 'last_login': None})
+    for i in range(40):
+        stamp = NOW - timedelta(hours=7 * i)
+        db.save_health_report({'id': f'h-{i}', 'area': AREAS[i % 3], 'condition': ['cholera', 'dengue'][i % 2],
+                               'cases': i, 'timestamp': stamp.isoformat()})
+        db.save_crime_report({'id': f'c-{i}', 'area': AREAS[i % 3], 'crime_type': 'theft',
+                              'timestamp': stamp.isoformat()})
+    db.save_alerts([
+        {'id': f'a-{i}', 'area': AREAS[i % 3], 'alert_type': ['health_outbreak', 'safety_alert'][i % 2],
+         'message': f'Alert {i}', 'recipients_count': i, 'timestamp': (NOW - timedelta(hours=5 * i)).isoformat()}
+        for i in range(25)
+    ])
+    for i in range(12):
+        db.save_prediction({'area': AREAS[i % 3], 'date': f'2026-01-{i + 1:02d}', 'type': 'health',
+                            'condition': 'cholera', 'risk': i / 12, 'timestamp': (NOW - timedelta(days=i)).isoformat()})
+    # Replaces the prediction with the same area/date/type/condition
+    db.save_prediction({'area': 'DELMAS', 'date': '2026-01-01', 'type': 'health', 'condition': 'cholera',
+                        'risk': 0.99, 'timestamp': NOW.isoformat()})
+
+@pytest.fixture
+def backends(tmp_path, monkeypatch):
+    # SQLiteBackend imports DATA_DIR's JSON files on first run; keep it away from real data
+    monkeypatch.setattr(Config, 'DATA_DIR', str(tmp_path / 'empty'))
+    json_db = JSONBackend(str(tmp_path / 'json'))
+    sqlite_db = SQLiteBackend(str(tmp_path / 'alatem.sqlite3'))
+    for db in (json_db, sqlite_db):
+        seed(db)
+    return json_db, sqlite_db
+
+def by_id(records):
+    return sorted(records, key=lambda r: r.get('id') or r.get('phone'))
+
+@pytest.mark.parametrize('query', [
+    lambda db: db.find_user_by_phone('+50930000003'),
+    lambda db: db.find_user_by_phone('+50900000000'),
+    lambda db: by_id(db.get_users_by_area('DELMAS')),
+    lambda db: by_id(db.get_users_by_area('DELMAS', verified_only=False)),
+    lambda db: by_id(db.get_users_by_areas(['DELMAS', 'CARREFOUR'])),
+    lambda db: sorted(db.get_area_stats(), key=lambda s: s['_id']),
+    lambda db: db.find_staff_user('nurse'),
+    lambda db: db.find_staff_user('former'),
+    lambda db: by_id(db.get_recent_health_reports('DELMAS', 'cholera', NOW - timedelta(days=5))),
+    lambda db: db.get_recent_crime_reports('PETION-VILLE', NOW - timedelta(days=3)),
+    lambda db: db.get_daily_health_report_counts('DELMAS', 'cholera', NOW - timedelta(days=10)),
+    lambda db: db.get_daily_crime_report_counts('CARREFOUR', NOW - timedelta(days=10)),
+    lambda db: db.get_alerts_history('DELMAS'),
+    lambda db: db.get_alerts_history('DELMAS', limit=3, alert_type='safety_alert'),
+    lambda db: db.get_recent_alerts(hours=24),
+    lambda db: db.get_recent_alerts(hours=48, area='CARREFOUR'),
+    lambda db: db.get_latest_predictions(),
+    lambda db: db.get_latest_predictions(area='DELMAS', limit=2),
+    lambda db: db.get_stats(),
+], ids=[
+    'user', 'missing-user', 'users-by-area', 'users-by-area-all', 'users-by-areas', 'area-stats', 'staff',
+    'inactive-staff', 'health-reports', 'crime-report-count', 'daily-health', 'daily-crime', 'alerts-history',
+    'alerts-history-filtered', 'recent-alerts', 'recent-alerts-area', 'predictions', 'predictions-area', 'stats'
+])
+def test_queries_match(backends, query):
+    json_db, sqlite_db = backends
+    assert query(sqlite_db) == query(json_db)
+
+def test_sms_records_match(backends):
+    results = []
+    for db in backends:
+        db.save_sms_job({'id': 'job-1', 'total': 3, 'sent': 0, 'failed': 0, 'status': 'running'})
+        db.update_sms_job('job-1', {'status': 'completed'}, {'sent': 2, 'failed': 1})
+        db.save_dead_letter({'id': 'd-1', 'job_id': 'job-1', 'phone': '+1', 'status': 'dead',
+                             'failed_at': NOW.isoformat()})
+        db.save_dead_letter({'id': 'd-2', 'job_id': 'job-1', 'phone': '+2', 'status': 'dead',
+                             'failed_at': NOW.isoformat()})
+        db.update_dead_letters(['d-1'], {'status': 'redriven'})
+        db.save_sms_retry({'id': 'job-1:+3', 'job_id': 'job-1', 'phone': '+3', 'attempts': 1})
+        results.append((
+            db.find_sms_job('job-1'),
+            by_id(db.get_dead_letters('job-1')),
+            db.get_dead_letters('job-1', status='dead'),
+            db.get_sms_retries()
+        ))
+    assert results[0] == results[1]
+
+def test_sms_job_leases_match(backends):
+    results = []
+    for db in backends:
+        expired, held = NOW - timedelta(minutes=1), NOW + timedelta(minutes=5)
+        db.save_sms_job({'id': 'live', 'status': 'running', 'owner': 'a', 'lease_expires_at': held.isoformat()})
+        db.save_sms_job({'id': 'stale', 'status': 'running', 'owner': 'b', 'lease_expires_at': expired.isoformat()})
+        db.save_sms_job({'id': 'unleased', 'status': 'running'})
+        db.save_sms_job({'id': 'done', 'status': 'completed', 'lease_expires_at': None})
+        # Only the owner's own jobs are renewed
+        db.renew_sms_leases('a', held, {'live': {'dispatched': 3}, 'stale': {'dispatched': 9}})
+        claimed = sorted(job['id'] for job in db.claim_interrupted_sms_jobs('c', held))
+        stale = db.find_sms_job('stale')
+        results.append((claimed, db.find_sms_job('live')['dispatched'], stale.get('dispatched'), stale['owner'],
+                        db.claim_interrupted_sms_jobs('d', held)))
+    assert results[0] == results[1] == (['stale', 'unleased'], 3, None, 'c', [])
+
+def test_sms_retry_leases_match(backends):
+    results = []
+    for db in backends:
+        expired, held = NOW - timedelta(minutes=1), NOW + timedelta(minutes=5)
+        db.save_sms_retry({'id': 'j:+1', 'phone': '+1', 'owner': 'a', 'lease_expires_at': expired.isoformat()})
+        db.save_sms_retry({'id': 'j:+2', 'phone': '+2', 'owner': 'b', 'lease_expires_at': expired.isoformat()})
+        db.save_sms_retry({'id': 'j:+3', 'phone': '+3'})
+        # 'a' is alive: renewing keeps its retry
+        db.renew_sms_leases('a', held, {})
+        claimed = sorted(retry['phone'] for retry in db.claim_sms_retries('c', held))
+        owners = {retry['phone']: retry['owner'] for retry in db.get_sms_retries()}
+        results.append((claimed, owners, db.claim_sms_retries('d', held)))
+    assert results[0] == results[1] == (['+2', '+3'], {'+1': 'a', '+2': 'c', '+3': 'c'}, [])
+
+def test_retention_leases_match(backends):
+    results = []
+    for db in backends:
+        held = NOW + timedelta(hours=1)
+        claims = [db.claim_retention_lease('a', held), db.claim_retention_lease('b', held),
+                  db.claim_retention_lease('a', held)]
+        # A lapsed lease goes to whoever asks next
+        db.claim_retention_lease('a', NOW - timedelta(minutes=1))
+        claims += [db.claim_retention_lease('b', held), db.claim_retention_lease('a', held)]
+        results.append(claims)
+    assert results[0] == results[1] == [True, False, True, True, False]
+
+def test_broadcast_keys_match(backends):
+    results = []
+    for db in backends:
+        expires_at = NOW + timedelta(hours=1)
+        first = db.claim_broadcast_key('k', {'job_id': 'j-1', 'status': 'in_progress'}, expires_at)
+        held = db.claim_broadcast_key('k', {'job_id': 'j-2', 'status': 'in_progress'}, expires_at)
+        db.release_broadcast_key('k', job_id='j-2')
+        still_held = db.find_broadcast_key('k')
+        db.complete_broadcast_key('k', {'status': 'completed'})
+        completed = db.find_broadcast_key('k')
+        db.release_broadcast_key('k')
+        results.append((first, held['job_id'], still_held['job_id'], completed['status'], db.find_broadcast_key('k')))
+    assert results[0] == results[1] == (None, 'j-1', 'j-1', 'completed', None)
+
+def test_first_run_imports_json_data(tmp_path, monkeypatch):
+    monkeypatch.setattr(Config, 'DATA_DIR', str(tmp_path / 'data'))
+    json_db = JSONBackend()
+    seed(json_db)
+    sqlite_db = SQLiteBackend(str(tmp_path / 'alatem.sqlite3'))
+    assert sqlite_db.get_stats() == json_db.get_stats()
+    assert sqlite_db.get_alerts_history('DELMAS') == json_db.get_alerts_history('DELMAS')
+    # Opening the existing file again imports nothing more
+    assert SQLiteBackend(str(tmp_path / 'alatem.sqlite3')).get_stats() == json_db.get_stats()
@@ -4,6 +4,7 @@ Utility functions for the Alatem backend
 import uuid
 import re
 import json
+import logging
 from datetime import datetime, timedelta
 from typing import Dict, List, Optional, Tuple
 
@@ -253,24 +254,17 @@ def create_response(success: bool, data: dict = None, error: str = None, status_
 
 def log_activity(activity_type: str, details: dict, user_id: str = None):
     """
-    Log system activity (placeholder for future logging system)
+    Log system activity through the structured (queued) logger
     
     Args:
         activity_type: Type of activity (registration, alert, prediction, etc.)
         details: Activity details
         user_id: User who performed the activity
     """
-    # In a production system, this would write to a proper logging system
-    timestamp = datetime.utcnow().isoformat()
-    log_entry = {
-        'timestamp': timestamp,
-        'activity_type': activity_type,
-        'user_id': user_id,
-        'details': details
-    }
+    from structured_logging import get_logger, log_event
     
-    # For now, just print to console
-    print(f"[{timestamp}] {activity_type}: {json.dumps(details, default=str)}")
+    log_event(get_logger('activity'), logging.INFO, activity_type,
+              activity_type=activity_type, user_id=user_id, details=details)
 
 def get_risk_color(risk_level: str) -> str:
     """